@@ -0,0 +1,91 @@
+"""Archivo de rides terminados: save_data, arranque y memoria con todo en memoria vs con los done archivados.
+
+El dataset simula un historial largo: la mayoria de los rides ya termino
+(LIFETIME_MIX) y solo una fraccion sigue activa. Se mide el mismo data.json
+antes y despues de archive_done_rides.
+
+Uso: python -m benchmarks.bench_archive [rides]
+"""
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.datagen import empty_handler, populate
+from src.data_handler import DataHandler
+from src.models.ride import Ride
+from src.storage.archive import RideArchive
+
+LIFETIME_MIX = (("ready", 0.05), ("inprogress", 0.05), ("done", 0.9))
+NOW = Ride.timestamp(datetime(2025, 9, 1))
+
+
+def _open(filename, archive_dir):
+    return DataHandler(filename=filename, archive=RideArchive(archive_dir) if archive_dir else None)
+
+
+def _measure(filename, archive_dir):
+    start = time.perf_counter()
+    handler = _open(filename, archive_dir)
+    load_s = time.perf_counter() - start
+    saves = []
+    for _ in range(3):
+        start = time.perf_counter()
+        handler.save_data()
+        saves.append(time.perf_counter() - start)
+    in_memory = len(handler.rides)
+    handler.close()
+
+    del handler
+    gc.collect()
+    tracemalloc.start()
+    handler = _open(filename, archive_dir)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    handler.close()
+    return in_memory, load_s, min(saves), memory, os.path.getsize(filename)
+
+
+def main(n_rides=200_000):
+    directory = tempfile.mkdtemp(prefix='rides-archive-')
+    filename = os.path.join(directory, 'data.json')
+    archive_dir = os.path.join(directory, 'archive')
+    handler = populate(empty_handler(directory), max(n_rides // 10, 10), n_rides, participants_per_ride=3,
+                       status_mix=LIFETIME_MIX)
+    handler.save_data()
+    handler.close()
+
+    print(f"{n_rides} rides ({LIFETIME_MIX[2][1]:.0%} done)")
+    print(f"{'modo':>10} {'en memoria':>11} {'carga s':>8} {'save ms':>8} {'memoria MB':>11} {'data.json MB':>13}")
+    rows = [("todo", _measure(filename, None))]
+
+    handler = _open(filename, archive_dir)
+    handler.archive_after_s = 0
+    start = time.perf_counter()
+    archived = handler.archive_done_rides(now=NOW)
+    archive_s = time.perf_counter() - start
+    handler.close()
+    rows.append(("archivado", _measure(filename, archive_dir)))
+
+    for label, (in_memory, load_s, save_s, memory, size) in rows:
+        print(f"{label:>10} {in_memory:>11} {load_s:>8.2f} {save_s * 1000:>8.0f} {memory / 2**20:>11.1f} "
+              f"{size / 2**20:>13.1f}")
+    archive_bytes = sum(os.path.getsize(os.path.join(archive_dir, name)) for name in os.listdir(archive_dir))
+    print(f"archivar {archived} rides: {archive_s:.2f} s, {archive_bytes / 2**20:.1f} MB en disco")
+
+    handler = _open(filename, archive_dir)
+    ride_ids = [ride_id for ride_id in range(1, n_rides + 1) if handler._rides_by_id.get(ride_id) is None][:2000]
+    start = time.perf_counter()
+    for ride_id in ride_ids:
+        handler.get_ride(ride_id)
+    print(f"get_ride de un ride archivado (sin cache): {(time.perf_counter() - start) / len(ride_ids) * 1e6:.0f} us")
+    handler.close()
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,143 @@
+"""Prueba de carga: servidor de desarrollo de Flask (threaded) vs modo async (python -m src.asgi).
+
+Cada servidor corre en su propio proceso sobre una copia del mismo data.json. Un
+cliente asyncio abre concurrency conexiones keep-alive y durante duration
+segundos cada una repite: 90% GET /usuarios/<alias>/rides/<id> y 10% POST
+/usuarios (una mutacion que se persiste antes de responder en ambos modos).
+
+Uso: python -m benchmarks.bench_async [clientes] [segundos] [rides]
+"""
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import empty_handler, populate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVERS = {
+    "flask": "from src.controller import app; app.run(host='127.0.0.1', port={port}, threaded=True)",
+    "async": "from src.asgi import main; main(['--port', '{port}'])",
+}
+REQUEST_TIMEOUT = 30
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("El servidor termino antes de aceptar conexiones")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("El servidor no acepto conexiones a tiempo")
+
+
+async def _read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in header_lines:
+        if line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip().lower()
+    if headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get("content-length", 0)))
+    close = headers.get("connection") == "close" or status_line.startswith("HTTP/1.0")
+    return int(status_line.split(" ", 2)[1]), close
+
+
+async def _client(port, requests, deadline, latencies, counters, client_id):
+    rng = random.Random(client_id)
+    reader = writer = None
+    sequence = 0
+    while time.monotonic() < deadline:
+        if rng.random() < 0.1:
+            sequence += 1
+            body = json.dumps({"alias": f"load{client_id}-{sequence}", "name": "Load"}).encode()
+            request = (b"POST /usuarios HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                       b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+        else:
+            request = rng.choice(requests)
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), REQUEST_TIMEOUT)
+            writer.write(request)
+            status, close = await asyncio.wait_for(_read_response(reader), REQUEST_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            counters["errors"] += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status >= 500:
+            counters["errors"] += 1
+        if close:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _load(port, requests, concurrency, duration):
+    latencies = []
+    counters = {"errors": 0}
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(_client(port, requests, deadline, latencies, counters, client_id)
+                           for client_id in range(concurrency)))
+    return latencies, counters["errors"]
+
+
+def main(concurrency=1_000, duration=20, n_rides=5_000):
+    source = tempfile.mkdtemp(prefix='rides-load-')
+    handler = populate(empty_handler(source), max(n_rides // 10, 10), n_rides, participants_per_ride=2)
+    handler.save_data()
+    requests = [f"GET /usuarios/{ride.driver.alias}/rides/{ride.id} HTTP/1.1\r\nHost: bench\r\n\r\n".encode()
+                for ride in random.Random(0).sample(handler.rides, min(1000, n_rides))]
+    handler.close()
+
+    print(f"{concurrency} clientes, {duration} s, {n_rides} rides (10% POST /usuarios)")
+    print(f"{'servidor':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errores':>8}")
+    for name, command in SERVERS.items():
+        directory = tempfile.mkdtemp(prefix=f'rides-load-{name}-')
+        shutil.copy(os.path.join(source, 'data.json'), directory)
+        port = _free_port()
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        process = subprocess.Popen([sys.executable, '-c', command.format(port=port)], cwd=directory, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_for_port(port, process)
+            latencies, errors = asyncio.run(_load(port, requests, concurrency, duration))
+        finally:
+            process.terminate()
+            process.wait()
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] if latencies else float('nan')
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else float('nan')
+        print(f"{name:>8} {len(latencies) / duration:>9.0f} {p50 * 1000:>9.1f} {p99 * 1000:>9.1f} {errors:>8}")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:4]))
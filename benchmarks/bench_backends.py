@@ -0,0 +1,79 @@
+"""Latencia de escritura y memoria por backend: data.json, data.json + WAL y SQLite.
+
+Cada operacion crea un usuario y un ride y hace join + accept (4 mutaciones).
+La memoria es la que queda retenida tras abrir el handler.
+
+Uso: python -m benchmarks.bench_backends [participaciones] [operaciones]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.datagen import empty_handler, populate
+from src.data_handler import DataHandler
+from src.sqlite_data_handler import SqliteDataHandler
+from src.storage import sqlite_store
+from src.storage.wal import WriteAheadLog
+
+PARTICIPANTS_PER_RIDE = 4
+
+
+def _open(factory):
+    tracemalloc.start()
+    handler = factory()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return handler, memory
+
+
+def _latencies(handler, n_ops, prefix):
+    driver = handler.get_user("user0")
+    latencies = []
+
+    def timed(mutation, *args):
+        start = time.perf_counter()
+        result = mutation(*args)
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    for i in range(n_ops):
+        rider = timed(handler.add_user, f"{prefix}{i}", f"Bench {i}")
+        ride = timed(handler.add_ride, "2025/09/01 08:00", "Destino bench", 2, driver)
+        timed(handler.join_ride, ride, rider, "Miraflores")
+        timed(handler.accept_participant, ride, rider)
+    return latencies
+
+
+def main(n_participations=1_000_000, n_ops=500):
+    n_rides = n_participations // PARTICIPANTS_PER_RIDE
+    n_users = max(n_rides // 10, 10)
+    source = populate(empty_handler(), n_users, n_rides, participants_per_ride=PARTICIPANTS_PER_RIDE)
+    total = sum(len(ride.participants) for ride in source.rides)
+    with tempfile.TemporaryDirectory() as directory:
+        json_file = os.path.join(directory, 'data.json')
+        db_file = os.path.join(directory, 'data.db')
+        source.filename = json_file
+        source.save_data()
+        sqlite_store.write_from_handler(source, db_file)
+        del source
+
+        print(f"dataset: {n_users} usuarios, {n_rides} rides, {total} participaciones")
+        print(f"{'backend':>10} {'ops':>5} {'MB':>8} {'p50 ms':>9} {'p99 ms':>9}")
+        # Rewriting data.json on every mutation takes seconds at this size, so it gets fewer operations
+        backends = (("json", lambda: DataHandler(json_file), min(n_ops, 5)),
+                    ("json+wal", lambda: DataHandler(json_file, wal=WriteAheadLog(json_file + '.wal')), n_ops),
+                    ("sqlite", lambda: SqliteDataHandler(db_file), n_ops))
+        for label, factory, ops in backends:
+            handler, memory = _open(factory)
+            latencies = sorted(_latencies(handler, ops, prefix=label))
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"{label:>10} {ops:>5} {memory / 1e6:>8.1f} {statistics.median(latencies) * 1000:>9.3f} "
+                  f"{p99 * 1000:>9.3f}")
+            handler.close()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,52 @@
+"""Aceptar a los pasajeros de un shuttle: una llamada por pasajero vs un solo POST .../batch.
+
+Se usa la persistencia por defecto (cada mutacion reescribe data.json) sobre un
+dataset de fondo, que es donde mas pesa persistir una vez por lote.
+
+Uso: python -m benchmarks.bench_batch [pasajeros] [rides de fondo]
+"""
+import sys
+import time
+
+from benchmarks.datagen import empty_handler, populate
+from src import controller
+
+
+def _shuttle(handler, driver, riders):
+    ride = handler._create_ride("2025/09/01 07:00", "Campus", len(riders), driver)
+    for rider in riders:
+        ride.add_participant(rider, "Campus")
+    return ride
+
+
+def main(n_riders=500, n_rides=2_000):
+    handler = populate(empty_handler(), max(n_rides // 10, n_riders + 1), n_rides, participants_per_ride=2)
+    handler.save_data()
+    controller.data_handler = handler
+    client = controller.app.test_client()
+    driver = handler.users[0]
+    riders = handler.users[1:n_riders + 1]
+    singles_ride = _shuttle(handler, driver, riders)
+    batch_ride = _shuttle(handler, driver, riders)
+
+    start = time.perf_counter()
+    for rider in riders:
+        response = client.post(f'/usuarios/{driver.alias}/rides/{singles_ride.id}/accept/{rider.alias}')
+        assert response.status_code == 200, response.data
+    singles = time.perf_counter() - start
+
+    operations = [{"action": "accept", "participant_alias": rider.alias} for rider in riders]
+    start = time.perf_counter()
+    response = client.post(f'/usuarios/{driver.alias}/rides/{batch_ride.id}/batch', json={"operations": operations})
+    assert response.status_code == 200, response.data
+    batch = time.perf_counter() - start
+
+    print(f"{n_riders} aceptaciones, {n_rides} rides de fondo")
+    print(f"{'modo':>8} {'total s':>9} {'ms/op':>8}")
+    print(f"{'single':>8} {singles:>9.2f} {singles / n_riders * 1000:>8.2f}")
+    print(f"{'batch':>8} {batch:>9.2f} {batch / n_riders * 1000:>8.2f}")
+    handler.close()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
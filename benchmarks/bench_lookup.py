@@ -0,0 +1,36 @@
+"""Latencia de DataHandler.get_user / get_ride de 1k a 1M entidades.
+
+Uso: python -m benchmarks.bench_lookup [max_users]
+"""
+import random
+import sys
+import time
+
+from benchmarks.datagen import empty_handler, populate
+
+SAMPLES = 20000
+
+
+def _per_lookup_ns(fn, keys):
+    start = time.perf_counter_ns()
+    for key in keys:
+        fn(key)
+    return (time.perf_counter_ns() - start) / len(keys)
+
+
+def main(max_users=1_000_000):
+    rng = random.Random(42)
+    print(f"{'users':>10} {'rides':>10} {'get_user ns':>12} {'get_ride ns':>12}")
+    n = 1000
+    while n <= max_users:
+        handler = populate(empty_handler(), n, n)
+        aliases = [f"user{rng.randrange(n)}" for _ in range(SAMPLES)]
+        ride_ids = [handler.rides[rng.randrange(n)].id for _ in range(SAMPLES)]
+        user_ns = _per_lookup_ns(handler.get_user, aliases)
+        ride_ns = _per_lookup_ns(handler.get_ride, ride_ids)
+        print(f"{n:>10} {n:>10} {user_ns:>12.0f} {ride_ns:>12.0f}")
+        n *= 10
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
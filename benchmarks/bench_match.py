@@ -0,0 +1,118 @@
+"""Sugerencias de rides (GET /rides/match) con muchos rides activos.
+
+Con todos los rides ready (destinos de Lima, un pasajero por ride) mide el
+armado del indice en el primer pedido y la latencia de match_rides con
+destinos al azar y ventanas de 1, 2, 6 y 24 horas, intercalando cambios (un
+pasajero que se une y es aceptado) que el indice debe seguir. Tambien mide
+el endpoint completo, con la serializacion, y compara con recorrer todos los
+rides para una parte de las consultas.
+
+Uso: python -m benchmarks.bench_match [rides] [consultas]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from urllib.parse import urlencode
+
+from benchmarks.datagen import empty_handler, populate, street_address
+from src import controller
+from src.models.user import User
+from src.storage.match_index import ADDRESS_WEIGHT, RELIABILITY_WEIGHT, TIME_WEIGHT, address_tokens, is_open
+
+WINDOW_HOURS = (1, 2, 6, 24)
+MUTATION_RATE = 0.1
+SCAN_QUERIES = 20
+
+
+def _percentiles(latencies):
+    latencies = sorted(latencies)
+    return (latencies[len(latencies) // 2] * 1000,
+            latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000)
+
+
+def _scan(handler, destination, date_from, date_to, limit):
+    """Lo que haria el endpoint sin indice: puntuar cada ride del handler (confiabilidad fija, solo el costo)"""
+    tokens = set(address_tokens(destination))
+    ts_from, ts_to = date_from.timestamp(), date_to.timestamp()
+    at = (ts_from + ts_to) / 2
+    scored = []
+    for ride in handler.rides:
+        departure = ride.departure_time()
+        if not is_open(ride) or not date_from <= departure <= date_to:
+            continue
+        time_score = 1 - abs(departure.timestamp() - at) / max(at - ts_from, 1)
+        address_score = len(tokens & set(address_tokens(ride.final_address))) / max(len(tokens), 1)
+        scored.append((TIME_WEIGHT * time_score + ADDRESS_WEIGHT * address_score + RELIABILITY_WEIGHT * 0.5, ride.id))
+    return sorted(scored, reverse=True)[:limit]
+
+
+def main(n_rides=1_000_000, n_queries=2_000):
+    start = time.perf_counter()
+    handler = populate(empty_handler(), max(n_rides // 10, 10), n_rides, participants_per_ride=1, addresses=True)
+    print(f"{n_rides} rides activos, {len(handler.users)} usuarios (datos en {time.perf_counter() - start:.0f} s)")
+
+    start = time.perf_counter()
+    handler.match_rides("Miraflores", datetime(2025, 7, 1), datetime(2025, 7, 1, 1))
+    print(f"armado del indice (primer pedido): {time.perf_counter() - start:.1f} s, "
+          f"{len(handler._match_index)} rides abiertos")
+
+    rng = random.Random(0)
+    latencies = {hours: [] for hours in WINDOW_HOURS}
+    mutations = []
+    queries = []
+    for index in range(n_queries):
+        hours = WINDOW_HOURS[index % len(WINDOW_HOURS)]
+        date_from = datetime(2025, 7, rng.randint(1, 27), rng.randint(0, 23))
+        date_to = date_from + timedelta(hours=hours)
+        rider = rng.choice(handler.users) if rng.random() < 0.3 else None
+        destination = street_address(rng)
+        queries.append((destination, date_from, date_to))
+        start = time.perf_counter()
+        handler.match_rides(destination, date_from, date_to, limit=10, rider=rider)
+        latencies[hours].append(time.perf_counter() - start)
+        if rng.random() < MUTATION_RATE:
+            ride = rng.choice(handler.rides)
+            rider = User(f"match-rider{index}", "Rider")
+            handler._index_user(rider)
+            start = time.perf_counter()
+            try:
+                ride.add_participant(rider, destination)
+                ride.accept_participant(rider)
+                handler._ride_changed(ride, [rider])
+            except ValueError:
+                continue
+            mutations.append(time.perf_counter() - start)
+
+    print(f"{'ventana':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for hours in WINDOW_HOURS:
+        p50, p99 = _percentiles(latencies[hours])
+        print(f"{hours:>7}h {p50:>8.2f} {p99:>8.2f}")
+    p50, p99 = _percentiles([latency for values in latencies.values() for latency in values])
+    print(f"{'todas':>8} {p50:>8.2f} {p99:>8.2f}")
+    p50, p99 = _percentiles(mutations)
+    print(f"cambio de un ride con el indice al dia ({len(mutations)}): p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+
+    client = controller.app.test_client()
+    endpoint = []
+    with patch.object(controller, 'data_handler', handler):
+        for destination, date_from, date_to in queries[:500]:
+            query = urlencode({"destination": destination, "from": date_from.strftime("%Y/%m/%d %H:%M"),
+                               "to": date_to.strftime("%Y/%m/%d %H:%M"), "limit": 10})
+            start = time.perf_counter()
+            response = client.get(f"/rides/match?{query}")
+            endpoint.append(time.perf_counter() - start)
+            assert response.status_code == 200
+    p50, p99 = _percentiles(endpoint)
+    print(f"GET /rides/match completo: p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+
+    start = time.perf_counter()
+    for destination, date_from, date_to in queries[:SCAN_QUERIES]:
+        _scan(handler, destination, date_from, date_to, 10)
+    print(f"recorriendo todos los rides: {(time.perf_counter() - start) / SCAN_QUERIES * 1000:.0f} ms por consulta")
+    handler.close()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
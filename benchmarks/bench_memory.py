@@ -0,0 +1,66 @@
+"""Bytes por participacion: objetos con __dict__ y estado string (antes) vs __slots__ y codigo de estado.
+
+Las participaciones se construyen desde registros decodificados de JSON, como al
+cargar data.json, asi cada registro trae su propia copia del string de estado.
+
+Uso: python -m benchmarks.bench_memory [participaciones]
+"""
+import gc
+import json
+import sys
+import tracemalloc
+
+from src.models.RideParticipation import RideParticipation
+from src.models.user import User
+
+
+class LegacyParticipation:
+    """Layout de RideParticipation antes de __slots__: atributos en __dict__ y el estado como string"""
+
+    def __init__(self, participant, destination, status, confirmation, occupied_spaces):
+        self.confirmation = confirmation
+        self.participant = participant
+        self.destination = destination
+        self.occupied_spaces = occupied_spaces
+        self._status = status
+
+
+def build_legacy(participant, records):
+    return [LegacyParticipation(participant, r['destination'], r['status'], r['confirmation'], r['occupiedSpaces'])
+            for r in records]
+
+
+def build_slotted(participant, records):
+    return [RideParticipation.restore(participant, r['destination'], r['status'], r['confirmation'],
+                                      r['occupiedSpaces'])
+            for r in records]
+
+
+def measure(build, participant, encoded):
+    """Memoria que sigue viva tras decodificar y construir, dividida por participacion"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = json.loads(encoded)
+    participations = build(participant, records)
+    # Del registro JSON solo sobrevive lo que la participacion referencia
+    del records
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / len(participations)
+
+
+def main(n=1_000_000):
+    participant = User("rider", "Rider")
+    statuses = ("waiting", "confirmed", "rejected", "done", "notmarked")
+    encoded = json.dumps([{"destination": "Av. Arequipa 123", "status": statuses[i % len(statuses)],
+                           "confirmation": i % 2 == 0, "occupiedSpaces": 1} for i in range(n)])
+    print(f"{n} participaciones")
+    print(f"{'layout':>8} {'bytes/participacion':>20}")
+    for label, build in (("antes", build_legacy), ("slots", build_slotted)):
+        print(f"{label:>8} {measure(build, participant, encoded):>20.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,49 @@
+"""Costo de la instrumentacion: los mismos requests sin metricas, con metricas y perfilados con X-Profile.
+
+Uso: python -m benchmarks.bench_metrics [requests] [rides]
+"""
+import statistics
+import sys
+import time
+
+from benchmarks.datagen import empty_handler, populate
+from src import controller, metrics
+
+
+def _latencies(client, paths, headers=None):
+    latencies = []
+    for path in paths:
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.data
+    return sorted(latencies)
+
+
+def main(n_requests=5_000, n_rides=10_000):
+    handler = populate(empty_handler(), max(n_rides // 10, 10), n_rides, participants_per_ride=3)
+    controller.data_handler = handler
+    controller.app.config['PROFILING_ENABLED'] = True
+    client = controller.app.test_client()
+    rides = handler.rides
+    paths = [f'/usuarios/{rides[i % len(rides)].driver.alias}' for i in range(n_requests)]
+    # Without the response cache every request runs get_user and serializes the user's rides
+    handler.response_cache.capacity = 0
+
+    print(f"{n_requests} requests, {n_rides} rides")
+    print(f"{'modo':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    modes = (("off", False, None), ("metricas", True, None), ("perfilado", True, {'X-Profile': '1'}))
+    for label, enabled, headers in modes:
+        controller.app.config['METRICS_ENABLED'] = enabled
+        if enabled:
+            metrics.instrument_handler(handler)
+            metrics.instrument_models()
+        # Each profiled request starts a sampling thread, so that mode gets fewer requests
+        latencies = _latencies(client, paths if headers is None else paths[:n_requests // 10], headers)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{label:>10} {statistics.median(latencies) * 1000:>9.3f} {p99 * 1000:>9.3f}")
+    handler.close()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
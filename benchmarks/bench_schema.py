@@ -0,0 +1,41 @@
+"""Tamano de data.json y tiempo de carga: formato v1 (anidado) vs v2 (normalizado).
+
+Uso: python -m benchmarks.bench_schema [rides]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import empty_handler, populate
+from src.data_handler import DataHandler
+from src.storage import schema
+
+
+def legacy_snapshot(handler):
+    """El data.json que escribia save_data antes del formato versionado"""
+    return {
+        'users': [user.get_user_info() for user in handler.users],
+        'rides': [ride.get_ride_info() for ride in handler.rides]
+    }
+
+
+def main(n_rides=100_000):
+    n_users = max(n_rides // 10, 10)
+    handler = populate(empty_handler(), n_users, n_rides, participants_per_ride=2)
+    print(f"dataset: {n_users} usuarios, {n_rides} rides, {sum(len(r.participants) for r in handler.rides)} participaciones")
+    print(f"{'formato':>8} {'MB':>9} {'load s':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for label, data in (("v1", legacy_snapshot(handler)), ("v2", schema.snapshot(handler.users, handler.rides))):
+            filename = os.path.join(directory, f'{label}.json')
+            with open(filename, 'w') as f:
+                json.dump(data, f)
+            start = time.perf_counter()
+            DataHandler(filename=filename)
+            elapsed = time.perf_counter() - start
+            print(f"{label:>8} {os.path.getsize(filename) / 1e6:>9.1f} {elapsed:>8.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,57 @@
+"""Busqueda de rides activos por destino: indice de palabras/trigramas vs filtrar /rides/active.
+
+Todos los rides quedan activos (ready) con direcciones de Lima. Se mide el armado
+del indice, la latencia de busqueda con consultas exactas, con errores de tipeo
+y con prefijos, y una pasada lineal de referencia sobre los mismos rides.
+
+Uso: python -m benchmarks.bench_search [rides] [consultas]
+"""
+import statistics
+import sys
+import time
+
+from benchmarks.datagen import empty_handler, populate
+
+QUERIES = ("San Borja", "Surquillo", "miraflores", "surqillo", "san bora", "barrnco", "mirafl", "javier prado",
+           "Av. Angamos Surquillo", "jesús maría", "lurigancho", "chorrilos")
+
+
+def _percentile(latencies, fraction):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+def main(n_rides=500_000, n_queries=1_000):
+    handler = populate(empty_handler(), max(n_rides // 10, 10), n_rides, participants_per_ride=2, addresses=True)
+    print(f"{len(handler.get_active_rides())} rides activos")
+
+    start = time.perf_counter()
+    handler.search_rides("warmup")
+    print(f"armado del indice: {time.perf_counter() - start:.1f} s ({len(handler._search_index)} rides)")
+
+    print(f"{'consulta':>22} {'p50 ms':>9} {'p99 ms':>9}")
+    all_latencies = []
+    for query in QUERIES:
+        latencies = []
+        for _ in range(max(n_queries // len(QUERIES), 1)):
+            start = time.perf_counter()
+            handler.search_rides(query, limit=20)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        all_latencies.extend(latencies)
+        print(f"{query:>22} {statistics.median(latencies) * 1000:>9.2f} {_percentile(latencies, 0.99) * 1000:>9.2f}")
+    all_latencies.sort()
+    print(f"{'total':>22} {statistics.median(all_latencies) * 1000:>9.2f} "
+          f"{_percentile(all_latencies, 0.99) * 1000:>9.2f}")
+
+    # Reference: what a client does today with the full /rides/active list
+    start = time.perf_counter()
+    needle = "surquillo"
+    matches = [ride for ride in handler.get_active_rides()
+               if needle in ride.final_address.lower()
+               or any(needle in participation.destination.lower() for participation in ride.participants)]
+    print(f"filtro lineal 'surquillo': {(time.perf_counter() - start) * 1000:.0f} ms ({len(matches)} rides)")
+    handler.close()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
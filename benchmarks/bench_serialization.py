@@ -0,0 +1,93 @@
+"""Serializacion con fragmentos cacheados: save_data y GET /usuarios/<alias> con el 1% de los rides cambiados.
+
+Antes de cada medicion se cambia el 1% de los rides (un pasajero nuevo en
+cada uno). "completo" codifica todo de nuevo como antes (json.dump de
+schema.snapshot, get_user_info + JSON); "fragmentos" reutiliza el JSON de los
+rides cuya version no cambio. Para save_data se separa el tiempo de armar el
+JSON del de escribir el archivo.
+
+Uso: python -m benchmarks.bench_serialization [rides]
+"""
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import empty_handler, populate
+from src.models.user import User
+from src.storage import schema
+from src.storage.atomic import write_json_atomic
+
+ROUNDS = 5
+MUTATED_FRACTION = 0.01
+
+
+def _mutate(handler, rng, round_number):
+    rides = [ride for ride in handler.rides if ride.status == "ready"]
+    for index, ride in enumerate(rng.sample(rides, max(1, int(len(handler.rides) * MUTATED_FRACTION)))):
+        rider = User(f"rider{round_number}-{index}", "Rider")
+        handler._index_user(rider)
+        ride.add_participant(rider, "Destino 0")
+
+
+def _best(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main(n_rides=100_000):
+    directory = tempfile.mkdtemp(prefix='rides-serialization-')
+    handler = populate(empty_handler(directory), max(n_rides // 10, 10), n_rides, participants_per_ride=2)
+    full_file = os.path.join(directory, 'full.json')
+    driver = max(handler.users, key=lambda user: len(user.rides))
+    rng = random.Random(0)
+
+    def full_encode():
+        return json.dumps(schema.snapshot(handler.users, handler.rides))
+
+    def fragment_encode():
+        return ''.join(schema.snapshot_chunks(map(handler._encoded_user, handler.users),
+                                              map(handler._encoded_ride, handler.rides)))
+
+    def user_full():
+        return json.dumps(driver.get_user_info(), separators=(',', ':'), sort_keys=True)
+
+    handler.save_data()  # Warms the fragments
+    driver.get_user_info_json()
+    assert fragment_encode() == full_encode()
+    assert driver.get_user_info_json() == user_full()
+
+    results = {name: [] for name in ("encode_full", "encode_fragments", "save_full", "save_fragments",
+                                     "user_full", "user_fragments")}
+    for round_number in range(ROUNDS):
+        _mutate(handler, rng, round_number)
+        # The full variants do not touch the fragments, so each round measures fragments after 1% of changes
+        results["encode_full"].append(_best(full_encode))
+        results["save_full"].append(_best(lambda: write_json_atomic(full_file, schema.snapshot(handler.users,
+                                                                                               handler.rides))))
+        results["user_full"].append(_best(user_full))
+        results["user_fragments"].append(_best(driver.get_user_info_json))
+        results["encode_fragments"].append(_best(fragment_encode))
+        _mutate(handler, rng, ROUNDS + round_number)
+        results["save_fragments"].append(_best(handler.save_data))
+    size = os.path.getsize(handler.filename)
+    handler.close()
+
+    print(f"{n_rides} rides, {len(handler.users)} usuarios, {MUTATED_FRACTION:.0%} de los rides cambiados por ronda, "
+          f"data.json {size / 2**20:.1f} MB (mediana de {ROUNDS} rondas)")
+    print(f"{'medicion':>28} {'completo ms':>12} {'fragmentos ms':>14} {'mejora':>7}")
+    for label, full, fragments in (("armar JSON de save_data", "encode_full", "encode_fragments"),
+                                   ("save_data (con escritura)", "save_full", "save_fragments"),
+                                   (f"GET /usuarios ({len(driver.rides)} rides)", "user_full", "user_fragments")):
+        full_s = sorted(results[full])[ROUNDS // 2]
+        fragments_s = sorted(results[fragments])[ROUNDS // 2]
+        print(f"{label:>28} {full_s * 1000:>12.2f} {fragments_s * 1000:>14.2f} {full_s / fragments_s:>6.1f}x")
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,144 @@
+"""Escalamiento del modo sharding (python -m src.sharding) con 1, 2, 4 y 8 shards.
+
+Para cada cantidad de shards se reparte el mismo data.json con split_data_file,
+se levantan los workers y un router, y un cliente asyncio abre concurrency
+conexiones keep-alive contra el router durante duration segundos. Cada conexion
+repite: 70% GET /usuarios/<alias>/rides/<id> (un shard), 10% GET
+/rides/active?limit=20 (scatter-gather a todos) y 20% POST
+/usuarios/<conductor>/rides (una escritura en el shard del conductor que se
+persiste antes de responder). Se reporta el throughput y la latencia de cada
+tipo de request.
+
+Los shards escalan repartiendo CPU: cada worker atiende y persiste solo su parte
+en su propio proceso, asi que con varios nucleos el throughput crece con los
+shards hasta que el router (o el cliente) se vuelve el cuello de botella. Con un
+solo CPU el trabajo total es el mismo (las escrituras ya se agrupan por lote en
+cada worker) y lo que se ve es el costo del salto extra por el router.
+
+Uso: python -m benchmarks.bench_sharding [clientes] [segundos] [rides]
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_async import REQUEST_TIMEOUT, _read_response
+from benchmarks.datagen import empty_handler, populate
+from src.sharding import split_data_file, start_cluster, stop_cluster
+
+SHARD_COUNTS = (1, 2, 4, 8)
+KINDS = ("get", "active", "create")
+
+
+def _free_port_range(count):
+    """Puerto base con los count + 1 puertos siguientes libres (router y workers)"""
+    for _ in range(100):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            base = sock.getsockname()[1]
+        if base + count >= 65535:
+            continue
+        try:
+            for port in range(base, base + count + 1):
+                with socket.socket() as sock:
+                    sock.bind(('127.0.0.1', port))
+            return base
+        except OSError:
+            continue
+    raise RuntimeError("No se encontraron puertos libres consecutivos")
+
+
+def _post(target, payload):
+    body = json.dumps(payload).encode()
+    return (f"POST {target} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+
+
+async def _client(port, gets, drivers, deadline, latencies, counters, client_id):
+    rng = random.Random(client_id)
+    reader = writer = None
+    while time.monotonic() < deadline:
+        draw = rng.random()
+        if draw < 0.2:
+            kind = "create"
+            request = _post(f"/usuarios/{rng.choice(drivers)}/rides", {
+                "rideDateAndTime": f"2026/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d} 08:00",
+                "finalAddress": "Av. Arequipa 123, Lince", "allowedSpaces": 3})
+        elif draw < 0.3:
+            kind = "active"
+            request = b"GET /rides/active?limit=20 HTTP/1.1\r\nHost: bench\r\n\r\n"
+        else:
+            kind = "get"
+            request = rng.choice(gets)
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), REQUEST_TIMEOUT)
+            writer.write(request)
+            status, close = await asyncio.wait_for(_read_response(reader), REQUEST_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            counters["errors"] += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+        latencies[kind].append(time.perf_counter() - start)
+        if status >= 400:
+            counters["errors"] += 1
+        if close:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _load(port, gets, drivers, concurrency, duration):
+    latencies = {kind: [] for kind in KINDS}
+    counters = {"errors": 0}
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(_client(port, gets, drivers, deadline, latencies, counters, client_id)
+                           for client_id in range(concurrency)))
+    return latencies, counters["errors"]
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else float('nan')
+
+
+def main(concurrency=64, duration=10, n_rides=20_000):
+    source = tempfile.mkdtemp(prefix='rides-shards-')
+    handler = populate(empty_handler(source), max(n_rides // 10, 10), n_rides, participants_per_ride=2)
+    handler.save_data()
+    gets = [f"GET /usuarios/{ride.driver.alias}/rides/{ride.id} HTTP/1.1\r\nHost: bench\r\n\r\n".encode()
+            for ride in random.Random(0).sample(handler.rides, min(1000, n_rides))]
+    drivers = sorted({ride.driver.alias for ride in handler.rides})
+    handler.close()
+
+    print(f"{concurrency} clientes, {duration} s, {n_rides} rides, {os.cpu_count()} CPU "
+          f"(70% GET ride, 10% GET /rides/active, 20% POST ride)")
+    print(f"{'shards':>6} {'req/s':>8} {'get p50':>8} {'get p99':>8} {'active p50':>11} "
+          f"{'create p50':>11} {'create p99':>11} {'errores':>8}  (ms)")
+    for shards in SHARD_COUNTS:
+        directory = tempfile.mkdtemp(prefix=f'rides-shards-{shards}-')
+        split_data_file(os.path.join(source, 'data.json'), shards, directory)
+        port = _free_port_range(shards)
+        processes = start_cluster(shards, port, directory)
+        try:
+            latencies, errors = asyncio.run(_load(port, gets, drivers, concurrency, duration))
+        finally:
+            stop_cluster(processes)
+        for values in latencies.values():
+            values.sort()
+        total = sum(len(values) for values in latencies.values())
+        print(f"{shards:>6} {total / duration:>8.0f} {_percentile(latencies['get'], 0.5):>8.1f} "
+              f"{_percentile(latencies['get'], 0.99):>8.1f} {_percentile(latencies['active'], 0.5):>11.1f} "
+              f"{_percentile(latencies['create'], 0.5):>11.1f} {_percentile(latencies['create'], 0.99):>11.1f} "
+              f"{errors:>8}")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:4]))
@@ -0,0 +1,51 @@
+"""Tiempo de arranque y memoria: carga completa de data.json vs snapshot indexado lazy.
+
+Uso: python -m benchmarks.bench_startup [rides]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.datagen import empty_handler, populate
+from src.data_handler import DataHandler
+from src.lazy_data_handler import LazyDataHandler
+from src.storage import snapshot
+
+
+def _startup(factory):
+    tracemalloc.start()
+    start = time.perf_counter()
+    handler = factory()
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return handler, elapsed, memory
+
+
+def main(n_rides=100_000):
+    n_users = max(n_rides // 10, 10)
+    source = populate(empty_handler(), n_users, n_rides, participants_per_ride=2)
+    with tempfile.TemporaryDirectory() as directory:
+        json_file = os.path.join(directory, 'data.json')
+        snap_file = os.path.join(directory, 'data.snap')
+        source.filename = json_file
+        source.save_data()
+        snapshot.write_from_handler(source, snap_file)
+        del source
+
+        print(f"dataset: {n_users} usuarios, {n_rides} rides")
+        print(f"{'modo':>6} {'arranque s':>11} {'MB tras arrancar':>17} {'1er get_ride ms':>16}")
+        for label, factory in (("eager", lambda: DataHandler(json_file)),
+                               ("lazy", lambda: LazyDataHandler(snap_file))):
+            handler, elapsed, memory = _startup(factory)
+            start = time.perf_counter()
+            handler.get_ride(n_rides // 2)
+            first_get = time.perf_counter() - start
+            print(f"{label:>6} {elapsed:>11.2f} {memory / 1e6:>17.1f} {first_get * 1000:>16.3f}")
+            handler.close()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
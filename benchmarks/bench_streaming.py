@@ -0,0 +1,50 @@
+"""Tiempo al primer byte y memoria pico de GET /rides/active: streaming vs respuesta armada.
+
+Uso: python -m benchmarks.bench_streaming [rides]
+"""
+import sys
+import time
+import tracemalloc
+
+from benchmarks.datagen import empty_handler, populate
+from src import controller
+
+
+def _measure(client, url):
+    start = time.perf_counter()
+    response = client.get(url, buffered=False)
+    chunks = iter(response.response)
+    first = next(chunks)
+    ttfb = time.perf_counter() - start
+    total = len(first)
+    for chunk in chunks:
+        total += len(chunk)
+    elapsed = time.perf_counter() - start
+    response.close()
+    return ttfb, elapsed, total
+
+
+def _peak_memory(client, url):
+    tracemalloc.start()
+    response = client.get(url, buffered=False)
+    for _ in response.response:
+        pass
+    response.close()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main(n_rides=100_000):
+    controller.data_handler = populate(empty_handler(), max(n_rides // 10, 10), n_rides, participants_per_ride=2)
+    client = controller.app.test_client()
+    print(f"GET /rides/active con {n_rides} rides")
+    print(f"{'modo':>9} {'ttfb ms':>9} {'total s':>8} {'MB':>7} {'pico MB':>8}")
+    for label, url in (("buffered", "/rides/active"), ("streamed", "/rides/active?stream=true")):
+        ttfb, elapsed, size = _measure(client, url)
+        peak = _peak_memory(client, url)
+        print(f"{label:>9} {ttfb * 1000:>9.1f} {elapsed:>8.2f} {size / 1e6:>7.1f} {peak / 1e6:>8.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
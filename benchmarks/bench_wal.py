@@ -0,0 +1,47 @@
+"""Escrituras por segundo: reescritura completa de data.json vs WAL append-only.
+
+Uso: python -m benchmarks.bench_wal [usuarios] [rides]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import populate
+from src.data_handler import DataHandler
+from src.storage.wal import WriteAheadLog
+
+
+def _handler(directory, wal_fsync):
+    filename = os.path.join(directory, 'data.json')
+    wal = WriteAheadLog(os.path.join(directory, 'data.wal'), fsync=wal_fsync) if wal_fsync else None
+    return DataHandler(filename=filename, wal=wal)
+
+
+def _writes_per_sec(handler, n_ops):
+    rides = handler.rides
+    start = time.perf_counter()
+    for i in range(n_ops):
+        participant = handler.users[i]
+        handler.join_ride(rides[i % len(rides)], participant, f"Destino {i}")
+    elapsed = time.perf_counter() - start
+    return n_ops / elapsed
+
+
+def main(n_users=2000, n_rides=1000):
+    print(f"dataset: {n_users} usuarios, {n_rides} rides")
+    print(f"{'modo':>18} {'ops':>7} {'writes/s':>12}")
+    modes = [("rewrite", None, 100), ("wal fsync=always", "always", 1000),
+             ("wal fsync=batch", "batch", n_users), ("wal fsync=never", "never", n_users)]
+    for label, fsync, n_ops in modes:
+        with tempfile.TemporaryDirectory() as directory:
+            populate(_handler(directory, None), n_users, n_rides, seed=1).save_data()
+            handler = _handler(directory, fsync)
+            rate = _writes_per_sec(handler, min(n_ops, n_users))
+            handler.close()
+        print(f"{label:>18} {min(n_ops, n_users):>7} {rate:>12.0f}")
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*args)
@@ -0,0 +1,91 @@
+"""Generadores de datos sinteticos para los benchmarks."""
+import os
+import random
+import tempfile
+
+from src.data_handler import DataHandler
+from src.models.ride import Ride
+from src.models.user import User
+
+
+DISTRICTS = ("Miraflores", "San Isidro", "Surquillo", "San Borja", "Barranco", "Santiago de Surco", "La Molina",
+             "Jesus Maria", "Lince", "Pueblo Libre", "Magdalena del Mar", "San Miguel", "Chorrillos", "Breña",
+             "Rimac", "Los Olivos", "San Juan de Lurigancho", "Ate", "Callao", "La Victoria")
+STREETS = ("Av. Arequipa", "Av. Javier Prado", "Jr. Ucayali", "Calle Las Begonias", "Av. Angamos", "Av. Benavides",
+           "Av. La Marina", "Av. Brasil", "Jr. de la Union", "Av. Primavera")
+
+
+def street_address(rng):
+    """Direccion de Lima al azar, p. ej. Av. Angamos 1234, Surquillo"""
+    return f"{rng.choice(STREETS)} {rng.randrange(100, 4000)}, {rng.choice(DISTRICTS)}"
+
+
+def empty_handler(directory=None):
+    """Crea un DataHandler vacio apuntando a un archivo que todavia no existe"""
+    directory = directory or tempfile.mkdtemp(prefix='rides-bench-')
+    return DataHandler(filename=os.path.join(directory, 'data.json'))
+
+
+def populate(handler, n_users, n_rides=0, participants_per_ride=0, seed=0, addresses=False, status_mix=False):
+    """Llena el handler en memoria sin persistir nada.
+
+    Con addresses=True los destinos son direcciones de Lima (street_address) en
+    lugar de "Destino N". Con status_mix=True los rides quedan repartidos segun
+    RIDE_STATUS_MIX (ver _advance), o segun status_mix si es una tupla con el
+    mismo formato; si no, todos quedan ready.
+    """
+    rng = random.Random(seed)
+    mix = RIDE_STATUS_MIX if status_mix is True else status_mix
+    for i in range(n_users):
+        handler._index_user(User(f"user{i}", f"User {i}", f"PLT{i:06d}" if i % 3 == 0 else None))
+    for i in range(n_rides):
+        driver = handler.users[rng.randrange(n_users)]
+        final_address = street_address(rng) if addresses else f"Destino {i % 500}"
+        ride = Ride(f"2025/07/{1 + i % 28:02d} {i % 24:02d}:00", final_address, 4, driver)
+        driver.add_ride(ride)
+        target = _pick(rng, mix) if status_mix else "ready"
+        for participant in rng.sample(handler.users, participants_per_ride):
+            if participant is driver:
+                continue
+            destination = street_address(rng) if addresses else f"Destino {rng.randrange(500)}"
+            ride.add_participant(participant, destination)
+            decision = rng.random()
+            if target == "ready" and status_mix and decision < 0.15:
+                continue  # Request still waiting for the driver
+            if decision < 0.7 and ride.available_spaces() > 0:
+                ride.accept_participant(participant)
+            else:
+                ride.reject_participant(participant)
+        _advance(ride, target, rng)
+        handler._index_ride(ride)
+    return handler
+
+
+# Estado final de los rides con status_mix=True y su proporcion
+RIDE_STATUS_MIX = (("ready", 0.5), ("inprogress", 0.15), ("done", 0.35))
+
+
+def _pick(rng, weighted):
+    value = rng.random()
+    for option, weight in weighted:
+        value -= weight
+        if value < 0:
+            return option
+    return weighted[-1][0]
+
+
+def _advance(ride, target, rng):
+    """Lleva un ride con sus solicitudes ya resueltas hasta target.
+
+    En un ride inprogress ya bajo la mitad de los pasajeros; en uno done el 85%
+    bajo y el resto queda notmarked al terminar.
+    """
+    if target == "ready":
+        return
+    ride.start_ride()
+    unload_rate = 0.5 if target == "inprogress" else 0.85
+    for participation in list(ride.participants):
+        if participation.status == "inprogress" and rng.random() < unload_rate:
+            ride.unload_participant(participation.participant)
+    if target == "done":
+        ride.end_ride()
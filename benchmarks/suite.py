@@ -0,0 +1,212 @@
+"""Suite de benchmarks con resultados en JSON, para comparar commits y detectar regresiones.
+
+Genera un dataset con datagen.populate (status_mix=True: rides ready, inprogress
+y done con solicitudes en todos los estados) y mide:
+  - micro: DataHandler.get_user / get_ride / save_data / load_data,
+    Ride.get_ride_info y RideParticipation.get_participant_info
+  - e2e: el flujo create -> join -> accept -> start -> unload -> end de punta a
+    punta con el test client de Flask, persistiendo como la app
+
+Cada medicion se repite y se reporta la mediana y el minimo por operacion. Los
+pasos sueltos del flujo e2e son informativos: la regresion se mide sobre el
+flujo completo.
+
+Uso (desde la raiz del repo):
+  python -m benchmarks.suite --output base.json
+  python -m benchmarks.suite --output nuevo.json --compare base.json --threshold 0.2
+Con --compare termina con codigo 1 si alguna mediana empeora mas que threshold
+(0.2 = 20%). --quick usa un dataset chico para probar rapido.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.datagen import empty_handler, populate
+from src import controller
+from src.data_handler import DataHandler
+
+DEFAULTS = {"users": 10_000, "rides": 50_000, "participants": 3, "repeat": 7, "scenarios": 20, "seed": 0}
+QUICK = {"users": 500, "rides": 2_000, "participants": 3, "repeat": 3, "scenarios": 5, "seed": 0}
+
+
+def _timed_loop(fn, args_list):
+    """Segundos por operacion de llamar fn(*args) para cada args de args_list"""
+    start = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return (time.perf_counter() - start) / len(args_list)
+
+
+def _summary(per_op_seconds, unit="us", gate=True):
+    """gate=False marca mediciones informativas (pocas muestras) que --compare no cuenta como regresion"""
+    scale = {"us": 1e6, "ms": 1e3}[unit]
+    samples = [round(value * scale, 3) for value in per_op_seconds]
+    return {"unit": unit, "median": round(statistics.median(samples), 3), "min": min(samples), "gate": gate,
+            "samples": samples}
+
+
+def micro_benchmarks(handler, repeat, rng, loop=20_000):
+    aliases = [(handler.users[rng.randrange(len(handler.users))].alias,) for _ in range(loop)]
+    ride_ids = [(handler.rides[rng.randrange(len(handler.rides))].id,) for _ in range(loop)]
+    rides = [handler.rides[rng.randrange(len(handler.rides))] for _ in range(loop // 10)]
+    participations = [participation for ride in rides for participation in ride.participants]
+
+    results = {
+        "get_user": _summary([_timed_loop(handler.get_user, aliases) for _ in range(repeat)]),
+        "get_ride": _summary([_timed_loop(handler.get_ride, ride_ids) for _ in range(repeat)]),
+        "get_ride_info": _summary([_timed_loop(lambda ride: ride.get_ride_info(), [(ride,) for ride in rides])
+                                   for _ in range(repeat)]),
+        "get_participant_info": _summary([_timed_loop(lambda p: p.get_participant_info(),
+                                                      [(p,) for p in participations])
+                                          for _ in range(repeat)]),
+    }
+    # Full rewrites of the data file are slow, so they are timed one at a time
+    results["save_data"] = _summary([_timed_loop(handler.save_data, [()]) for _ in range(repeat)], unit="ms")
+    results["load_data"] = _summary([_timed_loop(handler.load_data, [()]) for _ in range(repeat)], unit="ms")
+    return results
+
+
+def _scenario(client, index, riders=3):
+    """Un ride completo por la API; retorna {paso: segundos}"""
+    steps = {}
+
+    def call(step, path, **kwargs):
+        start = time.perf_counter()
+        response = client.post(path, **kwargs)
+        steps.setdefault(step, []).append(time.perf_counter() - start)
+        assert response.status_code in (200, 201), (step, response.status_code, response.data)
+        return response
+
+    driver = f"suite-driver{index}"
+    passengers = [f"suite-rider{index}-{i}" for i in range(riders)]
+    call("create_user", '/usuarios', json={"alias": driver, "name": "Suite Driver", "carPlate": f"S{index:05d}"})
+    for alias in passengers:
+        call("create_user", '/usuarios', json={"alias": alias, "name": "Suite Rider"})
+    response = call("create_ride", f'/usuarios/{driver}/rides',
+                    json={"rideDateAndTime": "2025/09/01 08:00", "finalAddress": "Av. Arequipa 123, Lince",
+                          "allowedSpaces": riders})
+    ride_id = json.loads(response.data)["id"]
+    for alias in passengers:
+        call("join", f'/usuarios/{driver}/rides/{ride_id}/requestToJoin/{alias}',
+             json={"destination": "Miraflores"})
+    for alias in passengers[:-1]:
+        call("accept", f'/usuarios/{driver}/rides/{ride_id}/accept/{alias}')
+    call("reject", f'/usuarios/{driver}/rides/{ride_id}/reject/{passengers[-1]}')
+    call("start", f'/usuarios/{driver}/rides/{ride_id}/start')
+    call("unload", f'/usuarios/{driver}/rides/{ride_id}/unloadParticipant',
+         json={"participant_alias": passengers[0]})
+    call("end", f'/usuarios/{driver}/rides/{ride_id}/end')
+    return steps
+
+
+def e2e_benchmarks(handler, scenarios):
+    previous = controller.data_handler
+    controller.data_handler = handler
+    try:
+        client = controller.app.test_client()
+        totals = []
+        steps = {}
+        for index in range(scenarios):
+            start = time.perf_counter()
+            for step, latencies in _scenario(client, index).items():
+                steps.setdefault(step, []).extend(latencies)
+            totals.append(time.perf_counter() - start)
+    finally:
+        controller.data_handler = previous
+    results = {"e2e_ride_lifecycle": _summary(totals, unit="ms")}
+    for step, latencies in steps.items():
+        results[f"e2e_{step}"] = _summary(latencies, unit="ms", gate=False)
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(users, rides, participants, repeat, scenarios, seed):
+    directory = tempfile.mkdtemp(prefix='rides-suite-')
+    handler = populate(empty_handler(directory), users, rides, participants_per_ride=participants, seed=seed,
+                       status_mix=True)
+    handler.save_data()
+    handler.close()
+    handler = DataHandler(filename=os.path.join(directory, 'data.json'))
+    results = micro_benchmarks(handler, repeat, random.Random(seed))
+    results.update(e2e_benchmarks(handler, scenarios))
+    handler.close()
+    return {
+        "meta": {
+            "commit": _commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {"users": users, "rides": rides, "participants": participants, "repeat": repeat,
+                       "scenarios": scenarios, "seed": seed},
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Retorna [(nombre, mediana base, mediana actual, cambio relativo, es_regresion)]"""
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or base["unit"] != result["unit"] or not base["median"]:
+            continue
+        change = result["median"] / base["median"] - 1
+        rows.append((name, base["median"], result["median"], change, result["gate"] and change > threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="archivo JSON donde guardar los resultados")
+    parser.add_argument("--compare", help="resultados JSON de referencia (p. ej. del commit anterior)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="empeoramiento tolerado (0.2 = 20%%)")
+    parser.add_argument("--quick", action="store_true", help="dataset chico y menos repeticiones")
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f"--{name}", type=int, default=None, help=f"por defecto {default}")
+    args = parser.parse_args(argv)
+
+    params = dict(QUICK if args.quick else DEFAULTS)
+    params.update({name: getattr(args, name) for name in DEFAULTS if getattr(args, name) is not None})
+    if args.compare and args.compare == args.output:
+        parser.error("--compare y --output deben ser archivos distintos")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"]["params"] != params:
+            print(f"aviso: la referencia uso otros parametros ({baseline['meta']['params']})", file=sys.stderr)
+
+    current = run(**params)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    print(f"{'benchmark':>28} {'unidad':>6} {'mediana':>10} {'min':>10}")
+    for name, result in current["results"].items():
+        print(f"{name:>28} {result['unit']:>6} {result['median']:>10.3f} {result['min']:>10.3f}")
+    if not args.compare:
+        return 0
+
+    rows = compare(baseline, current, args.threshold)
+    print(f"\ncomparado con {baseline['meta'].get('commit') or args.compare} (umbral {args.threshold:.0%})")
+    for name, base, value, change, regression in rows:
+        print(f"{name:>28} {base:>10.3f} -> {value:>10.3f} {change:>+8.1%}{'  REGRESION' if regression else ''}")
+    return 1 if any(row[4] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""Punto de entrada del modo async.
+
+  python -m src.asgi --port 8000          servidor asyncio incluido
+  uvicorn src.asgi:application            o cualquier servidor ASGI
+
+Usa las mismas variables RIDES_* que la app Flask. Como las respuestas esperan
+a la escritura sin bloquear el loop, la persistencia es write-behind: si no se
+indica RIDES_WRITE_BEHIND_MS se escribe apenas se pide (0 ms), agrupando los
+cambios que llegan mientras se escribe.
+"""
+import argparse
+import asyncio
+import os
+
+os.environ.setdefault('RIDES_WRITE_BEHIND_MS', '0')
+
+from src import controller  # noqa: E402 (needs the write-behind default above)
+from src.async_server import AsgiApp, serve  # noqa: E402
+
+application = AsgiApp(controller.app, lambda: controller.data_handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.asgi", description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(application, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        controller.data_handler.close()
+
+
+if __name__ == '__main__':
+    main()
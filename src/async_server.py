@@ -0,0 +1,267 @@
+"""Modo async: la app Flask servida como aplicacion ASGI sobre un unico event loop.
+
+AsgiApp ejecuta las mismas vistas de Flask (mismas rutas y mismo JSON) en el
+hilo del event loop. Las mutaciones de un ride se hacen bajo un asyncio.Lock por
+ride y la respuesta se envia recien cuando el cambio esta en disco, pero la
+espera es un future: el archivo lo escribe el hilo escritor del DataHandler
+(write-behind, con escrituras agrupadas; con log, el fsync tambien se hace en
+otro hilo) y mientras tanto el loop atiende otros requests. Asi un POST responde con la misma garantia que en el modo sincrono
+sin ocupar un worker durante la escritura.
+
+serve() es un servidor HTTP/1.1 minimo con asyncio (keep-alive, Content-Length
+y respuestas chunked) para correr sin dependencias; cualquier servidor ASGI
+(uvicorn, hypercorn) sirve igual.
+"""
+import asyncio
+import io
+import sys
+from contextlib import asynccontextmanager
+from urllib.parse import unquote
+
+from werkzeug.exceptions import HTTPException
+
+MUTATING_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+MAX_HEADER_BYTES = 64 * 1024
+STATUS_REASONS = {200: "OK", 201: "Created", 204: "No Content", 304: "Not Modified", 400: "Bad Request",
+                  404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 422: "Unprocessable Entity",
+                  500: "Internal Server Error"}
+
+
+class RideLocks:
+    """Un asyncio.Lock por ride, que se descarta cuando ya nadie lo usa ni lo espera"""
+
+    def __init__(self):
+        self._locks = {}  # ride_id -> [lock, requests que lo tienen o lo esperan]
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, ride_id):
+        entry = self._locks.get(ride_id)
+        if entry is None:
+            entry = self._locks[ride_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[ride_id]
+
+
+class AsgiApp:
+    """Aplicacion ASGI que despacha a una app Flask en el hilo del event loop.
+
+    get_handler() retorna el DataHandler que usan las vistas (se consulta en
+    cada request, asi que sigue a reemplazos como los de los tests).
+    """
+
+    def __init__(self, flask_app, get_handler):
+        self.flask_app = flask_app
+        self.get_handler = get_handler
+        self.ride_locks = RideLocks()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise ValueError(f"Tipo de conexion no soportado: {scope['type']}")
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.extend(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+
+        environ = self._environ(scope, bytes(body))
+        ride_id = self._mutated_ride_id(environ) if scope["method"] in MUTATING_METHODS else None
+        if ride_id is None:
+            status, headers, chunks = await self._dispatch(environ, scope["method"])
+        else:
+            # Mutations of one ride are applied and persisted in arrival order; other rides proceed
+            async with self.ride_locks.hold(ride_id):
+                status, headers, chunks = await self._dispatch(environ, scope["method"])
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        for chunk in chunks:
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _dispatch(self, environ, method):
+        status, headers, chunks = self._run_wsgi(environ)
+        if method in MUTATING_METHODS and status < 400:
+            error = await self._persisted()
+            if error is not None:
+                body = self.flask_app.json.dumps({"error": f"No se pudo persistir el cambio: {error}"}).encode()
+                headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+                return 500, headers, [body]
+        return status, headers, chunks
+
+    def _run_wsgi(self, environ):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                                   for name, value in headers]
+
+        result = self.flask_app.wsgi_app(environ, start_response)
+        try:
+            # Generated before the first await, so a streamed list comes from one consistent state
+            chunks = [chunk for chunk in result]
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return response["status"], response["headers"], chunks
+
+    def _persisted(self):
+        """Future que se resuelve (con el error o None) cuando los cambios hechos hasta ahora estan en disco"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(error):
+            if not future.done():
+                future.set_result(error)
+
+        self.get_handler().on_persisted(lambda error: loop.call_soon_threadsafe(resolve, error))
+        return future
+
+    def _mutated_ride_id(self, environ):
+        adapter = self.flask_app.url_map.bind_to_environ(environ)
+        try:
+            _, arguments = adapter.match()
+        except HTTPException:
+            return None
+        return arguments.get("ride_id")
+
+    @staticmethod
+    def _environ(scope, body):
+        server_name, server_port = scope.get("server") or ("localhost", 80)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server_name,
+            "SERVER_PORT": str(server_port),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": False,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope.get("headers", ()):
+            name = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if name == "CONTENT_TYPE":
+                environ["CONTENT_TYPE"] = value
+            elif name != "CONTENT_LENGTH":
+                key = f"HTTP_{name}"
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.get_handler().flush()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+async def _handle_connection(application, reader, writer):
+    client = writer.get_extra_info("peername")
+    server = writer.get_extra_info("sockname")
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            except asyncio.LimitOverrunError:
+                writer.write(b"HTTP/1.1 413 Payload Too Large\r\ncontent-length: 0\r\nconnection: close\r\n\r\n")
+                return
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, target, version = request_line.split(" ", 2)
+            headers = []
+            for line in header_lines:
+                if line:
+                    name, value = line.split(":", 1)
+                    headers.append((name.strip().lower().encode("latin-1"), value.strip().encode("latin-1")))
+            header_map = dict(headers)
+            body = await reader.readexactly(int(header_map.get(b"content-length", b"0")))
+            connection = header_map.get(b"connection", b"").lower()
+            keep_alive = connection == b"keep-alive" if version == "HTTP/1.0" else connection != b"close"
+            path, _, query = target.partition("?")
+
+            scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": version.split("/", 1)[1],
+                     "method": method, "scheme": "http", "path": unquote(path), "raw_path": path.encode("latin-1"),
+                     "query_string": query.encode("latin-1"), "root_path": "", "headers": headers,
+                     "client": client[:2] if client else None, "server": server[:2] if server else None}
+            request_messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+            async def receive():
+                if request_messages:
+                    return request_messages.pop()
+                return {"type": "http.disconnect"}
+
+            response = {"chunked": False}
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    response_headers = list(message.get("headers", ()))
+                    names = {name for name, _ in response_headers}
+                    if b"content-length" not in names:
+                        response["chunked"] = True
+                        response_headers.append((b"transfer-encoding", b"chunked"))
+                    if not keep_alive:
+                        response_headers.append((b"connection", b"close"))
+                    lines = [f"HTTP/1.1 {status} {STATUS_REASONS.get(status, '')}".encode("latin-1")]
+                    lines.extend(name + b": " + value for name, value in response_headers)
+                    writer.write(b"\r\n".join(lines) + b"\r\n\r\n")
+                elif message["type"] == "http.response.body":
+                    chunk = message.get("body", b"")
+                    if response["chunked"]:
+                        if chunk:
+                            writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                        if not message.get("more_body"):
+                            writer.write(b"0\r\n\r\n")
+                    else:
+                        writer.write(chunk)
+                    await writer.drain()
+
+            await application(scope, receive, send)
+            if not keep_alive:
+                return
+    except ConnectionError:
+        return
+    finally:
+        writer.close()
+
+
+async def serve(application, host="127.0.0.1", port=8000, ready=None, reuse_port=False):
+    """Sirve application (ASGI) hasta que se cancele; ready se completa cuando acepta conexiones.
+
+    Con reuse_port varios procesos pueden escuchar en el mismo puerto (el kernel reparte las conexiones).
+    """
+    server = await asyncio.start_server(lambda reader, writer: _handle_connection(application, reader, writer),
+                                        host, port, limit=MAX_HEADER_BYTES, backlog=4096, reuse_port=reuse_port or None)
+    if ready is not None:
+        ready.set_result(server.sockets[0].getsockname()[:2])
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,216 @@
+"""Importacion y exportacion masiva de usuarios, rides y participaciones.
+
+Uso (desde la raiz del repo, con la app detenida):
+  python -m src.bulk import --users usuarios.csv --rides rides.ndjson --participations participaciones.ndjson
+  python -m src.bulk export --users usuarios.ndjson --rides rides.csv --participations participaciones.csv
+
+El formato de cada archivo se deduce de la extension: .csv o .ndjson / .jsonl.
+Los registros y columnas son los de src/storage/schema.py (user_record,
+ride_record, participation_record). Los archivos se leen y escriben registro a
+registro; la importacion persiste data.json una sola vez al final.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+
+from src.data_handler import DataHandler
+from src.storage import schema
+
+FIELDS = {
+    "users": ("alias", "name", "carPlate"),
+    "rides": ("id", "rideDateAndTime", "finalAddress", "allowedSpaces", "driver", "status"),
+    "participations": ("rideId", "participant", "destination", "status", "confirmation", "occupiedSpaces"),
+}
+OPTIONAL_FIELDS = ("carPlate", "confirmation")  # Pueden venir vacios (None); el resto es obligatorio
+CSV_EXTENSIONS = (".csv",)
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+
+
+def _is_csv(filename):
+    if filename.endswith(CSV_EXTENSIONS):
+        return True
+    if filename.endswith(NDJSON_EXTENSIONS):
+        return False
+    raise ValueError(f"Extension no soportada (se espera .csv, .ndjson o .jsonl): {filename}")
+
+
+def _csv_value(field, value):
+    """Convierte un valor de CSV (siempre texto) al tipo del registro"""
+    if field in ("id", "rideId", "allowedSpaces", "occupiedSpaces"):
+        return int(value)
+    if field == "confirmation":
+        return {"": None, "true": True, "false": False}[value.lower()]
+    if field == "carPlate":
+        return value or None
+    return value
+
+
+def read_records(filename, kind):
+    """Genera (numero de linea, registro sin convertir) leyendo el archivo de a una linea"""
+    with open(filename, newline='' if _is_csv(filename) else None, encoding='utf-8') as f:
+        if _is_csv(filename):
+            reader = csv.DictReader(f)
+            missing = set(FIELDS[kind]) - set(reader.fieldnames or ())
+            if missing:
+                raise ValueError(f"{filename}: faltan columnas {', '.join(sorted(missing))}")
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    yield line_number, line
+
+
+def parse_record(raw, kind):
+    """Convierte una fila CSV o una linea NDJSON en un registro de schema (ValueError si esta incompleto)"""
+    if isinstance(raw, dict):
+        # DictReader fills missing columns with None and puts extra ones under the None key
+        if None in raw or None in raw.values():
+            raise ValueError(f"La fila debe tener {len(raw.keys() - {None})} columnas")
+        record = {field: _csv_value(field, raw[field]) for field in FIELDS[kind]}
+    else:
+        record = json.loads(raw)
+        if not isinstance(record, dict):
+            raise ValueError("Cada linea debe ser un objeto JSON")
+    missing = [field for field in FIELDS[kind] if field not in OPTIONAL_FIELDS and record.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"Faltan datos requeridos: {', '.join(missing)}")
+    return record
+
+
+class RecordWriter:
+    """Escribe registros de a uno en CSV o NDJSON segun la extension"""
+
+    def __init__(self, filename, kind):
+        self._file = open(filename, 'w', newline='', encoding='utf-8')
+        self._csv = None
+        if _is_csv(filename):
+            self._csv = csv.DictWriter(self._file, fieldnames=FIELDS[kind])
+            self._csv.writeheader()
+
+    def write(self, record):
+        if self._csv is not None:
+            if record.get("confirmation") is not None:
+                record = dict(record, confirmation=str(record["confirmation"]).lower())
+            self._csv.writerow(record)
+        else:
+            self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+class Progress:
+    """Reporta por stderr la cantidad de registros procesados y el ritmo"""
+
+    def __init__(self, label, every, stream=sys.stderr):
+        self.label = label
+        self.every = every
+        self.stream = stream
+        self.count = 0
+        self.errors = 0
+        self._start = time.perf_counter()
+
+    def tick(self):
+        self.count += 1
+        if self.every and self.count % self.every == 0:
+            self.report()
+
+    def report(self, final=False):
+        elapsed = time.perf_counter() - self._start
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        suffix = f", {self.errors} con error" if self.errors else ""
+        label = f"{self.label} (total)" if final else self.label
+        print(f"{label}: {self.count} registros en {elapsed:.1f} s ({rate:,.0f}/s){suffix}", file=self.stream)
+
+
+def import_files(handler, users=None, rides=None, participations=None, progress_every=100_000, stream=sys.stderr):
+    """Carga los archivos en el handler (usuarios, luego rides, luego participaciones) y persiste una vez.
+
+    Los registros invalidos se informan con su numero de linea y se saltan.
+    Retorna {tipo: (importados, con error)}.
+    """
+    loaders = (("users", users, handler._load_user), ("rides", rides, handler._load_ride),
+               ("participations", participations, handler._load_participation))
+    summary = {}
+    # Like load_data: the departure indexes are sorted once at the end instead of inserting each ride
+    handler._suspend_time_index()
+    try:
+        for kind, filename, loader in loaders:
+            if filename is None:
+                continue
+            progress = Progress(kind, progress_every, stream)
+            for line_number, raw in read_records(filename, kind):
+                try:
+                    loader(parse_record(raw, kind))
+                except (KeyError, TypeError, ValueError) as e:
+                    progress.errors += 1
+                    print(f"{filename}:{line_number}: {e!r}", file=stream)
+                    continue
+                progress.tick()
+            progress.report(final=True)
+            summary[kind] = (progress.count, progress.errors)
+    finally:
+        handler._build_time_index()
+    handler.save_data()
+    return summary
+
+
+def _iter_participation_records(rides):
+    for ride in rides:
+        with ride.lock:
+            records = [schema.participation_record(ride, participation) for participation in ride.participants]
+        yield from records
+
+
+def export_files(handler, users=None, rides=None, participations=None, progress_every=100_000, stream=sys.stderr):
+    """Escribe los registros del handler sin armar las listas completas en memoria"""
+    exports = (("users", users, lambda: (schema.user_record(user) for user in handler._all_users())),
+               ("rides", rides, lambda: (schema.ride_record(ride) for ride in handler._all_rides())),
+               ("participations", participations, lambda: _iter_participation_records(handler._all_rides())))
+    summary = {}
+    for kind, filename, records in exports:
+        if filename is None:
+            continue
+        progress = Progress(kind, progress_every, stream)
+        writer = RecordWriter(filename, kind)
+        try:
+            for record in records():
+                writer.write(record)
+                progress.tick()
+        finally:
+            writer.close()
+        progress.report(final=True)
+        summary[kind] = progress.count
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.bulk", description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("--data", default="data.json", help="data.json a completar o exportar")
+    parser.add_argument("--users")
+    parser.add_argument("--rides")
+    parser.add_argument("--participations")
+    parser.add_argument("--progress-every", type=int, default=100_000,
+                        help="Registros entre reportes de progreso (0 = solo al final)")
+    args = parser.parse_args(argv)
+    if not (args.users or args.rides or args.participations):
+        parser.error("indicar al menos uno de --users, --rides, --participations")
+
+    handler = DataHandler(filename=args.data)
+    files = {"users": args.users, "rides": args.rides, "participations": args.participations}
+    try:
+        if args.command == "import":
+            summary = import_files(handler, progress_every=args.progress_every, **files)
+            return 1 if any(errors for _, errors in summary.values()) else 0
+        export_files(handler, progress_every=args.progress_every, **files)
+        return 0
+    finally:
+        handler.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
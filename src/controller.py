@@ -1,8 +1,294 @@
-from flask import Flask, jsonify, request
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+from flask import Flask, Response, g, jsonify, request
+from src import metrics
 from src.data_handler import DataHandler
+from src.lazy_data_handler import LazyDataHandler
+from src.shard_data_handler import ShardDataHandler
+from src.sqlite_data_handler import SqliteDataHandler
+from src.models.ride import BatchOperationError, Ride
+from src.models.status import PARTICIPATION_STATUSES, RIDE_STATUSES
+from src.models.user import User
+from src.storage import snapshot, sqlite_store
+from src.storage.archive import RideArchive
+from src.storage.response_cache import ResponseCache
+from src.storage.wal import WriteAheadLog
 
 app = Flask(__name__)
-data_handler = DataHandler()
+
+
+def _create_data_handler():
+    """Arma el DataHandler segun las variables de entorno RIDES_*"""
+    # RIDES_WRITE_BEHIND_MS=<ms> responde sin esperar a la escritura y la hace como mucho cada <ms>
+    write_behind_ms = os.environ.get('RIDES_WRITE_BEHIND_MS')
+    persistence = {
+        'write_behind': write_behind_ms is not None,
+        'flush_interval_ms': int(write_behind_ms or 50),
+        'flush_max_changes': int(os.environ.get('RIDES_WRITE_BEHIND_MAX_CHANGES', 100))
+    }
+    # RIDES_RESPONSE_CACHE_SIZE=<n> respuestas JSON cacheadas para los GET de usuarios y rides (0 lo desactiva)
+    response_cache_size = int(os.environ.get('RIDES_RESPONSE_CACHE_SIZE', 10000))
+
+    # RIDES_SHARD=<i>/<n> corre como el worker i de n del modo sharding (ver src/sharding.py), con
+    # data-<i>.json en RIDES_SHARD_DIR
+    shard = os.environ.get('RIDES_SHARD')
+    if shard:
+        index, shards = (int(part) for part in shard.split('/'))
+        return ShardDataHandler(index, shards, os.environ.get('RIDES_SHARD_DIR', '.'),
+                                response_cache_size=response_cache_size, **persistence)
+
+    # RIDES_SQLITE=<archivo> guarda todo en una base SQLite (se genera desde data.json si no existe).
+    # Cada mutacion es su propia transaccion, asi que las opciones de write-behind no aplican
+    sqlite_filename = os.environ.get('RIDES_SQLITE')
+    if sqlite_filename:
+        if not os.path.exists(sqlite_filename):
+            sqlite_store.write_from_handler(DataHandler(), sqlite_filename)
+        return SqliteDataHandler(sqlite_filename, cache_size=int(os.environ.get('RIDES_CACHE_SIZE', 10000)),
+                                 response_cache_size=response_cache_size)
+
+    # RIDES_SNAPSHOT=<archivo> arranca en modo lazy sobre un snapshot indexado (se genera desde data.json si no existe)
+    snapshot_filename = os.environ.get('RIDES_SNAPSHOT')
+    if snapshot_filename:
+        if not os.path.exists(snapshot_filename):
+            snapshot.write_from_handler(DataHandler(), snapshot_filename)
+        return LazyDataHandler(snapshot_filename, cache_size=int(os.environ.get('RIDES_CACHE_SIZE', 10000)),
+                               response_cache_size=response_cache_size, **persistence)
+
+    # RIDES_WAL=<archivo> activa la persistencia por log de eventos en lugar de reescribir data.json
+    wal_filename = os.environ.get('RIDES_WAL')
+    # RIDES_ARCHIVE_DIR=<directorio> archiva los rides terminados hace mas de RIDES_ARCHIVE_AFTER_DAYS dias (30)
+    archive_directory = os.environ.get('RIDES_ARCHIVE_DIR')
+    return DataHandler(wal=WriteAheadLog(wal_filename) if wal_filename else None,
+                       response_cache_size=response_cache_size,
+                       archive=RideArchive(archive_directory) if archive_directory else None,
+                       archive_after_s=float(os.environ.get('RIDES_ARCHIVE_AFTER_DAYS', 30)) * 86400, **persistence)
+
+
+with metrics.span('load_data'):
+    data_handler = _create_data_handler()
+# Al apagar el proceso se escriben los cambios pendientes
+atexit.register(data_handler.close)
+
+# RIDES_METRICS=0 desactiva la medicion de latencias (GET /metrics sigue mostrando los contadores)
+app.config.setdefault('METRICS_ENABLED', os.environ.get('RIDES_METRICS', '1') != '0')
+# RIDES_PROFILING=1 permite perfilar un request mandando el header X-Profile: 1
+app.config.setdefault('PROFILING_ENABLED', os.environ.get('RIDES_PROFILING') == '1')
+PROFILE_INTERVAL_S = int(os.environ.get('RIDES_PROFILE_INTERVAL_MS', 1)) / 1000
+if app.config['METRICS_ENABLED']:
+    metrics.instrument_handler(data_handler)
+    metrics.instrument_models()
+
+MAX_PAGE_LIMIT = 1000
+MAX_BATCH_OPERATIONS = 1000
+MAX_MATCH_WINDOW_HOURS = 24
+PARTICIPATION_RIDE_FIELDS = set(Ride.INFO_FIELDS) - {"participants"}
+STREAM_CHUNK_SIZE = 64 * 1024  # Bytes acumulados antes de entregar un chunk al servidor
+# STREAM_LIST_RESPONSES=True hace que los listados se transmitan siempre; si no, con ?stream=true
+app.config.setdefault('STREAM_LIST_RESPONSES', os.environ.get('RIDES_STREAM_LISTS') == '1')
+
+
+def _pagination_args(valid_cursor=str.isdigit):
+    """Lee limit y cursor de la query string"""
+    limit = request.args.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or not 1 <= int(limit) <= MAX_PAGE_LIMIT:
+            raise ValueError(f"limit debe ser un entero entre 1 y {MAX_PAGE_LIMIT}")
+        limit = int(limit)
+    cursor = request.args.get('cursor')
+    if cursor is not None and not valid_cursor(cursor):
+        raise ValueError("cursor invalido")
+    return limit, cursor
+
+
+def _fields_arg(allowed_fields):
+    """Lee la proyeccion fields=a,b,c de la query string (None = todos los campos)"""
+    fields = request.args.get('fields')
+    if fields is None:
+        return None
+    fields = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = fields - set(allowed_fields)
+    if unknown:
+        raise ValueError(f"Campos desconocidos: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def _datetime_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, Ride.RIDE_DATETIME_FORMAT)
+    except ValueError:
+        raise ValueError(f"{name} debe tener el formato AAAA/MM/DD HH:MM")
+
+
+def _statuses_arg(name, allowed_statuses):
+    """Lee un filtro de estados separados por comas (None = sin filtro)"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    statuses = {status.strip() for status in value.split(',') if status.strip()}
+    unknown = statuses - set(allowed_statuses)
+    if unknown:
+        raise ValueError(f"{name} invalido: {', '.join(sorted(unknown))}")
+    return statuses
+
+
+def _stream_json_array(items, encode):
+    """Genera el arreglo JSON por partes, serializando un elemento a la vez"""
+    chunk = ['[']
+    size = 1
+    for index, item in enumerate(items):
+        encoded = encode(item)
+        chunk.append(',' + encoded if index else encoded)
+        size += len(encoded) + 1
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    chunk.append(']')
+    yield ''.join(chunk)
+
+
+def _streaming_requested():
+    return app.config['STREAM_LIST_RESPONSES'] or request.args.get('stream', '').lower() in ('1', 'true')
+
+
+def _encode(payload):
+    """JSON compacto con claves ordenadas, como jsonify"""
+    return app.json.dumps(payload, separators=(',', ':'))
+
+
+def _list_response(items, serialize, next_cursor=None, encode=None):
+    """La lista va en el cuerpo como siempre; el cursor de la siguiente pagina en X-Next-Cursor.
+
+    encode(item) retorna el JSON ya serializado de un elemento (p. ej. el cacheado
+    de cada ride) y reemplaza a serialize. En modo streaming cada elemento se
+    serializa recien cuando el cliente lo consume, asi que nunca se tiene la
+    lista completa serializada en memoria.
+    """
+    if encode is None:
+        def encode(item):
+            return _encode(serialize(item))
+    if _streaming_requested():
+        response = Response(_stream_json_array(items, encode), mimetype='application/json')
+    else:
+        response = Response(f"[{','.join(encode(item) for item in items)}]\n", mimetype='application/json')
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+
+def _ride_encoder(fields):
+    """Sin proyeccion, cada ride reutiliza su JSON cacheado (ver Ride.get_ride_info_json)"""
+    return Ride.get_ride_info_json if fields is None else None
+
+
+def _cached_response(key, build):
+    """Responde con el JSON cacheado de key, o lo arma con build() -> (JSON serializado, dependencias).
+
+    Lleva ETag y responde 304 si coincide con If-None-Match.
+    """
+    cache = data_handler.response_cache
+    entry = cache.get(key)
+    if entry is None:
+        token = cache.token()
+        body, dependencies = build()
+        entry = cache.put(key, f"{body}\n".encode(), dependencies, token)
+        hit = False
+    else:
+        hit = True
+    body, etag = entry
+    if request.if_none_match.contains(etag):
+        cache.record_not_modified()
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+
+@app.before_request
+def _start_request_metrics():
+    if app.config['METRICS_ENABLED']:
+        g.request_start = time.perf_counter()
+    if app.config['PROFILING_ENABLED'] and request.headers.get('X-Profile') == '1':
+        g.profiler = metrics.SamplingProfiler(threading.get_ident(), PROFILE_INTERVAL_S).start()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    """Registra la latencia del endpoint; un request perfilado devuelve el id del perfil en X-Profile-Id"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        response.headers['X-Profile-Id'] = str(metrics.profiles.add(profiler.stop()))
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Streaming responses are timed up to the first byte, before the body is generated
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.request_latency.observe(time.perf_counter() - start, endpoint, request.method)
+        metrics.responses.inc(endpoint, request.method, str(response.status_code))
+    return response
+
+
+@app.before_request
+def _begin_shard_request():
+    if isinstance(data_handler, ShardDataHandler):
+        data_handler.begin_request()
+
+
+@app.after_request
+def _attach_shard_stats(response):
+    """En modo sharding, los contadores locales que cambio el request van en X-Shard-Stats para el router"""
+    if isinstance(data_handler, ShardDataHandler):
+        changed = data_handler.changed_stats()
+        if changed is not None:
+            response.headers['X-Shard-Stats'] = app.json.dumps(changed, separators=(',', ':'))
+    return response
+
+
+@app.teardown_request
+def _stop_profiler(exc):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+
+
+@app.errorhandler(sqlite_store.StorageError)
+def _storage_error(e):
+    """La base no confirmo el cambio (bloqueada, llena, ...): no quedo aplicado y se puede reintentar"""
+    return jsonify({"error": str(e)}), 503
+
+
+def _register_metric_collectors():
+    """Contadores que ya llevan el cache de respuestas y la persistencia, leidos al pedir /metrics"""
+    def cache_stat(name):
+        return lambda: [((), data_handler.response_cache.stats()[name])]
+
+    def persisted_bytes():
+        stats = data_handler.persistence_stats()
+        return [((("target", "snapshot"),), stats["snapshotBytes"]), ((("target", "wal"),), stats["walBytes"]),
+                ((("target", "archive"),), stats["archiveBytes"])]
+
+    metrics.registry.collector("rides_response_cache_hits_total", "counter",
+                               "GET servidos desde el cache de respuestas", cache_stat("hits"))
+    metrics.registry.collector("rides_response_cache_misses_total", "counter",
+                               "GET que tuvieron que serializar la respuesta", cache_stat("misses"))
+    metrics.registry.collector("rides_response_cache_entries", "gauge",
+                               "Respuestas guardadas en el cache", cache_stat("entries"))
+    metrics.registry.collector("rides_snapshot_writes_total", "counter", "Escrituras completas del archivo de datos",
+                               lambda: [((), data_handler.persistence_stats()["snapshotWrites"])])
+    metrics.registry.collector("rides_persisted_bytes_total", "counter",
+                               "Bytes escritos en el archivo de datos, el WAL y el archivo de rides", persisted_bytes)
+    metrics.registry.collector("rides_archived", "gauge", "Rides terminados movidos al archivo",
+                               lambda: [((), data_handler.persistence_stats()["archivedRides"])])
+
+
+_register_metric_collectors()
 
 
 # CREATE USER ENDPOINT (Missing)
@@ -26,9 +312,15 @@ def crear_usuario():
 
 @app.route('/usuarios', methods=['GET'])
 def listar_usuarios():
-    """Retorna lista de usuarios"""
-    usuarios = [usuario.get_user_info() for usuario in data_handler.users]
-    return jsonify(usuarios), 200
+    """Retorna lista de usuarios (paginable con limit/cursor y proyectable con fields)"""
+    try:
+        limit, cursor = _pagination_args()
+        fields = _fields_arg(User.INFO_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    usuarios, next_cursor = data_handler.list_users(cursor=cursor, limit=limit)
+    return _list_response(usuarios, lambda usuario: usuario.get_user_info(fields), next_cursor)
 
 
 @app.route('/usuarios/<alias>', methods=['GET'])
@@ -36,7 +328,8 @@ def obtener_usuario(alias):
     """Retorna los datos del usuario"""
     usuario = data_handler.get_user(alias)
     if usuario:
-        return jsonify(usuario.get_user_info()), 200
+        return _cached_response(("user", alias), lambda: (usuario.get_user_info_json(),
+                                                          ResponseCache.driver_dependencies(usuario)))
     return jsonify({"error": "Usuario no encontrado"}), 404
 
 
@@ -68,17 +361,208 @@ def crear_ride(alias):
 def obtener_rides_usuario(alias):
     """Retorna los datos de los rides creados por el usuario"""
     usuario = data_handler.get_user(alias)
-    if usuario:
-        return jsonify([ride.get_ride_info() for ride in usuario.rides]), 200
-    return jsonify({"error": "Usuario no encontrado"}), 404
+    if not usuario:
+        return jsonify({"error": "Usuario no encontrado"}), 404
+    if _streaming_requested():
+        return _list_response(usuario.rides, None, encode=Ride.get_ride_info_json)
+    return _cached_response(("user_rides", alias), lambda: (
+        f"[{','.join(ride.get_ride_info_json() for ride in usuario.rides)}]", ResponseCache.driver_dependencies(usuario)))
+
+
+@app.route('/usuarios/<alias>/participations', methods=['GET'])
+def obtener_participaciones_usuario(alias):
+    """Retorna los rides a los que el usuario pidio unirse, con el estado de su solicitud.
+
+    Filtra con status (estado de la participacion, p. ej. status=waiting,confirmed)
+    y rideStatus (estado del ride). Pagina con limit/cursor; fields proyecta los
+    datos del ride (por defecto todos menos participants).
+    """
+    usuario = data_handler.get_user(alias)
+    if not usuario:
+        return jsonify({"error": "Usuario no encontrado"}), 404
+    try:
+        limit, cursor = _pagination_args()
+        fields = _fields_arg(Ride.INFO_FIELDS) or PARTICIPATION_RIDE_FIELDS
+        statuses = _statuses_arg('status', PARTICIPATION_STATUSES)
+        ride_statuses = _statuses_arg('rideStatus', RIDE_STATUSES)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    participaciones, next_cursor = data_handler.find_participations(
+        usuario, statuses=statuses, ride_statuses=ride_statuses, cursor=cursor, limit=limit)
+    return _list_response(participaciones, lambda item: {
+        "ride": item[0].get_ride_info(fields),
+        "destination": item[1].destination,
+        "occupiedSpaces": item[1].occupied_spaces,
+        "confirmation": item[1].confirmation,
+        "status": item[1].status
+    }, next_cursor)
+
+
+@app.route('/_shard/stats', methods=['GET'])
+def contadores_shard():
+    """Modo sharding: contadores de historial que aportan los rides de este shard"""
+    if not isinstance(data_handler, ShardDataHandler):
+        return jsonify({"error": "No es un worker del modo sharding"}), 404
+    return jsonify(data_handler.all_local_stats()), 200
+
+
+@app.route('/_shard/stats', methods=['POST'])
+def recibir_contadores_shard():
+    """Modo sharding: el router reenvia los contadores que cambiaron en otro shard"""
+    if not isinstance(data_handler, ShardDataHandler):
+        return jsonify({"error": "No es un worker del modo sharding"}), 404
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("users"), dict):
+        return jsonify({"error": "Se esperaba {shard, seq, users}"}), 400
+    data_handler.apply_remote_stats(int(data["shard"]), int(data["seq"]), data["users"])
+    return jsonify({"message": "Contadores actualizados"}), 200
 
 
 # LIST ACTIVE RIDES ENDPOINT (Missing)
 @app.route('/rides/active', methods=['GET'])
 def listar_rides_activos():
-    """Retorna lista de rides activos"""
-    rides_activos = data_handler.get_active_rides()
-    return jsonify([ride.get_ride_info() for ride in rides_activos]), 200
+    """Retorna lista de rides activos, filtrable por driver, from, to y hasFreeSpaces"""
+    try:
+        limit, cursor = _pagination_args()
+        fields = _fields_arg(Ride.INFO_FIELDS)
+        date_from = _datetime_arg('from')
+        date_to = _datetime_arg('to')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    driver = None
+    driver_alias = request.args.get('driver')
+    if driver_alias is not None:
+        driver = data_handler.get_user(driver_alias)
+        if not driver:
+            return _list_response([], None)
+
+    rides_activos, next_cursor = data_handler.find_active_rides(
+        driver=driver,
+        date_from=date_from,
+        date_to=date_to,
+        has_free_spaces=request.args.get('hasFreeSpaces', '').lower() in ('1', 'true'),
+        cursor=cursor,
+        limit=limit
+    )
+    return _list_response(rides_activos, lambda ride: ride.get_ride_info(fields), next_cursor, _ride_encoder(fields))
+
+
+def _is_time_cursor(cursor):
+    """Cursor de GET /rides: "departure_ts:id" del ultimo ride entregado (departure_ts es negativo antes de 1970)"""
+    departure_ts, _, ride_id = cursor.partition(':')
+    try:
+        int(departure_ts)
+    except ValueError:
+        return False
+    return ride_id.isdigit()
+
+
+@app.route('/rides', methods=['GET'])
+def listar_rides_por_hora():
+    """Retorna los rides que salen entre from y to, ordenados por hora de salida.
+
+    active=true deja solo rides ready / inprogress y hasFreeSpaces=true solo rides
+    ready con espacios libres (p. ej. from=<ahora>&hasFreeSpaces=true&limit=N para
+    los proximos N con cupo). Pagina con limit/cursor y proyecta con fields.
+    """
+    try:
+        limit, cursor = _pagination_args(valid_cursor=_is_time_cursor)
+        fields = _fields_arg(Ride.INFO_FIELDS)
+        date_from = _datetime_arg('from')
+        date_to = _datetime_arg('to')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    rides, next_cursor = data_handler.find_rides_by_time(
+        date_from=date_from,
+        date_to=date_to,
+        active_only=request.args.get('active', '').lower() in ('1', 'true'),
+        has_free_spaces=request.args.get('hasFreeSpaces', '').lower() in ('1', 'true'),
+        cursor=cursor,
+        limit=limit
+    )
+    return _list_response(rides, lambda ride: ride.get_ride_info(fields), next_cursor, _ride_encoder(fields))
+
+
+@app.route('/rides/search', methods=['GET'])
+def buscar_rides():
+    """Retorna los rides activos cuyo destino mejor coincide con q, del mayor puntaje al menor.
+
+    Busca en finalAddress y en los destinos de los participantes, sin importar
+    tildes ni mayusculas y tolerando errores de tipeo. limit (20 por defecto)
+    acota la cantidad de resultados y fields proyecta cada ride.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Falta el parametro q"}), 400
+    try:
+        limit, _ = _pagination_args()
+        fields = _fields_arg(Ride.INFO_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = data_handler.search_rides(query, limit=limit or 20)
+    encode = None
+    if fields is None:
+        def encode(result):
+            return f'{{"ride":{result[0].get_ride_info_json()},"score":{_encode(round(result[1], 4))}}}'
+    return _list_response(results, lambda result: {"score": round(result[1], 4),
+                                                   "ride": result[0].get_ride_info(fields)}, encode=encode)
+
+
+@app.route('/rides/match', methods=['GET'])
+def sugerir_rides():
+    """Sugiere a un pasajero los rides ready con espacios libres que mejor le sirven, del mayor puntaje al menor.
+
+    destination y la ventana de salida from / to son obligatorios (la ventana de
+    hasta MAX_MATCH_WINDOW_HOURS horas); at es la hora preferida, por defecto el
+    centro de la ventana. El puntaje combina la cercania a at, la similitud de
+    destination con finalAddress y la confiabilidad del conductor. rider omite
+    los rides de ese usuario y los que ya pidio. limit (10 por defecto) acota
+    los resultados y fields proyecta cada ride.
+    """
+    destination = request.args.get('destination', '').strip()
+    if not destination:
+        return jsonify({"error": "Falta el parametro destination"}), 400
+    try:
+        limit, _ = _pagination_args()
+        fields = _fields_arg(Ride.INFO_FIELDS)
+        date_from = _datetime_arg('from')
+        date_to = _datetime_arg('to')
+        at = _datetime_arg('at')
+        if date_from is None or date_to is None:
+            raise ValueError("Faltan los parametros from y to")
+        if date_from > date_to:
+            raise ValueError("from debe ser anterior a to")
+        if (date_to - date_from).total_seconds() > MAX_MATCH_WINDOW_HOURS * 3600:
+            raise ValueError(f"La ventana no puede superar {MAX_MATCH_WINDOW_HOURS} horas")
+        if at is not None and not date_from <= at <= date_to:
+            raise ValueError("at debe estar entre from y to")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rider = None
+    if 'rider' in request.args:
+        rider = data_handler.get_user(request.args['rider'])
+        if rider is None:
+            return jsonify({"error": "Usuario no encontrado"}), 404
+
+    results = data_handler.match_rides(destination, date_from, date_to, at=at, limit=limit or 10, rider=rider)
+
+    def serialize(result):
+        item = {key: round(value, 4) for key, value in result[1].items()}
+        item["ride"] = result[0].get_ride_info(fields)
+        return item
+
+    encode = None
+    if fields is None:
+        def encode(result):
+            scores = {key: _encode(round(value, 4)) for key, value in result[1].items()}
+            return (f'{{"addressScore":{scores["addressScore"]},"driverReliability":{scores["driverReliability"]},'
+                    f'"ride":{result[0].get_ride_info_json()},"score":{scores["score"]},'
+                    f'"timeScore":{scores["timeScore"]}}}')
+    return _list_response(results, serialize, encode=encode)
 
 
 @app.route('/usuarios/<alias>/rides/<ride_id>', methods=['GET'])
@@ -92,8 +576,31 @@ def obtener_ride(alias, ride_id):
     if not ride:
         return jsonify({"error": "Ride no encontrado"}), 404
 
-    ride_info = ride.get_ride_info()
-    return jsonify({"ride": ride_info}), 200
+    return _cached_response(("ride", ride.id), lambda: (f'{{"ride":{ride.get_ride_info_json()}}}',
+                                                        ResponseCache.ride_dependencies(ride)))
+
+
+@app.route('/metrics/cache', methods=['GET'])
+def metricas_cache():
+    """Aciertos, fallos e invalidaciones del cache de respuestas"""
+    return jsonify(data_handler.response_cache.stats()), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metricas():
+    """Latencias por endpoint, spans de DataHandler y contadores, en el formato de texto de Prometheus"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4'), 200
+
+
+@app.route('/metrics/profiles/<int:profile_id>', methods=['GET'])
+def obtener_perfil(profile_id):
+    """Pilas muestreadas de un request perfilado con X-Profile: 1, en formato collapsed (flamegraph.pl)"""
+    profile = metrics.profiles.get(profile_id)
+    if profile is None:
+        return jsonify({"error": "Perfil no encontrado"}), 404
+    response = Response(profile.collapsed(), mimetype='text/plain')
+    response.headers['X-Profile-Duration-Ms'] = f"{profile.duration * 1000:.3f}"
+    return response, 200
 
 
 @app.route('/usuarios/<alias>/rides/<ride_id>/requestToJoin/<participant_alias>', methods=['POST'])
@@ -117,8 +624,7 @@ def solicitar_unirse_ride(alias, ride_id, participant_alias):
         if not destination:
             return jsonify({"error": "Destino es requerido"}), 400
 
-        ride.add_participant(participant, destination)
-        data_handler.save_data()
+        data_handler.join_ride(ride, participant, destination)
         return jsonify({"message": "Solicitud de union al ride realizada"}), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 422
@@ -144,8 +650,7 @@ def aceptar_solicitud_ride(alias, ride_id, participant_alias):
         if not participant:
             return jsonify({"error": "Participante no encontrado"}), 404
 
-        ride.accept_participant(participant)
-        data_handler.save_data()
+        data_handler.accept_participant(ride, participant)
         return jsonify({"message": "Solicitud aceptada"}), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 422
@@ -171,8 +676,7 @@ def rechazar_solicitud_ride(alias, ride_id, participant_alias):
         if not participant:
             return jsonify({"error": "Participante no encontrado"}), 404
 
-        ride.reject_participant(participant)
-        data_handler.save_data()
+        data_handler.reject_participant(ride, participant)
         return jsonify({"message": "Solicitud rechazada"}), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 422
@@ -194,8 +698,7 @@ def iniciar_ride(alias, ride_id):
         if ride.driver.alias != alias:
             return jsonify({"error": "Solo el conductor puede iniciar el ride"}), 422
 
-        ride.start_ride()
-        data_handler.save_data()
+        data_handler.start_ride(ride)
         return jsonify({"message": "Ride iniciado", "ride": ride.get_ride_info()}), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 422
@@ -217,8 +720,7 @@ def terminar_ride(alias, ride_id):
         if ride.driver.alias != alias:
             return jsonify({"error": "Solo el conductor puede terminar el ride"}), 422
 
-        ride.end_ride()
-        data_handler.save_data()
+        data_handler.end_ride(ride)
         return jsonify({"message": "Ride terminado", "ride": ride.get_ride_info()}), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 422
@@ -244,12 +746,81 @@ def bajar_participante_ride(alias, ride_id):
         if not participant:
             return jsonify({"error": "Participante no encontrado"}), 404
 
-        ride.unload_participant(participant)
-        data_handler.save_data()
+        data_handler.unload_participant(ride, participant)
         return jsonify({"message": "Participante bajado del ride", "ride": ride.get_ride_info()}), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 422
 
 
+def _batch_operations_arg(data):
+    """Valida el cuerpo {"operations": [{"action", "participant_alias"}, ...]} de un lote"""
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not 1 <= len(operations) <= MAX_BATCH_OPERATIONS:
+        raise ValueError(f"operations debe ser una lista de 1 a {MAX_BATCH_OPERATIONS} operaciones")
+    for operation in operations:
+        if not isinstance(operation, dict) or not isinstance(operation.get('participant_alias'), str):
+            raise ValueError("Cada operacion requiere action y participant_alias")
+        if operation.get('action') not in Ride.BATCH_ACTIONS:
+            raise ValueError(f"action debe ser una de: {', '.join(Ride.BATCH_ACTIONS)}")
+    return [(operation['action'], operation['participant_alias']) for operation in operations]
+
+
+def _batch_failure(operations, index, error, applied=True):
+    """Respuesta de un lote que no se aplico: la operacion index fallo y el resto quedo sin efecto.
+
+    applied indica si las anteriores a index llegaron a aplicarse (y se deshicieron)
+    o si el lote fallo antes de empezar, al validarlo.
+    """
+    results = []
+    for position, (action, participant_alias) in enumerate(operations):
+        result = {"action": action, "participant_alias": participant_alias}
+        if position < index:
+            result["status"] = "rolledBack" if applied else "notApplied"
+        elif position == index:
+            result.update(status="error", error=error)
+        else:
+            result["status"] = "notApplied"
+        results.append(result)
+    return jsonify({"error": error, "failedIndex": index, "results": results}), 422
+
+
+@app.route('/usuarios/<alias>/rides/<ride_id>/batch', methods=['POST'])
+def aplicar_lote_ride(alias, ride_id):
+    """Aceptar, rechazar y bajar varios participantes en una sola operacion atomica"""
+    usuario = data_handler.get_user(alias)
+    if not usuario:
+        return jsonify({"error": "Usuario no encontrado"}), 404
+
+    ride = data_handler.get_ride(ride_id)
+    if not ride:
+        return jsonify({"error": "Ride no encontrado"}), 404
+
+    try:
+        operations = _batch_operations_arg(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Accept and reject are driver-only, as in the single-operation endpoints
+    if ride.driver.alias != alias and any(action != "unload" for action, _ in operations):
+        return jsonify({"error": "Solo el conductor puede aceptar o rechazar solicitudes"}), 422
+
+    resolved = []
+    for index, (action, participant_alias) in enumerate(operations):
+        participant = data_handler.get_user(participant_alias)
+        if not participant:
+            return _batch_failure(operations, index, "Participante no encontrado", applied=False)
+        resolved.append((action, participant))
+
+    try:
+        statuses = data_handler.apply_operations(ride, resolved)
+    except BatchOperationError as e:
+        return _batch_failure(operations, e.index, str(e))
+
+    results = [{"action": action, "participant_alias": participant_alias, "status": "ok",
+                "participationStatus": status}
+               for (action, participant_alias), status in zip(operations, statuses)]
+    return jsonify({"message": "Operaciones aplicadas", "results": results}), 200
+
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
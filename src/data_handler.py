@@ -1,95 +1,858 @@
+import bisect
 import json
-from src.models.ride import Ride  # Asegúrate de que la importación de Ride esté al inicio
+import os
+import threading
+import time
+from datetime import datetime
+from src.models.ride import BatchOperationError, Ride  # Asegúrate de que la importación de Ride esté al inicio
+from src.models.RideParticipation import RideParticipation
+from src.models.status import RIDE_STATUSES
 from src.models.user import User
+from src.storage import schema, snapshot
+from src.storage.atomic import write_chunks_atomic, write_json_atomic
+from src.storage.cache import ObjectCache
+from src.storage.match_index import MatchIndex
+from src.storage.response_cache import ResponseCache
+from src.storage.search_index import DestinationIndex
+from src.storage.writer import SnapshotWriter
+
 
 class DataHandler:
-    def __init__(self, filename='data.json'):
+    """Estado en memoria de usuarios y rides y su persistencia.
+
+    Es seguro usarlo desde varios hilos: los registros de usuarios y rides se
+    protegen con un lock del handler, cada ride se modifica bajo su propio lock
+    y data.json lo escribe un unico hilo (ver SnapshotWriter). Orden de locks:
+    ride.lock -> DataHandler._lock -> lock del WAL.
+
+    Esta clase es tambien la interfaz de los backends de almacenamiento: el
+    controller solo usa sus metodos publicos, y LazyDataHandler y
+    SqliteDataHandler la extienden redefiniendo load_data, get_user/get_ride,
+    _log/_persist y los hooks _index_*, _ride_changed y _user_changed.
+
+    Con archive (un RideArchive) los rides terminados que salieron hace mas de
+    archive_after_s segundos se mueven a disco (ver archive_done_rides) y
+    get_ride los vuelve a leer bajo demanda. Es para este backend, que tiene
+    todo en memoria; LazyDataHandler y SqliteDataHandler ya retienen solo lo
+    que se usa.
+    """
+
+    def __init__(self, filename='data.json', wal=None, write_behind=False, flush_interval_ms=50,
+                 flush_max_changes=100, response_cache_size=10000, archive=None, archive_after_s=30 * 86400,
+                 archive_interval_s=60, archive_cache_size=1000):
         self.filename = filename
+        self.wal = wal  # WriteAheadLog opcional; si es None cada cambio reescribe el archivo
+        self.archive = archive  # RideArchive opcional para los rides terminados
+        self.archive_after_s = archive_after_s
+        self.archive_interval_s = archive_interval_s  # Cada cuanto las mutaciones revisan si hay que archivar
+        self._next_archive_check = time.monotonic() + archive_interval_s
+        self._archived_rides = ObjectCache(archive_cache_size)  # LRU de los rides archivados leidos
+        self._archive_lock = threading.Lock()  # Una pasada de archivado a la vez
+        # Con write_behind las mutaciones no esperan a data.json: se escribe como mucho cada
+        # flush_interval_ms o cada flush_max_changes cambios (la ventana que puede perder un crash)
+        self.write_behind = write_behind
         self.users = []
         self.rides = []
+        self._users_by_alias = {}  # alias -> User
+        self._rides_by_id = {}  # id -> Ride
+        self._active_rides = set()  # ids de los rides ready / inprogress
+        self._active_ride_ids = []  # los mismos ids ordenados, para paginar por cursor
+        # Indices por hora de salida: id -> departure_ts y listas ordenadas de (departure_ts, id)
+        # de todos los rides y de los activos. Los rides sin hora valida no se indexan.
+        self._departures = {}
+        self._time_index = []
+        self._active_time_index = []
+        self._search_index = None  # DestinationIndex de los rides activos, se arma en la primera busqueda
+        self._match_index = None  # MatchIndex para match_rides, se arma en el primer pedido
+        self.snapshot_seq = 0  # walSeq del snapshot cargado
+        self.snapshot_writes = 0  # Escrituras completas del archivo de datos y bytes escritos en ellas
+        self.snapshot_bytes = 0
+        self._lock = threading.RLock()
+        # JSON ya serializado de usuarios y rides para los GET; cada cambio invalida lo que afecta
+        self.response_cache = ResponseCache(response_cache_size)
+        # Fragmentos de data.json ya codificados: alias -> usuario e id -> (version del ride, ride y
+        # participaciones). Cada escritura solo vuelve a codificar los rides que cambiaron.
+        self._encoded_users = {}
+        self._encoded_rides = {}
+        if write_behind:
+            self._writer = SnapshotWriter(self._write_data_file, delay=flush_interval_ms / 1000,
+                                          max_pending=flush_max_changes)
+        else:
+            self._writer = SnapshotWriter(self._write_data_file)
+        # With a log the fsyncs awaited by on_persisted also go to a thread, grouped the same way
+        self._wal_syncer = SnapshotWriter(wal.sync) if wal is not None else None
+        self._compaction = None  # Thread integrando el log sellado al snapshot
+        self._compaction_lock = threading.Lock()
         self.load_data()
 
+    def _all_users(self):
+        with self._lock:
+            return list(self.users)
+
+    def _all_rides(self):
+        with self._lock:
+            return list(self.rides)
+
+    def _snapshot_data(self):
+        return schema.snapshot(self._all_users(), self._all_rides())
+
     def save_data(self):
-        data = {
-            'users': [user.get_user_info() for user in self.users],
-            'rides': [ride.get_ride_info() for ride in self.rides]
-        }
-        with open(self.filename, 'w') as f:
-            json.dump(data, f)
+        """Persiste el estado completo (en modo write-behind solo lo marca como pendiente)"""
+        if self.wal is not None:
+            self.compact(wait=True)
+        else:
+            self._writer.request(wait=not self.write_behind)
+
+    def on_persisted(self, callback):
+        """Llama callback(error) cuando los cambios hechos hasta ahora esten en disco, sin bloquear al llamador.
+
+        Pensado para el modo async (write-behind o con log): callback puede
+        llamarse desde el hilo escritor o desde el que hace el fsync del log.
+        """
+        if self.wal is not None:
+            # Events are already in the log; only the fsync may be pending
+            self._wal_syncer.request(wait=False)
+            self._wal_syncer.notify_when_written(callback)
+        else:
+            self._writer.notify_when_written(callback)
+
+    def flush(self):
+        """Escribe ya los cambios pendientes y espera a que queden en disco"""
+        if self.wal is not None:
+            self.wal.sync()
+        else:
+            self._writer.flush()
+
+    def _write_data_file(self):
+        chunks = schema.snapshot_chunks(map(self._encoded_user, self._all_users()),
+                                        map(self._encoded_ride, self._all_rides()))
+        self._record_snapshot_write(write_chunks_atomic(self.filename, chunks))
+
+    def _encoded_user(self, user):
+        # User records do not change after creation
+        encoded = self._encoded_users.get(user.alias)
+        if encoded is None:
+            encoded = self._encoded_users[user.alias] = schema.encode_user(user)
+        return encoded
+
+    def _encoded_ride(self, ride):
+        """schema.encode_ride(ride), reutilizado mientras ride.version no cambie"""
+        with ride.lock:
+            cached = self._encoded_rides.get(ride.id)
+            if cached is None or cached[0] != ride.version:
+                cached = self._encoded_rides[ride.id] = (ride.version, schema.encode_ride(ride))
+            return cached[1]
+
+    def _record_snapshot_write(self, written):
+        with self._lock:
+            self.snapshot_writes += 1
+            self.snapshot_bytes += written
+
+    def persistence_stats(self):
+        """Escrituras del snapshot y bytes escritos (snapshot y WAL) desde el arranque"""
+        with self._lock:
+            stats = {"snapshotWrites": self.snapshot_writes, "snapshotBytes": self.snapshot_bytes}
+        stats["walBytes"] = self.wal.bytes_written if self.wal is not None else 0
+        stats["archivedRides"] = len(self.archive) if self.archive is not None else 0
+        stats["archiveBytes"] = self.archive.bytes_written if self.archive is not None else 0
+        return stats
 
     def load_data(self):
         try:
             with open(self.filename, 'r') as f:
                 data = json.load(f)
+        except FileNotFoundError:
+            data = {}
 
-                # Load users
-                self.users = []
-                for user_data in data.get('users', []):
-                    user = User(user_data['alias'], user_data['name'], user_data.get('carPlate'))
-                    self.users.append(user)
-
-                # Load rides
-                self.rides = []
-                max_id = 0
-                for ride_data in data.get('rides', []):
-                    # Find the driver user object
-                    driver = self.get_user(ride_data['driver'])
-                    if driver:
-                        ride = Ride(
-                            ride_data['rideDateAndTime'],
-                            ride_data['finalAddress'],
-                            int(ride_data.get('allowedSpaces', 4)),  # Ensure int conversion
-                            driver,
-                            ride_data.get('status', 'ready')
-                        )
-                        ride.id = int(ride_data.get('id', len(self.rides) + 1))
-                        max_id = max(max_id, ride.id)
-
-                        # Load participants
-                        for participant_data in ride_data.get('participants', []):
-                            participant_user = self.get_user(participant_data['participant']['alias'])
-                            if participant_user:
-                                from src.models.RideParticipation import RideParticipation
-                                participation = RideParticipation(
-                                    participant_user,
-                                    participant_data['destination'],
-                                    participant_data.get('status', 'waiting')
-                                )
-                                participation.confirmation = participant_data.get('confirmation')
-                                participation.occupied_spaces = participant_data.get('occupiedSpaces', 1)
-                                ride.participants.append(participation)
-
-                        self.rides.append(ride)
-                        driver.add_ride(ride)
-
-                # Update the ID counter
-                Ride._id_counter = max_id + 1
+        data = schema.migrate(data)
+        self.snapshot_seq = data.get('walSeq', 0)
 
-        except FileNotFoundError:
-            self.users = []
-            self.rides = []
+        self.users = []
+        self._users_by_alias = {}
+        self.rides = []
+        self._rides_by_id = {}
+        self._active_rides = set()
+        self._active_ride_ids = []
+        self._reset_time_index()
+        self._search_index = None
+        self._match_index = None
+        self._encoded_users = {}
+        self._encoded_rides = {}
+        self._archived_rides = ObjectCache(self._archived_rides.capacity)
+        # Records that reference a missing user or ride are skipped. The data file wins over
+        # archived copies while loading, so get_ride must not fall back to the archive yet.
+        archive, self.archive = self.archive, None
+        try:
+            for loader, records in ((self._load_user, data['users']), (self._load_ride, data['rides']),
+                                    (self._load_participation, data['participations'])):
+                for record in records:
+                    try:
+                        loader(record)
+                    except ValueError:
+                        pass
+        finally:
+            self.archive = archive
+        if archive is not None:
+            self._load_archived_history()
+        self._build_time_index()
+
+        if self.wal is not None:
+            last_seq = self.snapshot_seq
+            for event in self.wal.read(after_seq=self.snapshot_seq):
+                self._apply_event(event)
+                last_seq = event['seq']
+            self.wal.open(last_seq)
+            # A compaction interrupted by a crash left its sealed segment behind
+            if os.path.exists(self.wal.sealed_filename):
+                self._fold_sealed_segment()
+
+        if archive is not None:
+            # Rides archived right before a crash can still be in the data file
+            with self._lock:
+                leftovers = [ride for ride in self.rides if ride.id in archive]
+            self._drop_archived(leftovers)
+
+    def _load_archived_history(self):
+        """Agrega a cada usuario las participaciones de los rides archivados (contadores e indice inverso)"""
+        history = {}  # alias -> ([ride ids], {estado: cantidad})
+        for alias, ride_id, status in self.archive.participations():
+            # A ride still in the data file already counted its participations
+            if ride_id in self._rides_by_id:
+                continue
+            ride_ids, counts = history.setdefault(alias, ([], {}))
+            ride_ids.append(ride_id)
+            counts[status] = counts.get(status, 0) + 1
+        for alias, (ride_ids, counts) in history.items():
+            user = self.get_user(alias)
+            if user is None:
+                continue
+            user.joined_ride_ids[:0] = ride_ids
+            stats = user.participation_stats
+            stats["total"] += len(ride_ids)
+            for status, count in counts.items():
+                if status in User.HISTORY_STATUSES:
+                    stats[status] += count
+
+    def _load_user(self, record):
+        """Agrega un usuario desde un registro de schema.user_record, sin registrar ni persistir"""
+        if self.get_user(record['alias']) is not None:
+            raise ValueError("El usuario ya existe.")
+        user = User(record['alias'], record['name'], record.get('carPlate'))
+        self._index_user(user)
+        return user
+
+    def _load_ride(self, record):
+        """Agrega un ride desde un registro de schema.ride_record conservando su id y estado"""
+        driver = self.get_user(record['driver'])
+        if driver is None:
+            raise ValueError(f"Conductor no encontrado: {record['driver']}")
+        ride_id = int(record['id'])
+        if self.get_ride(ride_id) is not None:
+            raise ValueError(f"El ride {ride_id} ya existe")
+        if record['status'] not in RIDE_STATUSES:
+            raise ValueError(f"Estado de ride invalido: {record['status']}")
+        ride = Ride(record['rideDateAndTime'], record['finalAddress'], record['allowedSpaces'], driver,
+                    record['status'], ride_id=ride_id)
+        Ride.reserve_ids_through(ride_id)
+        self._index_ride(ride)
+        driver.add_ride(ride)
+        return ride
+
+    def _load_participation(self, record):
+        """Agrega una participacion desde un registro de schema.participation_record"""
+        ride = self.get_ride(record['rideId'])
+        if ride is None:
+            raise ValueError(f"Ride no encontrado: {record['rideId']}")
+        participant = self.get_user(record['participant'])
+        if participant is None:
+            raise ValueError(f"Participante no encontrado: {record['participant']}")
+        if participant.alias in ride._participations_by_alias:
+            raise ValueError("El participante ya tiene una solicitud para este ride")
+        participation = RideParticipation(participant, record['destination'], record['status'])
+        participation.confirmation = record['confirmation']
+        participation.occupied_spaces = int(record['occupiedSpaces'])
+        ride.attach_participation(participation)
+        participant.add_joined_ride(ride)
+        return participation
+
+    def _index_user(self, user):
+        with self._lock:
+            self.users.append(user)
+            self._users_by_alias[user.alias] = user
+
+    def _index_ride(self, ride):
+        with self._lock:
+            self.rides.append(ride)
+            self._rides_by_id[ride.id] = ride
+            self._index_departure(ride.id, ride.departure_ts)
+            if ride.status in Ride.ACTIVE_STATUSES:
+                self._activate_ride(ride.id)
+
+    def _reset_time_index(self):
+        """Vacia los indices por hora; hasta _build_time_index solo se llena _departures"""
+        self._departures = {}
+        self._suspend_time_index()
+
+    def _suspend_time_index(self):
+        """Deja de mantener ordenados los indices por hora (sin perder _departures) hasta _build_time_index"""
+        self._time_index = None
+        self._active_time_index = None
+
+    def _build_time_index(self):
+        """Ordena de una vez lo registrado durante la carga (insertar de a uno seria cuadratico)"""
+        with self._lock:
+            self._time_index = sorted((ts, ride_id) for ride_id, ts in self._departures.items())
+            self._active_time_index = sorted((ts, ride_id) for ride_id, ts in self._departures.items()
+                                             if ride_id in self._active_rides)
+
+    def _index_departure(self, ride_id, departure_ts):
+        if departure_ts is None:
+            return
+        with self._lock:
+            self._departures[ride_id] = departure_ts
+            if self._time_index is not None:
+                bisect.insort(self._time_index, (departure_ts, ride_id))
+
+    def _activate_ride(self, ride_id):
+        with self._lock:
+            self._active_rides.add(ride_id)
+            bisect.insort(self._active_ride_ids, ride_id)
+            departure_ts = self._departures.get(ride_id)
+            if departure_ts is not None and self._active_time_index is not None:
+                bisect.insort(self._active_time_index, (departure_ts, ride_id))
+
+    def _deactivate_ride(self, ride):
+        with self._lock:
+            if ride.id in self._active_rides:
+                self._active_rides.discard(ride.id)
+                del self._active_ride_ids[bisect.bisect_left(self._active_ride_ids, ride.id)]
+                departure_ts = self._departures.get(ride.id)
+                if departure_ts is not None and self._active_time_index is not None:
+                    del self._active_time_index[bisect.bisect_left(self._active_time_index, (departure_ts, ride.id))]
 
     def get_user(self, alias):
-        return next((user for user in self.users if user.alias == alias), None)
+        return self._users_by_alias.get(alias)
 
     def get_ride(self, ride_id):
-        return next((ride for ride in self.rides if ride.id == int(ride_id)), None)
+        ride_id = int(ride_id)
+        ride = self._rides_by_id.get(ride_id)
+        if ride is None and self.archive is not None:
+            return self._get_archived_ride(ride_id)
+        return ride
+
+    def _get_archived_ride(self, ride_id):
+        with self._lock:
+            ride = self._archived_rides.get(ride_id)
+            if ride is not None:
+                return ride
+            record = self.archive.get(ride_id)
+            if record is None:
+                return None
+            ride = Ride(record['rideDateAndTime'], record['finalAddress'], record['allowedSpaces'],
+                        self.get_user(record['driver']), record['status'], ride_id=record['id'])
+            for participation_data in record['participations']:
+                ride.attach_participation(RideParticipation.restore(
+                    self.get_user(participation_data['participant']),
+                    participation_data['destination'],
+                    participation_data['status'],
+                    participation_data['confirmation'],
+                    participation_data['occupiedSpaces']
+                ))
+            self._archived_rides.add(ride_id, ride)
+            return ride
+
+    def _create_user(self, alias, name, car_plate=None, record=False):
+        with self._lock:
+            if self.get_user(alias):
+                raise ValueError("El usuario ya existe.")
+            user = User(alias, name, car_plate)
+            # Log before the user becomes visible so no event can reference it first
+            if record:
+                self._log('user_added', alias=alias, name=name, carPlate=car_plate)
+            self._index_user(user)
+            return user
+
+    def _create_ride(self, ride_date_and_time, final_address, allowed_spaces, driver, ride_id=None, record=False):
+        with self._lock:
+            ride = Ride(ride_date_and_time, final_address, allowed_spaces, driver, ride_id=ride_id)
+            if ride_id is not None:
+                Ride.reserve_ids_through(ride_id)
+            if record:
+                self._log('ride_added', id=ride.id, rideDateAndTime=ride.ride_date_and_time,
+                          finalAddress=ride.final_address, allowedSpaces=ride.allowed_spaces,
+                          driver=driver.alias)
+            self._index_ride(ride)
+            driver.add_ride(ride)  # Add ride to driver's rides
+            self._ride_changed(ride)
+            return ride
+
+    def _ride_changed(self, ride, participants=()):
+        """Se llama despues de cada cambio a un ride (su estado, sus participantes o su creacion).
+
+        participants son los usuarios cuyos contadores de historial cambiaron con el
+        cambio. Punto de extension para estructuras derivadas (quien lo redefina debe
+        llamar a esta version). Se llama con el lock del ride tomado, o con el del
+        handler cuando el ride recien se crea.
+        """
+        self.response_cache.invalidate_ride(ride, participants)
+        search_index = self._search_index
+        if search_index is not None:
+            search_index.update(ride)
+        match_index = self._match_index
+        if match_index is not None:
+            match_index.update(ride)
+
+    def _user_changed(self, user):
+        """Se llama cuando se modifica un usuario fuera de un cambio de ride (punto de extension)"""
+        self.response_cache.invalidate_user(user)
 
     def add_user(self, alias, name, car_plate=None):
-        if self.get_user(alias):
-            raise ValueError("El usuario ya existe.")
-        user = User(alias, name, car_plate)
-        self.users.append(user)
-        self.save_data()
+        user = self._create_user(alias, name, car_plate, record=True)
+        self._persist()
         return user
 
     def add_ride(self, ride_date_and_time, final_address, allowed_spaces, driver):
-        ride = Ride(ride_date_and_time, final_address, allowed_spaces, driver)
-        self.rides.append(ride)
-        driver.add_ride(ride)  # Add ride to driver's rides
-        self.save_data()
+        ride = self._create_ride(ride_date_and_time, final_address, allowed_spaces, driver, record=True)
+        self._persist()
         return ride
 
+    # Ride mutations log their event while still holding the ride lock, so the WAL
+    # order matches the order in which they were applied to that ride.
+
+    def join_ride(self, ride, participant, destination):
+        with ride.lock:
+            ride.add_participant(participant, destination)
+            self._ride_changed(ride, [participant])
+            self._log('participant_joined', rideId=ride.id, participant=participant.alias,
+                      destination=destination)
+        self._persist()
+
+    def accept_participant(self, ride, participant):
+        with ride.lock:
+            ride.accept_participant(participant)
+            self._ride_changed(ride)
+            self._log('participant_accepted', rideId=ride.id, participant=participant.alias)
+        self._persist()
+
+    def reject_participant(self, ride, participant):
+        with ride.lock:
+            ride.reject_participant(participant)
+            self._ride_changed(ride, [participant])
+            self._log('participant_rejected', rideId=ride.id, participant=participant.alias)
+        self._persist()
+
+    def start_ride(self, ride):
+        with ride.lock:
+            ride.start_ride()
+            self._ride_changed(ride)
+            self._log('ride_started', rideId=ride.id)
+        self._persist()
+
+    def _end_ride(self, ride):
+        with ride.lock:
+            marked = ride.end_ride()
+            self._deactivate_ride(ride)
+            return marked
+
+    def end_ride(self, ride):
+        with ride.lock:
+            marked = self._end_ride(ride)
+            self._ride_changed(ride, [participation.participant for participation in marked])
+            self._log('ride_ended', rideId=ride.id)
+        self._persist()
+
+    def unload_participant(self, ride, participant):
+        with ride.lock:
+            ride.unload_participant(participant)
+            self._ride_changed(ride, [participant])
+            self._log('participant_unloaded', rideId=ride.id, participant=participant.alias)
+        self._persist()
+
+    def apply_operations(self, ride, operations):
+        """Aplica un lote de [(accion, participante)] sobre el ride, todo o nada, y persiste una vez.
+
+        Retorna el estado final de la participacion tras cada operacion; si una
+        falla lanza BatchOperationError y no queda nada aplicado ni registrado.
+        """
+        participants = [participant for action, participant in operations if action != "accept"]
+        with ride.lock:
+            try:
+                statuses = ride.apply_operations(operations)
+            except BatchOperationError:
+                # Counters moved and came back; a response cached meanwhile could hold the transient values
+                self.response_cache.invalidate_ride(ride, participants)
+                raise
+            self._ride_changed(ride, participants)
+            self._log('operations_applied', rideId=ride.id,
+                      operations=[[action, participant.alias] for action, participant in operations])
+        self._persist()
+        return statuses
+
+    def _apply_event(self, event):
+        """Reproduce un evento del WAL sobre el estado en memoria, sin persistir"""
+        kind = event['type']
+        if kind == 'user_added':
+            self._create_user(event['alias'], event['name'], event.get('carPlate'))
+        elif kind == 'ride_added':
+            self._create_ride(event['rideDateAndTime'], event['finalAddress'], event['allowedSpaces'],
+                              self.get_user(event['driver']), ride_id=event['id'])
+        elif kind == 'rides_archived':
+            self._drop_archived([self._rides_by_id[ride_id] for ride_id in event['rideIds']
+                                 if ride_id in self._rides_by_id])
+        else:
+            ride = self.get_ride(event['rideId'])
+            participant = self.get_user(event.get('participant'))
+            if kind == 'participant_joined':
+                ride.add_participant(participant, event['destination'])
+            elif kind == 'participant_accepted':
+                ride.accept_participant(participant)
+            elif kind == 'participant_rejected':
+                ride.reject_participant(participant)
+            elif kind == 'ride_started':
+                ride.start_ride()
+            elif kind == 'ride_ended':
+                self._end_ride(ride)
+            elif kind == 'participant_unloaded':
+                ride.unload_participant(participant)
+            elif kind == 'operations_applied':
+                ride.apply_operations([(action, self.get_user(alias)) for action, alias in event['operations']])
+            else:
+                raise ValueError(f"Evento desconocido en el WAL: {kind}")
+            self._ride_changed(ride)
+
+    def _log(self, event_type, **payload):
+        if self.wal is not None:
+            self.wal.append(event_type, **payload)
+
+    def _persist(self):
+        """Persiste una mutacion ya aplicada en memoria (y registrada en el WAL si lo hay)"""
+        if self.archive is not None and time.monotonic() >= self._next_archive_check:
+            self._archive_done_rides()
+        if self.wal is None:
+            self.save_data()
+        elif self.wal.needs_compaction():
+            self.compact()
+
+    def archive_done_rides(self, now=None):
+        """Mueve al archivo los rides terminados que salieron hace mas de archive_after_s segundos.
+
+        Tambien lo hacen las mutaciones cada archive_interval_s. Los rides salen de
+        rides, del indice por hora y de la lista de su conductor, pero sus
+        participantes conservan los contadores de historial y los ids en
+        joined_ride_ids. Retorna la cantidad de rides archivados.
+        """
+        archived = self._archive_done_rides(now)
+        if archived:
+            self._persist()
+        return archived
+
+    def _archive_done_rides(self, now=None):
+        if self.archive is None:
+            return 0
+        now = Ride.timestamp(datetime.now()) if now is None else now
+        with self._archive_lock:
+            self._next_archive_check = time.monotonic() + self.archive_interval_s
+            with self._lock:
+                end = bisect.bisect_left(self._time_index, (now - self.archive_after_s,))
+                rides = [self._rides_by_id[ride_id] for _, ride_id in self._time_index[:end]
+                         if ride_id not in self._active_rides]
+            if not rides:
+                return 0
+            # On disk before the rides leave memory; a crash in between leaves them in both places
+            self.archive.append([snapshot.ride_record(ride) for ride in rides])
+            with self._lock:
+                self._log('rides_archived', rideIds=[ride.id for ride in rides])
+                self._drop_archived(rides)
+            return len(rides)
+
+    def _drop_archived(self, rides):
+        """Saca del estado en memoria rides que ya estan en el archivo (sin tocar el historial de los usuarios)"""
+        if not rides:
+            return
+        ride_ids = {ride.id for ride in rides}
+        drivers = {ride.driver for ride in rides}
+        with self._lock:
+            self.rides = [ride for ride in self.rides if ride.id not in ride_ids]
+            for ride in rides:
+                del self._rides_by_id[ride.id]
+                self._encoded_rides.pop(ride.id, None)
+                self._deactivate_ride(ride)
+                self._departures.pop(ride.id, None)
+            if self._time_index is not None:
+                self._time_index = [entry for entry in self._time_index if entry[1] not in ride_ids]
+            for driver in drivers:
+                driver.rides = [ride for ride in driver.rides if ride.id not in ride_ids]
+        for ride in rides:
+            self.response_cache.invalidate_ride(ride, [participation.participant for participation in ride.participants])
+
+    def _compacting(self):
+        return self._compaction is not None and self._compaction.is_alive()
+
+    def compact(self, wait=False):
+        """Sella el log activo y lo integra a data.json en segundo plano.
+
+        El snapshot nuevo se construye cargando data.json en un handler aparte y
+        reproduciendo ahi el segmento sellado, asi que no necesita detener las
+        mutaciones que siguen llegando al estado vivo.
+        """
+        with self._compaction_lock:
+            if self._compacting():
+                if not wait:
+                    return
+                self._compaction.join()
+            self.wal.rotate()
+            self._compaction = threading.Thread(target=self._fold_sealed_segment, daemon=True)
+            self._compaction.start()
+        if wait:
+            self._compaction.join()
+
+    def _fold_sealed_segment(self):
+        shadow = DataHandler(self.filename)
+        last_seq = shadow.snapshot_seq
+        for event in self.wal.read_segment(self.wal.sealed_filename):
+            if event['seq'] > shadow.snapshot_seq:
+                shadow._apply_event(event)
+                last_seq = event['seq']
+        data = shadow._snapshot_data()
+        data['walSeq'] = last_seq
+        self._record_snapshot_write(write_json_atomic(self.filename, data))
+        os.remove(self.wal.sealed_filename)
+
+    def close(self):
+        if self._compaction is not None:
+            self._compaction.join()
+        self._writer.close()
+        if self.wal is not None:
+            self._wal_syncer.close()
+            self.wal.close()
+        if self.archive is not None:
+            self.archive.close()
+
+    def verify_participation_stats(self, repair=False):
+        """Recalcula desde cero los contadores de historial y retorna los usuarios que no coinciden.
+
+        El resultado es {alias: (contadores_guardados, contadores_recalculados)}. Con
+        repair=True ademas se reemplazan los contadores guardados por los recalculados.
+        """
+        rebuilt = {user.alias: User.empty_participation_stats() for user in self._all_users()}
+        if self.archive is not None:
+            with self._lock:
+                hot_ride_ids = set(self._rides_by_id)
+            for alias, ride_id, status in self.archive.participations():
+                if ride_id not in hot_ride_ids:
+                    stats = rebuilt.setdefault(alias, User.empty_participation_stats())
+                    stats["total"] += 1
+                    if status in User.HISTORY_STATUSES:
+                        stats[status] += 1
+        for ride in self._all_rides():
+            for participation in ride.participants:
+                stats = rebuilt.setdefault(participation.participant.alias, User.empty_participation_stats())
+                stats["total"] += 1
+                if participation.status in User.HISTORY_STATUSES:
+                    stats[participation.status] += 1
+
+        mismatches = {}
+        for user in self._all_users():
+            if user.participation_stats != rebuilt[user.alias]:
+                mismatches[user.alias] = (dict(user.participation_stats), rebuilt[user.alias])
+                if repair:
+                    user.participation_stats = rebuilt[user.alias]
+                    self._user_changed(user)
+        return mismatches
+
+    def list_users(self, cursor=None, limit=None):
+        """Retorna (usuarios, siguiente_cursor) en orden de creacion.
+
+        El cursor es la posicion del siguiente usuario; users solo crece por el
+        final, asi que un cursor sigue siendo valido aunque se creen usuarios
+        entre una pagina y la siguiente.
+        """
+        start = int(cursor) if cursor is not None else 0
+        if start < 0:
+            raise ValueError("Cursor invalido")
+        with self._lock:
+            if limit is None:
+                return self.users[start:], None
+            page = self.users[start:start + limit]
+            next_cursor = str(start + limit) if start + limit < len(self.users) else None
+        return page, next_cursor
+
+    def find_active_rides(self, driver=None, date_from=None, date_to=None, has_free_spaces=False,
+                          cursor=None, limit=None):
+        """Retorna (rides, siguiente_cursor) de los rides activos que cumplen los filtros, por id.
+
+        El cursor es el id del ultimo ride entregado. Con driver solo se recorren
+        los rides de ese conductor en lugar de todos los activos.
+        """
+        after_id = int(cursor) if cursor is not None else 0
+        ts_from = Ride.timestamp(date_from) if date_from is not None else None
+        ts_to = Ride.timestamp(date_to) if date_to is not None else None
+        if driver is not None:
+            with self._lock:
+                candidates = sorted((ride for ride in driver.rides
+                                     if ride.id > after_id and ride.id in self._active_rides),
+                                    key=lambda ride: ride.id)
+        else:
+            candidates = self._iter_active_rides(after_id)
+
+        rides = []
+        for ride in candidates:
+            if ts_from is not None or ts_to is not None:
+                departure_ts = ride.departure_ts
+                if departure_ts is None:
+                    continue
+                if ts_from is not None and departure_ts < ts_from:
+                    continue
+                if ts_to is not None and departure_ts > ts_to:
+                    continue
+            if has_free_spaces and ride.available_spaces() <= 0:
+                continue
+            if limit is not None and len(rides) == limit:
+                return rides, str(rides[-1].id)
+            rides.append(ride)
+        return rides, None
+
+    def find_participations(self, user, statuses=None, ride_statuses=None, cursor=None, limit=None):
+        """Retorna ([(ride, participacion)], siguiente_cursor) de los rides a los que se unio user.
+
+        Recorre solo el indice inverso del usuario (User.joined_ride_ids), en
+        orden de solicitud, filtrando por estado de la participacion y del ride.
+        El cursor es la posicion en ese indice donde sigue la pagina.
+        """
+        start = int(cursor) if cursor is not None else 0
+        ride_ids = list(user.joined_ride_ids)
+        results = []
+        for position in range(start, len(ride_ids)):
+            ride = self.get_ride(ride_ids[position])
+            if ride is None:
+                continue
+            participation = ride.get_participation(user.alias)
+            if participation is None:
+                continue
+            if statuses is not None and participation.status not in statuses:
+                continue
+            if ride_statuses is not None and ride.status not in ride_statuses:
+                continue
+            if limit is not None and len(results) == limit:
+                return results, str(position)
+            results.append((ride, participation))
+        return results, None
+
+    def find_rides_by_time(self, date_from=None, date_to=None, active_only=False, has_free_spaces=False,
+                           cursor=None, limit=None):
+        """Retorna (rides, siguiente_cursor) de los rides que salen entre date_from y date_to, por hora.
+
+        Usa el indice ordenado por hora (el de activos con active_only): ubicar el
+        inicio es O(log n) y despues solo se recorren los rides del rango. El cursor
+        es "departure_ts:id" del ultimo ride entregado. has_free_spaces deja solo
+        rides ready con espacios libres, p. ej. para "los proximos N con cupo".
+        """
+        if cursor is not None:
+            after = tuple(int(part) for part in cursor.split(':'))
+            if len(after) != 2:
+                raise ValueError("Cursor invalido")
+        else:
+            after = None
+        ts_to = Ride.timestamp(date_to) if date_to is not None else None
+
+        rides = []
+        for departure_ts, ride in self._iter_time_index(active_only or has_free_spaces, date_from, after):
+            if ts_to is not None and departure_ts > ts_to:
+                break
+            if has_free_spaces and (ride.status != "ready" or ride.available_spaces() <= 0):
+                continue
+            if limit is not None and len(rides) == limit:
+                last = rides[-1]
+                return rides, f"{last.departure_ts}:{last.id}"
+            rides.append(ride)
+        return rides, None
+
+    def _iter_time_index(self, active_only, date_from, after, batch_size=256):
+        """Recorre (departure_ts, ride) en orden de salida desde date_from o despues de la clave after"""
+        if after is None:
+            after = (Ride.timestamp(date_from), -1) if date_from is not None else None
+        while True:
+            with self._lock:
+                index = self._active_time_index if active_only else self._time_index
+                start = bisect.bisect_right(index, after) if after is not None else 0
+                batch = [(key[0], self.get_ride(key[1])) for key in index[start:start + batch_size]]
+                if batch:
+                    after = (batch[-1][0], batch[-1][1].id)
+            if not batch:
+                return
+            yield from batch
+
+    def search_rides(self, query, limit=20):
+        """Retorna [(ride, puntaje)] de los rides activos cuyo destino mejor coincide con query.
+
+        La primera busqueda arma el indice a partir de los rides activos; despues
+        lo mantiene _ride_changed.
+        """
+        if self._search_index is None:
+            self._build_search_index()
+        return [(self.get_ride(ride_id), score) for ride_id, score in self._search_index.search(query, limit)]
+
+    def _build_search_index(self):
+        with self._lock:
+            if self._search_index is not None:
+                return
+            index = DestinationIndex()
+            # Published before filling it so concurrent changes also reach it; update() is idempotent
+            self._search_index = index
+            active_ride_ids = list(self._active_ride_ids)
+        for batch_start in range(0, len(active_ride_ids), 256):
+            with self._lock:
+                rides = [self.get_ride(ride_id) for ride_id in active_ride_ids[batch_start:batch_start + 256]]
+            for ride in rides:
+                index.update(ride)
+
+    def match_rides(self, destination, date_from, date_to, at=None, limit=10, rider=None):
+        """Retorna [(ride, puntajes)] de los rides ready con espacios libres que mejor le sirven a un pasajero.
+
+        Considera los que salen entre date_from y date_to; at es la hora preferida
+        (por defecto el centro de la ventana). puntajes tiene "score" y sus partes
+        "timeScore", "addressScore" y "driverReliability" (ver match_index). Con
+        rider se omiten sus propios rides y los que ya pidio. La primera llamada
+        arma el indice; despues lo mantiene _ride_changed.
+        """
+        if self._match_index is None:
+            self._build_match_index()
+        ts_from = Ride.timestamp(date_from)
+        ts_to = Ride.timestamp(date_to)
+        at_ts = Ride.timestamp(at) if at is not None else (ts_from + ts_to) // 2
+        matches = self._match_index.match(destination, ts_from, ts_to, at_ts, limit,
+                                          set(rider.joined_ride_ids) if rider is not None else (),
+                                          rider.alias if rider is not None else None)
+        results = []
+        for ride_id, score, time_score, address_score, driver_score in matches:
+            ride = self.get_ride(ride_id)
+            if ride is not None:
+                results.append((ride, {"score": score, "timeScore": time_score, "addressScore": address_score,
+                                       "driverReliability": driver_score}))
+        return results
+
+    def _build_match_index(self):
+        with self._lock:
+            if self._match_index is not None:
+                return
+            index = MatchIndex()
+            # Published before loading so changes made meanwhile are queued and applied after the load
+            self._match_index = index
+            rides = self._all_rides()
+        index.load(rides)
+
+    def _iter_active_rides(self, after_id, batch_size=256):
+        """Recorre los rides activos con id > after_id tomando el lock solo por lotes"""
+        while True:
+            with self._lock:
+                start = bisect.bisect_right(self._active_ride_ids, after_id)
+                batch = [self.get_ride(ride_id) for ride_id in self._active_ride_ids[start:start + batch_size]]
+            if not batch:
+                return
+            yield from batch
+            after_id = batch[-1].id
+
     def get_active_rides(self):
         """Returns all rides that are not done"""
-        return [ride for ride in self.rides if ride.status in ["ready", "inprogress"]]
+        with self._lock:
+            return [self.get_ride(ride_id) for ride_id in self._active_ride_ids]
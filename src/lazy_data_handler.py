@@ -0,0 +1,182 @@
+import os
+from src.data_handler import DataHandler
+from src.models.ride import Ride
+from src.models.RideParticipation import RideParticipation
+from src.models.user import User
+from src.storage import snapshot
+from src.storage.cache import ObjectCache
+from src.storage.snapshot import SnapshotReader
+
+
+class LazyDataHandler(DataHandler):
+    """DataHandler que arranca abriendo un snapshot indexado en lugar de cargar todo.
+
+    Al iniciar solo se lee el indice del snapshot (ver src/storage/snapshot.py).
+    Usuarios y rides se materializan la primera vez que se piden con get_user /
+    get_ride y se guardan en un ObjectCache de cache_size objetos por tipo. Los
+    objetos modificados quedan retenidos hasta la siguiente escritura del
+    snapshot. users y rides no se mantienen en este modo.
+    """
+
+    def __init__(self, filename='data.snap', cache_size=10000, wal=None, **kwargs):
+        if wal is not None:
+            raise ValueError("El modo lazy no soporta WAL")
+        self.cache_size = cache_size
+        self._reader = None
+        super().__init__(filename, **kwargs)
+
+    def load_data(self):
+        if self._reader is not None:
+            self._reader.close()
+        self._reader = self._open_reader()
+        self._user_cache = ObjectCache(self.cache_size)
+        self._ride_cache = ObjectCache(self.cache_size)
+        self._aliases = list(self._reader.aliases) if self._reader else []
+        self._ride_ids = list(self._reader.ride_ids) if self._reader else []
+        self._active_rides = set()
+        self._active_ride_ids = []
+        self._reset_time_index()
+        self._search_index = None
+        self._match_index = None
+        if self._reader:
+            for ride_id, departure_ts in zip(self._reader.ride_ids, self._reader.ride_departures):
+                self._index_departure(ride_id, departure_ts)
+            for ride_id in self._reader.active_ride_ids:
+                self._activate_ride(ride_id)
+        self._build_time_index()
+        if self._ride_ids:
+            Ride.reserve_ids_through(max(self._ride_ids))
+
+    def _open_reader(self):
+        """Fuente de los registros a materializar (None si todavia no hay datos)"""
+        return SnapshotReader(self.filename) if os.path.exists(self.filename) else None
+
+    def get_user(self, alias):
+        with self._lock:
+            user = self._user_cache.get(alias)
+            if user is None and self._reader is not None:
+                record = self._reader.user(alias)
+                if record is not None:
+                    user = self._hydrate_user(record)
+            return user
+
+    def get_ride(self, ride_id):
+        ride_id = int(ride_id)
+        with self._lock:
+            ride = self._ride_cache.get(ride_id)
+            if ride is None and self._reader is not None:
+                record = self._reader.ride(ride_id)
+                if record is not None:
+                    ride = self._hydrate_ride(record)
+            return ride
+
+    def _hydrate_user(self, record):
+        user = User(record['alias'], record['name'], record['carPlate'])
+        user.participation_stats = dict(record['stats'])
+        user.defer_rides(record['rides'], self.get_ride)
+        user.joined_ride_ids = record['joinedRides']
+        self._user_cache.add(user.alias, user)
+        return user
+
+    def _hydrate_ride(self, record):
+        ride = Ride(record['rideDateAndTime'], record['finalAddress'], record['allowedSpaces'],
+                    self.get_user(record['driver']), record['status'], ride_id=record['id'])
+        # Cache the ride before resolving participants so cycles find this same object
+        self._ride_cache.add(ride.id, ride)
+        for participation_data in record['participations']:
+            ride.attach_participation(RideParticipation.restore(
+                self.get_user(participation_data['participant']),
+                participation_data['destination'],
+                participation_data['status'],
+                participation_data['confirmation'],
+                participation_data['occupiedSpaces']
+            ))
+        return ride
+
+    def _index_user(self, user):
+        with self._lock:
+            self._aliases.append(user.alias)
+            self._user_cache.add(user.alias, user)
+            self._user_cache.pin(user.alias, user)
+
+    def _index_ride(self, ride):
+        with self._lock:
+            self._ride_ids.append(ride.id)
+            self._ride_cache.add(ride.id, ride)
+            self._ride_cache.pin(ride.id, ride)
+            self._index_departure(ride.id, ride.departure_ts)
+            if ride.status in Ride.ACTIVE_STATUSES:
+                self._activate_ride(ride.id)
+
+    def _ride_changed(self, ride, participants=()):
+        super()._ride_changed(ride, participants)
+        # The ride, its driver's ride list and its participants' counters may all have changed
+        with self._lock:
+            self._ride_cache.pin(ride.id, ride)
+            self._user_cache.pin(ride.driver.alias, ride.driver)
+            for participation in ride.participants:
+                self._user_cache.pin(participation.participant.alias, participation.participant)
+
+    def _user_changed(self, user):
+        super()._user_changed(user)
+        with self._lock:
+            self._user_cache.pin(user.alias, user)
+
+    def _all_users(self):
+        with self._lock:
+            aliases = list(self._aliases)
+        return (self.get_user(alias) for alias in aliases)
+
+    def _all_rides(self):
+        with self._lock:
+            ride_ids = list(self._ride_ids)
+        return (self.get_ride(ride_id) for ride_id in ride_ids)
+
+    def list_users(self, cursor=None, limit=None):
+        start = int(cursor) if cursor is not None else 0
+        if start < 0:
+            raise ValueError("Cursor invalido")
+        with self._lock:
+            end = len(self._aliases) if limit is None else start + limit
+            aliases = self._aliases[start:end]
+            next_cursor = str(end) if end < len(self._aliases) else None
+        return [self.get_user(alias) for alias in aliases], next_cursor
+
+    def _write_data_file(self):
+        with self._lock:
+            user_generation = self._user_cache.next_generation()
+            ride_generation = self._ride_cache.next_generation()
+            dirty_users = self._user_cache.pinned()
+            dirty_rides = self._ride_cache.pinned()
+            aliases = list(self._aliases)
+            ride_ids = sorted(self._ride_ids)
+            active_ride_ids = list(self._active_ride_ids)
+            reader = self._reader
+
+        # Unchanged records are copied byte for byte from the current snapshot
+        def user_lines():
+            for alias in aliases:
+                user = dirty_users.get(alias)
+                yield alias, snapshot.encode(snapshot.user_record(user)) if user else reader.raw_user(alias)
+
+        def ride_lines():
+            for ride_id in ride_ids:
+                ride = dirty_rides.get(ride_id)
+                line = snapshot.encode(snapshot.ride_record(ride)) if ride else reader.raw_ride(ride_id)
+                yield ride_id, self._departures.get(ride_id), line
+
+        written = snapshot.write_snapshot(self.filename, user_lines(), ride_lines(), active_ride_ids)
+        self._record_snapshot_write(written)
+
+        with self._lock:
+            self._reader = SnapshotReader(self.filename)
+            if reader is not None:
+                reader.close()
+            self._user_cache.unpin_through(user_generation)
+            self._ride_cache.unpin_through(ride_generation)
+
+    def close(self):
+        super().close()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
@@ -0,0 +1,265 @@
+"""Metricas de la app en el formato de texto de Prometheus y perfilado por muestreo a pedido.
+
+Las latencias se guardan en histogramas de buckets fijos. Las spans de
+DataHandler y de la serializacion de los modelos se agregan envolviendo los
+metodos (instrument), asi que si la instrumentacion esta desactivada no se
+envuelve nada y no cuesta nada.
+"""
+import bisect
+import functools
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from src.models.RideParticipation import RideParticipation
+from src.models.ride import Ride
+
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0)
+HANDLER_SPANS = ("save_data", "load_data", "get_user", "get_ride")
+MODEL_SPANS = ((Ride, "get_ride_info"), (RideParticipation, "get_participant_info"))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}  # valores de las etiquetas -> total
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(zip(self.labelnames, labels))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # valores de las etiquetas -> [conteo por bucket (no acumulado), suma, conteo]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            return series[2] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, (list(counts), total, count))
+                            for labels, (counts, total, count) in self._series.items())
+        for labels, (counts, total, count) in series:
+            named = list(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(named + [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(named)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(named)} {count}")
+        return lines
+
+
+class Registry:
+    """Metricas propias mas colectores que leen contadores ajenos (cache, persistencia) al renderizar"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = {}  # nombre -> (tipo, ayuda, collect)
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, name, metric_type, help_text, collect):
+        """collect() retorna [(etiquetas [(nombre, valor)], valor)] al renderizar; registrar de nuevo reemplaza"""
+        self._collectors[name] = (metric_type, help_text, collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, (metric_type, help_text, collect) in list(self._collectors.items()):
+            lines.extend((f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"))
+            for labels, value in collect():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+request_latency = registry.histogram("rides_request_duration_seconds", "Duracion de los requests por endpoint",
+                                     ("endpoint", "method"))
+responses = registry.counter("rides_responses_total", "Respuestas por endpoint y codigo de estado",
+                             ("endpoint", "method", "status"))
+span_latency = registry.histogram("rides_span_duration_seconds",
+                                  "Duracion de las operaciones de DataHandler y de la serializacion", ("span",))
+
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        span_latency.observe(time.perf_counter() - start, name)
+
+
+def timed(name, function):
+    """Envuelve function para registrar su duracion en la span name"""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            span_latency.observe(time.perf_counter() - start, name)
+    wrapper._metrics_span = name
+    return wrapper
+
+
+def _timed_method(handler, name):
+    def call(*args, **kwargs):
+        # Looked up on every call, so patches and overrides on the class still apply
+        return getattr(type(handler), name)(handler, *args, **kwargs)
+    return timed(name, functools.update_wrapper(call, getattr(type(handler), name)))
+
+
+def instrument_handler(handler):
+    """Mide las operaciones de HANDLER_SPANS de esta instancia (las demas instancias no se tocan)"""
+    for name in HANDLER_SPANS:
+        if name not in vars(handler):
+            setattr(handler, name, _timed_method(handler, name))
+    return handler
+
+
+def instrument_models():
+    """Mide la serializacion de los modelos (afecta a todo el proceso; llamar mas de una vez no duplica)"""
+    for cls, name in MODEL_SPANS:
+        method = getattr(cls, name)
+        # Other decorators (e.g. the ride lock) also set __wrapped__, so only our own mark counts
+        if getattr(method, '_metrics_span', None) != name:
+            setattr(cls, name, timed(name, method))
+
+
+class SamplingProfiler:
+    """Toma cada interval segundos la pila de un hilo y cuenta cuantas veces vio cada una.
+
+    Muestrea desde un hilo aparte con sys._current_frames, asi que el codigo
+    perfilado no se modifica y solo paga el costo del GIL en cada muestra.
+    """
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = {}  # pila "archivo:funcion;..." (de la raiz a la hoja) -> muestras
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._start = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.samples[key] = self.samples.get(key, 0) + 1
+
+    def stop(self):
+        if self._thread is not None and not self._stop.is_set():
+            self._stop.set()
+            self._thread.join()
+            self.duration = time.perf_counter() - self._start
+        return self
+
+    def collapsed(self):
+        """Pilas en formato "collapsed" (una por linea con su cantidad de muestras), para flamegraph.pl"""
+        return ''.join(f"{stack} {count}\n"
+                       for stack, count in sorted(self.samples.items(), key=lambda item: -item[1]))
+
+
+class ProfileStore:
+    """Ultimos perfiles tomados, por id"""
+
+    def __init__(self, capacity=50):
+        self.capacity = capacity
+        self._profiles = OrderedDict()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            profile_id = self._next_id
+            self._next_id += 1
+            self._profiles[profile_id] = profile
+            if len(self._profiles) > self.capacity:
+                self._profiles.popitem(last=False)
+            return profile_id
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+
+profiles = ProfileStore()
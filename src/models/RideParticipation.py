@@ -1,37 +1,53 @@
+from src.models.status import participation_status, participation_status_code
+
+
 class RideParticipation:
+    # Sin __dict__: con millones de participaciones el overhead por objeto domina la memoria
+    __slots__ = ("confirmation", "participant", "destination", "occupied_spaces", "_status_code")
+
     def __init__(self, participant, destination, status="waiting"):
         self.confirmation = None  # Confirmación de participación (puede ser None al principio)
         self.participant = participant
         self.destination = destination
         self.occupied_spaces = 1  # Este valor puede cambiar si se ajustan los ocupantes
+        self._status_code = None
         self.status = status  # waiting, rejected, confirmed, missing, notmarked, inprogress, done
 
-    def get_participant_info(self):
-        # Count rides based on participation status, not ride status
-        participant_rides = []
+    @classmethod
+    def restore(cls, participant, destination, status, confirmation=None, occupied_spaces=1):
+        """Reconstruye una participacion cuyo estado ya esta contado en el historial del participante"""
+        participation = cls.__new__(cls)
+        participation.confirmation = confirmation
+        participation.participant = participant
+        participation.destination = destination
+        participation.occupied_spaces = occupied_spaces
+        participation._status_code = participation_status_code(status)
+        return participation
 
-        # Get all rides where this participant has been involved
-        for ride in self.participant.rides:
-            for participation in ride.participants:
-                if participation.participant.alias == self.participant.alias:
-                    participant_rides.append(participation)
+    @property
+    def status(self):
+        if self._status_code is None:
+            return None
+        return participation_status(self._status_code)
 
-        # Count different statuses
-        total_rides = len(participant_rides)
-        completed_rides = len([p for p in participant_rides if p.status == "done"])
-        missing_rides = len([p for p in participant_rides if p.status == "missing"])
-        notmarked_rides = len([p for p in participant_rides if p.status == "notmarked"])
-        rejected_rides = len([p for p in participant_rides if p.status == "rejected"])
+    @status.setter
+    def status(self, status):
+        # Keep the participant's history counters in step with every transition
+        code = participation_status_code(status)
+        self.participant.record_participation_status(self.status, status)
+        self._status_code = code
 
+    def get_participant_info(self):
+        stats = self.participant.participation_stats
         return {
             "confirmation": self.confirmation,
             "participant": {
                 "alias": self.participant.alias,
-                "previousRidesTotal": total_rides,
-                "previousRidesCompleted": completed_rides,
-                "previousRidesMissing": missing_rides,
-                "previousRidesNotMarked": notmarked_rides,
-                "previousRidesRejected": rejected_rides
+                "previousRidesTotal": stats["total"],
+                "previousRidesCompleted": stats["done"],
+                "previousRidesMissing": stats["missing"],
+                "previousRidesNotMarked": stats["notmarked"],
+                "previousRidesRejected": stats["rejected"]
             },
             "destination": self.destination,
             "occupiedSpaces": self.occupied_spaces,
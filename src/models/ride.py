@@ -1,23 +1,125 @@
+import functools
+import json
+import threading
+from datetime import datetime, timedelta
 from src.models.RideParticipation import RideParticipation
+from src.models.status import canonical_status
+from src.models.version import next_version
+
+
+def _with_ride_lock(method):
+    """Ejecuta el metodo con el lock del ride, para que verificar y modificar sea atomico"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class BatchOperationError(ValueError):
+    """Una operacion de un lote fallo; index es su posicion y el lote quedo sin aplicar"""
+
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
 
 
 class Ride:
+    # __weakref__ hace falta para el identity map de ObjectCache
+    __slots__ = ("id", "lock", "ride_date_and_time", "departure_ts", "final_address", "allowed_spaces", "driver",
+                 "_status", "participants", "_participations_by_alias", "_participations_by_status", "version",
+                 "_info_json", "__weakref__")
+
     _id_counter = 1
+    _id_lock = threading.Lock()
+
+    ACTIVE_STATUSES = ("ready", "inprogress")
+    RIDE_DATETIME_FORMAT = "%Y/%m/%d %H:%M"  # Formato de rideDateAndTime, p. ej. "2025/07/15 22:00"
+    EPOCH = datetime(1970, 1, 1)  # Origen de departure_ts; las horas no tienen zona horaria
+    INFO_FIELDS = ("id", "rideDateAndTime", "finalAddress", "allowedSpaces", "driver", "status", "participants")
 
-    def __init__(self, ride_date_and_time, final_address, allowed_spaces, driver, status="ready"):
-        self.id = Ride._id_counter
-        Ride._id_counter += 1
+    def __init__(self, ride_date_and_time, final_address, allowed_spaces, driver, status="ready", ride_id=None):
+        # A ride rebuilt from stored data keeps its id and does not use up a new one
+        self.id = Ride._next_id() if ride_id is None else ride_id
+        self.lock = threading.RLock()
         self.ride_date_and_time = ride_date_and_time
+        self.departure_ts = self.parse_departure(ride_date_and_time)  # Segundos desde EPOCH, None si no se entiende
         self.final_address = final_address
         self.allowed_spaces = int(allowed_spaces)  # Ensure it's an integer
         self.driver = driver
+        self._info_json = None  # (clave, get_ride_info() serializado), ver get_ride_info_json
         self.status = status  # ready, inprogress, done
         self.participants = []  # Lista de participantes en el ride
+        # Indices sobre participants: alias -> participacion y estado -> {alias: participacion}
+        self._participations_by_alias = {}
+        self._participations_by_status = {}
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, status):
+        self._status = canonical_status(status)
+        self.version = next_version()
+
+    @classmethod
+    def _next_id(cls):
+        with cls._id_lock:
+            ride_id = cls._id_counter
+            cls._id_counter += 1
+            return ride_id
+
+    @classmethod
+    def reserve_ids_through(cls, ride_id):
+        """Asegura que los proximos ids asignados sean mayores que ride_id"""
+        with cls._id_lock:
+            cls._id_counter = max(cls._id_counter, ride_id + 1)
+
+    @_with_ride_lock
+    def attach_participation(self, participation):
+        """Registra una participacion ya construida (por ejemplo al cargar datos)"""
+        alias = participation.participant.alias
+        self.participants.append(participation)
+        self._participations_by_alias[alias] = participation
+        self._participations_by_status.setdefault(participation.status, {})[alias] = participation
+        self.version = next_version()
+
+    @_with_ride_lock
+    def restore_state(self, status, participations):
+        """Reemplaza el estado y las participaciones por otros ya guardados (p. ej. tras una escritura fallida)"""
+        self.participants = []
+        self._participations_by_alias = {}
+        self._participations_by_status = {}
+        self.status = status
+        for participation in participations:
+            self.attach_participation(participation)
 
+    def get_participation(self, alias):
+        """Participacion del usuario alias en este ride (None si no pidio unirse)"""
+        return self._participations_by_alias.get(alias)
+
+    def _find_participation(self, participant, status):
+        participation = self._participations_by_alias.get(participant.alias)
+        if participation is not None and participation.status == status:
+            return participation
+        return None
+
+    def _participations_with_status(self, status):
+        return self._participations_by_status.get(status, {})
+
+    def _set_participation_status(self, participation, status):
+        alias = participation.participant.alias
+        del self._participations_by_status[participation.status][alias]
+        self._participations_by_status.setdefault(status, {})[alias] = participation
+        participation.status = status
+        # Callers change confirmation right after, still under the ride lock
+        self.version = next_version()
+
+    @_with_ride_lock
     def add_participant(self, participant, destination):
         # Check if participant already has a request for this ride
-        existing_participant = next((p for p in self.participants if p.participant.alias == participant.alias), None)
-        if existing_participant:
+        if participant.alias in self._participations_by_alias:
             raise ValueError("El participante ya tiene una solicitud para este ride")
 
         # Check if ride is still in ready status
@@ -25,88 +127,175 @@ class Ride:
             raise ValueError("Solo se puede unir a un ride antes de que inicie")
 
         # Check available spaces
-        confirmed_participants = len([p for p in self.participants if p.status == "confirmed"])
-        if confirmed_participants >= self.allowed_spaces:
+        if len(self._participations_with_status("confirmed")) >= self.allowed_spaces:
             raise ValueError("No hay espacios disponibles para este ride")
 
-        self.participants.append(RideParticipation(participant, destination, "waiting"))
+        self.attach_participation(RideParticipation(participant, destination, "waiting"))
+        participant.add_joined_ride(self)
 
+    @_with_ride_lock
     def accept_participant(self, participant):
         # Find the participant in waiting status
-        participant_obj = next((p for p in self.participants
-                                if p.participant.alias == participant.alias and p.status == "waiting"), None)
+        participant_obj = self._find_participation(participant, "waiting")
 
         if not participant_obj:
             raise ValueError("No se encontró solicitud pendiente para este participante")
 
         # Check if there are available spaces
-        confirmed_participants = len([p for p in self.participants if p.status == "confirmed"])
-        if confirmed_participants >= self.allowed_spaces:
+        if len(self._participations_with_status("confirmed")) >= self.allowed_spaces:
             raise ValueError("No hay espacios disponibles para confirmar más participantes")
 
-        participant_obj.status = "confirmed"
+        self._set_participation_status(participant_obj, "confirmed")
         participant_obj.confirmation = True
 
+    @_with_ride_lock
     def reject_participant(self, participant):
         # Find the participant in waiting status
-        participant_obj = next((p for p in self.participants
-                                if p.participant.alias == participant.alias and p.status == "waiting"), None)
+        participant_obj = self._find_participation(participant, "waiting")
 
         if not participant_obj:
             raise ValueError("No se encontró solicitud pendiente para este participante")
 
-        participant_obj.status = "rejected"
+        self._set_participation_status(participant_obj, "rejected")
         participant_obj.confirmation = False
 
+    @_with_ride_lock
     def start_ride(self):
         # Check if ride is in ready status
         if self.status != "ready":
             raise ValueError("El ride no está en estado ready")
 
         # Check if all participants are either confirmed or rejected
-        pending_participants = [p for p in self.participants if p.status not in ["confirmed", "rejected"]]
+        pending_participants = any(bucket for status, bucket in self._participations_by_status.items()
+                                   if status not in ["confirmed", "rejected"])
         if pending_participants:
             raise ValueError("Hay participantes con solicitudes pendientes")
 
         # Get confirmed participants who should be present
-        confirmed_participants = [p for p in self.participants if p.status == "confirmed"]
+        confirmed_participants = list(self._participations_with_status("confirmed").values())
 
         # For now, assume all confirmed participants are present
         # In a real scenario, you might want to check who's actually present
         for participant in confirmed_participants:
-            participant.status = "inprogress"
+            self._set_participation_status(participant, "inprogress")
 
         self.status = "inprogress"
 
+    @_with_ride_lock
     def end_ride(self):
+        """Termina el ride y retorna las participaciones que quedaron como notmarked"""
         # Check if ride is in progress
         if self.status != "inprogress":
             raise ValueError("El ride no está en progreso")
 
         # Mark participants still in progress as "notmarked"
-        for participant in self.participants:
-            if participant.status == "inprogress":
-                participant.status = "notmarked"
+        marked = list(self._participations_with_status("inprogress").values())
+        for participant in marked:
+            self._set_participation_status(participant, "notmarked")
 
         self.status = "done"
+        return marked
 
+    @_with_ride_lock
     def unload_participant(self, participant):
         # Find the participant in inprogress status
-        participant_obj = next((p for p in self.participants
-                                if p.participant.alias == participant.alias and p.status == "inprogress"), None)
+        participant_obj = self._find_participation(participant, "inprogress")
 
         if not participant_obj:
             raise ValueError("Participante no encontrado o no está en el ride")
 
-        participant_obj.status = "done"
+        self._set_participation_status(participant_obj, "done")
+
+    BATCH_ACTIONS = ("accept", "reject", "unload")
+
+    @_with_ride_lock
+    def apply_operations(self, operations):
+        """Aplica [(accion, participante)] en orden, todo o nada.
+
+        Cada accion tiene las reglas de accept_participant, reject_participant o
+        unload_participant, y ve el efecto de las anteriores del lote. Si una falla
+        se deshacen las ya aplicadas y se lanza BatchOperationError.
+        """
+        methods = {"accept": self.accept_participant, "reject": self.reject_participant,
+                   "unload": self.unload_participant}
+        applied = []  # (participacion, estado previo, confirmacion previa)
+        statuses = []
+        for index, (action, participant) in enumerate(operations):
+            participation = self._participations_by_alias.get(participant.alias)
+            previous = (participation, participation.status if participation else None,
+                        participation.confirmation if participation else None)
+            try:
+                if action not in methods:
+                    raise ValueError(f"Accion desconocida: {action}")
+                methods[action](participant)
+            except ValueError as e:
+                # Undo in reverse order so each participation returns to its original status and counters
+                for undone, status, confirmation in reversed(applied):
+                    self._set_participation_status(undone, status)
+                    undone.confirmation = confirmation
+                raise BatchOperationError(index, str(e)) from e
+            applied.append(previous)
+            statuses.append(participation.status)
+        return statuses
 
-    def get_ride_info(self):
-        return {
+    @classmethod
+    def timestamp(cls, value):
+        """datetime -> segundos desde EPOCH"""
+        return int((value - cls.EPOCH).total_seconds())
+
+    @classmethod
+    def parse_departure(cls, value):
+        """rideDateAndTime -> segundos desde EPOCH, o None si no tiene el formato esperado"""
+        try:
+            # Fast path for the canonical zero-padded "AAAA/MM/DD HH:MM"
+            if (len(value) == 16 and value[4] == value[7] == "/" and value[10] == " " and value[13] == ":"
+                    and value[:4].isdigit() and value[5:7].isdigit() and value[8:10].isdigit()
+                    and value[11:13].isdigit() and value[14:].isdigit()):
+                departure = datetime(int(value[:4]), int(value[5:7]), int(value[8:10]),
+                                     int(value[11:13]), int(value[14:]))
+            else:
+                departure = datetime.strptime(value, cls.RIDE_DATETIME_FORMAT)
+        except (TypeError, ValueError):
+            return None
+        return cls.timestamp(departure)
+
+    def departure_time(self):
+        """rideDateAndTime como datetime, o None si no tiene el formato esperado"""
+        if self.departure_ts is None:
+            return None
+        return self.EPOCH + timedelta(seconds=self.departure_ts)
+
+    def available_spaces(self):
+        occupied = (len(self._participations_with_status("confirmed"))
+                    + len(self._participations_with_status("inprogress")))
+        return self.allowed_spaces - occupied
+
+    @_with_ride_lock
+    def get_ride_info(self, fields=None):
+        info = {
             "id": self.id,
             "rideDateAndTime": self.ride_date_and_time,
             "finalAddress": self.final_address,
             "allowedSpaces": self.allowed_spaces,  # Add this field
             "driver": self.driver.alias,
-            "status": self.status,
-            "participants": [participant.get_participant_info() for participant in self.participants]
-        }
\ No newline at end of file
+            "status": self.status
+        }
+        # Participants are the expensive part, skip them unless requested
+        if fields is None or "participants" in fields:
+            info["participants"] = [participant.get_participant_info() for participant in self.participants]
+        if fields is not None:
+            info = {key: value for key, value in info.items() if key in fields}
+        return info
+
+    @_with_ride_lock
+    def get_ride_info_json(self):
+        """get_ride_info() como JSON compacto con claves ordenadas (el formato de las respuestas de la API).
+
+        Se reutiliza mientras no cambien el ride ni los contadores de historial de
+        sus participantes, que tambien aparecen en el resultado.
+        """
+        key = (self.version, tuple(participation.participant.stats_version for participation in self.participants))
+        cached = self._info_json
+        if cached is None or cached[0] != key:
+            cached = self._info_json = (key, json.dumps(self.get_ride_info(), separators=(',', ':'), sort_keys=True))
+        return cached[1]
\ No newline at end of file
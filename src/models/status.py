@@ -0,0 +1,30 @@
+"""Estados de rides y participaciones.
+
+Cada estado se guarda como un codigo entero pequeno y se expone como el string
+canonico de PARTICIPATION_STATUSES, asi las participaciones cargadas desde JSON
+no guardan cada una su propia copia del string.
+"""
+
+PARTICIPATION_STATUSES = ("waiting", "rejected", "confirmed", "missing", "notmarked", "inprogress", "done")
+RIDE_STATUSES = ("ready", "inprogress", "done")
+
+PARTICIPATION_STATUS_CODES = {status: code for code, status in enumerate(PARTICIPATION_STATUSES)}
+_CANONICAL = {status: status for status in PARTICIPATION_STATUSES + RIDE_STATUSES}
+
+
+def participation_status_code(status):
+    """Codigo entero de un estado de participacion"""
+    try:
+        return PARTICIPATION_STATUS_CODES[status]
+    except KeyError:
+        raise ValueError(f"Estado de participacion invalido: {status}") from None
+
+
+def participation_status(code):
+    """Estado de participacion correspondiente a un codigo"""
+    return PARTICIPATION_STATUSES[code]
+
+
+def canonical_status(status):
+    """Instancia compartida del string de estado (los desconocidos se devuelven tal cual)"""
+    return _CANONICAL.get(status, status)
@@ -1,17 +1,99 @@
+import json
+import threading
+
+from src.models.version import next_version
+
+
 class User:
+    # __weakref__ hace falta para el identity map de ObjectCache
+    __slots__ = ("alias", "name", "car_plate", "_rides", "_rides_loader", "joined_ride_ids", "participation_stats",
+                 "stats_version", "_stats_lock", "__weakref__")
+
+    # Estados de participacion que se cuentan en el historial del usuario
+    HISTORY_STATUSES = ("done", "missing", "notmarked", "rejected")
+    INFO_FIELDS = ("alias", "name", "carPlate", "rides")
+
     def __init__(self, alias, name, car_plate=None):
         self.alias = alias
         self.name = name
         self.car_plate = car_plate  # Puede ser nulo para participantes sin coche
-        self.rides = []  # Lista de participaciones en rides
+        self._rides = []  # Lista de participaciones en rides
+        self._rides_loader = None  # Carga diferida de rides (ver LazyDataHandler)
+        # Indice inverso: ids de los rides a los que se unio como participante, en orden de solicitud
+        self.joined_ride_ids = []
+        # Contadores de historial, mantenidos por RideParticipation al cambiar de estado
+        self.participation_stats = self.empty_participation_stats()
+        self.stats_version = next_version()  # Cambia con los contadores (ver Ride.get_ride_info_json)
+        self._stats_lock = threading.Lock()  # Participaciones en rides distintos pueden cambiar a la vez
+
+    @property
+    def rides(self):
+        if self._rides_loader is not None:
+            ride_ids, load_ride = self._rides_loader
+            self._rides_loader = None
+            self._rides = [load_ride(ride_id) for ride_id in ride_ids]
+        return self._rides
+
+    @rides.setter
+    def rides(self, rides):
+        self._rides_loader = None
+        self._rides = rides
+
+    def defer_rides(self, ride_ids, load_ride):
+        """Posterga la carga de rides hasta el primer acceso a self.rides"""
+        self._rides_loader = (ride_ids, load_ride)
+
+    def ride_ids(self):
+        """Ids de los rides del usuario, sin materializarlos si todavia no se cargaron"""
+        if self._rides_loader is not None:
+            return list(self._rides_loader[0])
+        return [ride.id for ride in self._rides]
+
+    @classmethod
+    def empty_participation_stats(cls):
+        stats = {"total": 0}
+        stats.update({status: 0 for status in cls.HISTORY_STATUSES})
+        return stats
+
+    def record_participation_status(self, old_status, new_status):
+        """Mueve los contadores cuando una participacion pasa de old_status a new_status (None = nueva)"""
+        with self._stats_lock:
+            stats = self.participation_stats
+            if old_status is None:
+                stats["total"] += 1
+            elif old_status in self.HISTORY_STATUSES:
+                stats[old_status] -= 1
+            if new_status in self.HISTORY_STATUSES:
+                stats[new_status] += 1
+            self.stats_version = next_version()
+
+    def adjust_participation_stats(self, old_stats, new_stats):
+        """Reemplaza en los contadores un aporte old_stats por new_stats (p. ej. el de otro shard)"""
+        with self._stats_lock:
+            for key, value in new_stats.items():
+                self.participation_stats[key] += value - old_stats.get(key, 0)
+            self.stats_version = next_version()
 
     def add_ride(self, ride):
         self.rides.append(ride)
 
-    def get_user_info(self):
-        return {
+    def add_joined_ride(self, ride):
+        self.joined_ride_ids.append(ride.id)
+
+    def get_user_info(self, fields=None):
+        info = {
             "alias": self.alias,
             "name": self.name,
-            "carPlate": self.car_plate,
-            "rides": [ride.get_ride_info() for ride in self.rides]
+            "carPlate": self.car_plate
         }
+        if fields is None or "rides" in fields:
+            info["rides"] = [ride.get_ride_info() for ride in self.rides]
+        if fields is not None:
+            info = {key: value for key, value in info.items() if key in fields}
+        return info
+
+    def get_user_info_json(self):
+        """get_user_info() como JSON compacto con claves ordenadas, reutilizando el JSON de cada ride"""
+        head = json.dumps({"alias": self.alias, "carPlate": self.car_plate, "name": self.name},
+                          separators=(',', ':'), sort_keys=True)
+        return f'{head[:-1]},"rides":[{",".join(ride.get_ride_info_json() for ride in self.rides)}]}}'
@@ -0,0 +1,11 @@
+"""Versiones de las entidades, para los caches de JSON ya serializado.
+
+Cada mutacion de un ride (o de los contadores de historial de un usuario) le
+asigna una version nueva; un fragmento JSON guardado con la version vigente
+sigue siendo valido. El contador es global y no por objeto, asi que un objeto
+reconstruido (p. ej. un ride rehidratado por LazyDataHandler) nunca repite la
+version de otro con el mismo id.
+"""
+import itertools
+
+next_version = itertools.count(1).__next__  # Atomic under the GIL
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from src.data_handler import DataHandler
+from src.models.user import User
+
+
+class ShardDataHandler(DataHandler):
+    """DataHandler de un worker en modo sharding (ver src/sharding.py).
+
+    Guarda los rides cuyo id es shard modulo shards (y asigna solo ids asi) y
+    una replica de todos los usuarios, en su propio data-<shard>.json. Los
+    contadores de historial de un usuario suman participaciones de todos los
+    shards: la parte de este shard la mantienen los modelos como siempre y la de
+    cada shard remoto llega con apply_remote_stats.
+    """
+
+    def __init__(self, shard, shards, directory='.', **kwargs):
+        if not 0 <= shard < shards:
+            raise ValueError(f"Shard invalido: {shard}/{shards}")
+        self.shard = shard
+        self.shards = shards
+        self._next_ride_id = shard or shards  # Ids start at 1
+        self._remote_stats = {}  # alias -> {shard: (seq, contadores de ese shard)}
+        # Crece con cada cambio de contadores locales (y entre reinicios), para descartar avisos viejos
+        self._stats_seq = time.time_ns()
+        self._request_state = threading.local()  # Usuarios con contadores cambiados en el request de cada hilo
+        super().__init__(os.path.join(directory, f"data-{shard}.json"), **kwargs)
+
+    def load_data(self):
+        self._remote_stats = {}
+        super().load_data()
+
+    def owns_ride(self, ride_id):
+        return int(ride_id) % self.shards == self.shard
+
+    def _index_ride(self, ride):
+        super()._index_ride(ride)
+        with self._lock:
+            if ride.id >= self._next_ride_id:
+                # Next id of this shard's residue above ride.id
+                self._next_ride_id = ride.id + 1 + (self.shard - ride.id - 1) % self.shards
+
+    def _create_ride(self, ride_date_and_time, final_address, allowed_spaces, driver, ride_id=None, record=False):
+        with self._lock:
+            if ride_id is None:
+                ride_id = self._next_ride_id
+            return super()._create_ride(ride_date_and_time, final_address, allowed_spaces, driver, ride_id=ride_id,
+                                        record=record)
+
+    def _ride_changed(self, ride, participants=()):
+        super()._ride_changed(ride, participants)
+        if participants:
+            changed = getattr(self._request_state, 'users', None)
+            if changed is None:
+                changed = self._request_state.users = {}
+            for participant in participants:
+                changed[participant.alias] = participant
+
+    def begin_request(self):
+        self._request_state.users = {}
+
+    def changed_stats(self):
+        """{"seq", "users": {alias: contadores locales}} de los usuarios cambiados en el request actual (o None)"""
+        changed = getattr(self._request_state, 'users', None)
+        self._request_state.users = {}
+        if not changed:
+            return None
+        with self._lock:
+            # Taken together so a higher seq always carries counters at least as recent
+            self._stats_seq += 1
+            users = {alias: self.local_stats(user) for alias, user in changed.items()}
+            return {"seq": self._stats_seq, "users": users}
+
+    def local_stats(self, user):
+        """Contadores de user que aportan los rides de este shard"""
+        with self._lock:
+            remote = [stats for _, stats in self._remote_stats.get(user.alias, {}).values()]
+        stats = dict(user.participation_stats)
+        for remote_stats in remote:
+            for key, value in remote_stats.items():
+                stats[key] -= value
+        return stats
+
+    def all_local_stats(self):
+        """{"seq", "users": {alias: contadores locales}} de los usuarios con historial en este shard"""
+        with self._lock:
+            users = {}
+            for user in self._all_users():
+                stats = self.local_stats(user)
+                if stats["total"]:
+                    users[user.alias] = stats
+            return {"seq": self._stats_seq, "users": users}
+
+    def apply_remote_stats(self, shard, seq, users):
+        """Reemplaza la parte de los contadores que aporta shard; los avisos con seq viejo se ignoran"""
+        for alias, stats in users.items():
+            user = self.get_user(alias)
+            if user is None:
+                continue
+            with self._lock:
+                by_shard = self._remote_stats.setdefault(alias, {})
+                previous_seq, previous = by_shard.get(shard, (-1, User.empty_participation_stats()))
+                if seq < previous_seq:
+                    continue
+                by_shard[shard] = (seq, dict(stats))
+                user.adjust_participation_stats(previous, stats)
+            self._user_changed(user)
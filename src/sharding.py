@@ -0,0 +1,464 @@
+"""Modo sharding: N procesos worker, cada uno con su DataHandler y su archivo, detras de un router.
+
+  python -m src.sharding --shards 4 --port 8000 [--routers 2] [--data-dir .] [--split data.json]
+
+Particion:
+  - rides: el shard de un ride es id % N. Cada worker asigna solo ids de su
+    residuo (ver ShardDataHandler), asi el id alcanza para encontrar el ride.
+  - usuarios: el shard de origen de un alias es crc32(alias) % N. Ahi se crea
+    el usuario (y se valida que el alias sea unico) y ahi se crean los rides que
+    maneja, asi las escrituras se reparten por conductor. Los usuarios se
+    replican en todos los shards para que cualquier ride pueda referenciar a su
+    conductor y a sus pasajeros.
+  - contadores de historial: cada worker informa en X-Shard-Stats los contadores
+    locales que cambio un request y el router los reenvia a los demas shards
+    antes de responder (y al arrancar los sincroniza todos).
+
+Cada worker es la app de siempre (controller.py, en modo async) con
+RIDES_SHARD=<i>/<N> y su data-<i>.json. El router (ShardRouter, aplicacion ASGI
+sobre async_server.serve) no guarda estado, asi que pueden correr varios en el
+mismo puerto (--routers). Rutas:
+  - de un ride (/usuarios/<alias>/rides/<id>/...): al shard del id
+  - POST /usuarios: al shard del alias y, si se crea, se replica en los demas
+  - POST /usuarios/<alias>/rides: al shard del alias
+  - GET /usuarios: al shard 0 (tiene a todos los usuarios)
+  - GET /usuarios/<alias>, /usuarios/<alias>/rides, /usuarios/<alias>/participations,
+    /rides/active, /rides, /rides/search y /rides/match: a todos los shards (scatter-gather),
+    uniendo los resultados en el orden del modo de un proceso
+  - /metrics/*: al shard de ?shard=<i> (0 por defecto)
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import multiprocessing
+import os
+import socket
+import time
+import zlib
+from urllib.parse import parse_qsl, quote, urlencode
+
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.routing import Map, Rule
+
+from src.async_server import MAX_HEADER_BYTES, serve
+from src.data_handler import DataHandler
+from src.models.ride import Ride
+from src.storage import schema
+from src.storage.atomic import write_json_atomic
+
+MAX_PAGE_LIMIT = 1000  # El mismo limite que aplica el controller
+FORWARDED_HEADERS = ("content-type", "if-none-match", "x-profile")
+ROUTES = Map([
+    Rule('/usuarios', methods=['POST'], endpoint='create_user'),
+    Rule('/usuarios', methods=['GET'], endpoint='first_shard'),
+    Rule('/usuarios/<alias>', methods=['GET'], endpoint='user'),
+    Rule('/usuarios/<alias>/rides', methods=['GET'], endpoint='user_rides'),
+    Rule('/usuarios/<alias>/rides', methods=['POST'], endpoint='alias_shard'),
+    Rule('/usuarios/<alias>/participations', methods=['GET'], endpoint='participations'),
+    Rule('/usuarios/<alias>/rides/<ride_id>', endpoint='ride_shard'),
+    Rule('/usuarios/<alias>/rides/<ride_id>/<path:action>', endpoint='ride_shard'),
+    Rule('/rides/active', methods=['GET'], endpoint='active_rides'),
+    Rule('/rides', methods=['GET'], endpoint='rides_by_time'),
+    Rule('/rides/search', methods=['GET'], endpoint='search_rides'),
+    Rule('/rides/match', methods=['GET'], endpoint='match_rides'),
+    Rule('/metrics', methods=['GET'], endpoint='metrics'),
+    Rule('/metrics/<path:rest>', methods=['GET'], endpoint='metrics'),
+])
+
+
+def shard_for_alias(alias, shards):
+    return zlib.crc32(alias.encode()) % shards
+
+
+def shard_for_ride(ride_id, shards):
+    return int(ride_id) % shards
+
+
+async def _read_response(reader):
+    """Lee una respuesta HTTP/1.1; retorna (status, [(header, valor)], cuerpo, keep_alive)"""
+    head = await reader.readuntil(b"\r\n\r\n")
+    status_line, *lines = head.decode("latin-1").split("\r\n")
+    headers = []
+    for line in lines:
+        if line:
+            name, value = line.split(":", 1)
+            headers.append((name.strip().lower(), value.strip()))
+    fields = dict(headers)
+    if fields.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                break
+            chunks.append(chunk[:-2])
+        body = b"".join(chunks)
+        headers = [(name, value) for name, value in headers if name != "transfer-encoding"]
+    else:
+        body = await reader.readexactly(int(fields.get("content-length", 0)))
+    return int(status_line.split(" ", 2)[1]), headers, body, fields.get("connection", "").lower() != "close"
+
+
+class HttpShardClient:
+    """Cliente HTTP/1.1 minimo hacia un worker, que reutiliza conexiones keep-alive"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._idle = []
+
+    async def request(self, method, target, headers=(), body=b""):
+        """Retorna (status, [(header en minusculas, valor)], cuerpo)"""
+        head = [f"{method} {target} HTTP/1.1", "Host: shard", f"Content-Length: {len(body)}"]
+        head.extend(f"{name}: {value}" for name, value in headers)
+        message = ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+        while True:
+            reused = bool(self._idle)
+            if reused:
+                reader, writer = self._idle.pop()
+            else:
+                reader, writer = await asyncio.open_connection(self.host, self.port, limit=MAX_HEADER_BYTES)
+            try:
+                writer.write(message)
+                status, response_headers, response_body, keep_alive = await _read_response(reader)
+            except (OSError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    continue  # The worker dropped an idle connection; retry on a new one
+                raise
+            if keep_alive:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+            return status, response_headers, response_body
+
+
+class _Request:
+    __slots__ = ("method", "path", "target", "query", "headers", "body")
+
+    def __init__(self, method, path, target, query, headers, body):
+        self.method = method
+        self.path = path
+        self.target = target
+        self.query = query  # {parametro: primer valor}, como request.args.get
+        self.headers = headers
+        self.body = body
+
+    def with_query(self, query):
+        return f"{quote(self.path)}?{urlencode(query)}" if query else quote(self.path)
+
+
+def _json_response(status, payload, next_cursor=None):
+    headers = [("content-type", "application/json")]
+    if next_cursor is not None:
+        headers.append(("x-next-cursor", next_cursor))
+    return status, headers, json.dumps(payload, separators=(',', ':'), sort_keys=True).encode()
+
+
+def _fields_for_merge(query, required):
+    """Agrega a fields lo que necesita el merge; retorna (query, campos a quitar de la respuesta)"""
+    if "fields" not in query:
+        return query, ()
+    fields = [field.strip() for field in query["fields"].split(',') if field.strip()]
+    missing = [field for field in required if field not in fields]
+    return dict(query, fields=','.join(fields + missing)), missing
+
+
+def _strip(item, fields):
+    for field in fields:
+        item.pop(field, None)
+    return item
+
+
+class ShardRouter:
+    """Aplicacion ASGI que reparte los requests entre los workers (clients[i] atiende al shard i)"""
+
+    def __init__(self, clients):
+        self.clients = clients
+        self.shards = len(clients)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await self.sync_stats()
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            raise ValueError(f"Tipo de conexion no soportado: {scope['type']}")
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.extend(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+
+        query_string = scope.get("query_string", b"").decode("latin-1")
+        raw_path = scope.get("raw_path") or quote(scope["path"]).encode()
+        query = {}
+        for name, value in parse_qsl(query_string, keep_blank_values=True):
+            query.setdefault(name, value)
+        request = _Request(scope["method"], scope["path"],
+                           raw_path.decode("latin-1") + (f"?{query_string}" if query_string else ""), query,
+                           [(name.decode("latin-1").lower(), value.decode("latin-1"))
+                            for name, value in scope.get("headers", ())], bytes(body))
+        try:
+            endpoint, arguments = ROUTES.bind("router").match(request.path, method=request.method)
+            status, headers, response_body = await getattr(self, f"_{endpoint}")(request, **arguments)
+        except NotFound:
+            status, headers, response_body = _json_response(404, {"error": "Ruta no encontrada"})
+        except MethodNotAllowed:
+            status, headers, response_body = _json_response(405, {"error": "Metodo no permitido"})
+
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers
+                   if name not in ("content-length", "connection", "keep-alive")]
+        headers.append((b"content-length", str(len(response_body)).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": response_body, "more_body": False})
+
+    async def _forward(self, shard, request, target=None, body=None):
+        headers = [(name, value) for name, value in request.headers if name in FORWARDED_HEADERS]
+        status, response_headers, response_body = await self.clients[shard].request(
+            request.method, target or request.target, headers, request.body if body is None else body)
+        changed = next((value for name, value in response_headers if name == "x-shard-stats"), None)
+        if changed is not None:
+            response_headers = [(name, value) for name, value in response_headers if name != "x-shard-stats"]
+            # Other shards see the new counters before the client gets the response
+            await self._share_stats(shard, json.loads(changed))
+        return status, response_headers, response_body
+
+    async def _share_stats(self, shard, changed):
+        body = json.dumps({"shard": shard, **changed}, separators=(',', ':')).encode()
+        await asyncio.gather(*(client.request("POST", "/_shard/stats", [("Content-Type", "application/json")], body)
+                               for index, client in enumerate(self.clients) if index != shard))
+
+    async def sync_stats(self):
+        """Reparte a los demas shards los contadores locales de cada uno (al arrancar el router)"""
+        for shard, client in enumerate(self.clients):
+            status, _, body = await client.request("GET", "/_shard/stats")
+            if status == 200:
+                await self._share_stats(shard, json.loads(body))
+
+    async def _scatter(self, request, target):
+        """GET a todos los shards; retorna (respuesta de error o None, [cuerpos JSON], [headers])"""
+        responses = await asyncio.gather(*(self._forward(shard, request, target) for shard in range(self.shards)))
+        for response in responses:
+            if response[0] != 200:
+                return response, None, None
+        return None, [json.loads(body) for _, _, body in responses], [dict(headers) for _, headers, _ in responses]
+
+    async def _ride_shard(self, request, alias, ride_id, action=None):
+        # An id that is not a number is not found on any shard; the first one answers the usual 404
+        return await self._forward(shard_for_ride(ride_id, self.shards) if ride_id.isdigit() else 0, request)
+
+    async def _alias_shard(self, request, alias):
+        return await self._forward(shard_for_alias(alias, self.shards), request)
+
+    async def _first_shard(self, request):
+        return await self._forward(0, request)
+
+    async def _metrics(self, request, rest=None):
+        shard = request.query.get("shard", "0")
+        if not shard.isdigit() or int(shard) >= self.shards:
+            return _json_response(400, {"error": f"shard debe ser un entero entre 0 y {self.shards - 1}"})
+        return await self._forward(int(shard), request)
+
+    async def _create_user(self, request):
+        try:
+            alias = json.loads(request.body).get("alias")
+        except (ValueError, AttributeError):
+            alias = None
+        if not isinstance(alias, str):
+            # Same validation error as a single process
+            return await self._forward(0, request)
+        home = shard_for_alias(alias, self.shards)
+        response = await self._forward(home, request)
+        if response[0] == 201:
+            await asyncio.gather(*(self._forward(shard, request) for shard in range(self.shards) if shard != home))
+        return response
+
+    async def _user(self, request, alias):
+        home = shard_for_alias(alias, self.shards)
+        if "fields" in request.query and "rides" not in request.query["fields"].split(','):
+            return await self._forward(home, request)
+        error, users, _ = await self._scatter(request, request.target)
+        if error is not None:
+            return error
+        user = users[home]
+        user["rides"] = list(heapq.merge(*(other["rides"] for other in users), key=lambda ride: ride["id"]))
+        return _json_response(200, user)
+
+    async def _user_rides(self, request, alias):
+        error, pages, _ = await self._scatter(request, request.target)
+        if error is not None:
+            return error
+        return _json_response(200, list(heapq.merge(*pages, key=lambda ride: ride["id"])))
+
+    async def _participations(self, request, alias):
+        limit = request.query.get("limit")
+        cursor = request.query.get("cursor", "0")
+        if limit is not None and (not limit.isdigit() or not 1 <= int(limit) <= MAX_PAGE_LIMIT):
+            return _json_response(400, {"error": f"limit debe ser un entero entre 1 y {MAX_PAGE_LIMIT}"})
+        if not cursor.isdigit():
+            return _json_response(400, {"error": "cursor invalido"})
+        query, added = _fields_for_merge(request.query, ("id",))
+        query = {name: value for name, value in query.items() if name not in ("limit", "cursor", "stream")}
+        error, pages, _ = await self._scatter(request, request.with_query(query))
+        if error is not None:
+            return error
+        # Each shard keeps join order; across shards the ride id orders them
+        items = list(heapq.merge(*(sorted(page, key=lambda item: item["ride"]["id"]) for page in pages),
+                                 key=lambda item: item["ride"]["id"]))
+        start = int(cursor)
+        end = len(items) if limit is None else start + int(limit)
+        page = [dict(item, ride=_strip(item["ride"], added)) for item in items[start:end]]
+        return _json_response(200, page, str(end) if end < len(items) else None)
+
+    async def _merged_page(self, request, required, key, cursor_of, default_limit=None):
+        """Une las paginas de los shards (cada una ya ordenada por key) y corta en limit"""
+        query, added = _fields_for_merge(request.query, required)
+        error, pages, headers = await self._scatter(request, request.with_query(query))
+        if error is not None:
+            return error
+        limit = int(request.query.get("limit") or default_limit or 0) or None
+        items = list(heapq.merge(*pages, key=key))
+        more = any("x-next-cursor" in shard_headers for shard_headers in headers)
+        if limit is not None and len(items) > limit:
+            items = items[:limit]
+            more = True
+        next_cursor = cursor_of(items[-1]) if more and items else None
+        return _json_response(200, [_strip(item, added) for item in items], next_cursor)
+
+    async def _active_rides(self, request):
+        return await self._merged_page(request, ("id",), lambda ride: ride["id"], lambda ride: str(ride["id"]))
+
+    async def _rides_by_time(self, request):
+        def departure(ride):
+            return Ride.parse_departure(ride["rideDateAndTime"]), ride["id"]
+
+        return await self._merged_page(request, ("id", "rideDateAndTime"), departure,
+                                       lambda ride: "%d:%d" % departure(ride))
+
+    async def _search_rides(self, request):
+        # Scores do not depend on the shard's contents, so they compare across shards
+        return await self._ranked(request, 20)
+
+    async def _match_rides(self, request):
+        # The driver's reliability comes from the rides on each shard; the ones a driver creates live on its home shard
+        return await self._ranked(request, 10)
+
+    async def _ranked(self, request, default_limit):
+        """Une los mejores {"ride", "score", ...} de cada shard: por puntaje y, a igual puntaje, por id"""
+        query, added = _fields_for_merge(request.query, ("id",))
+        error, pages, _ = await self._scatter(request, request.with_query(query))
+        if error is not None:
+            return error
+        limit = int(request.query.get("limit") or default_limit)
+        results = heapq.nsmallest(limit, (result for page in pages for result in page),
+                                  key=lambda result: (-result["score"], result["ride"]["id"]))
+        return _json_response(200, [dict(result, ride=_strip(result["ride"], added)) for result in results])
+
+
+def split_data_file(source, shards, directory):
+    """Reparte un data.json de un proceso en data-<i>.json (todos los usuarios, los rides de id % shards == i)"""
+    handler = DataHandler(source)
+    users = handler._all_users()
+    rides = handler._all_rides()
+    os.makedirs(directory, exist_ok=True)
+    for shard in range(shards):
+        write_json_atomic(os.path.join(directory, f"data-{shard}.json"),
+                          schema.snapshot(users, [ride for ride in rides if shard_for_ride(ride.id, shards) == shard]))
+    handler.close()
+
+
+def _run_worker(shard, shards, port, directory):
+    os.environ["RIDES_SHARD"] = f"{shard}/{shards}"
+    os.environ["RIDES_SHARD_DIR"] = directory
+    from src import asgi  # Imported here: the controller builds its handler from the variables above
+    asgi.main(["--port", str(port)])
+
+
+def _run_router(worker_ports, host, port):
+    router = ShardRouter([HttpShardClient("127.0.0.1", worker_port) for worker_port in worker_ports])
+
+    async def run():
+        await router.sync_stats()
+        await serve(router, host, port, reuse_port=True)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def wait_for_port(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not process.is_alive():
+            raise RuntimeError("El proceso termino antes de aceptar conexiones")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nadie acepto conexiones en el puerto {port} a tiempo")
+
+
+def start_cluster(shards, port, directory='.', routers=1, host='127.0.0.1'):
+    """Arranca los workers (puertos port+1 .. port+shards) y los routers (en port); retorna los procesos"""
+    context = multiprocessing.get_context("spawn")
+    directory = os.path.abspath(directory)
+    worker_ports = [port + 1 + shard for shard in range(shards)]
+    workers = [context.Process(target=_run_worker, args=(shard, shards, worker_port, directory), daemon=True)
+               for shard, worker_port in enumerate(worker_ports)]
+    for worker in workers:
+        worker.start()
+    for worker, worker_port in zip(workers, worker_ports):
+        wait_for_port(worker_port, worker)
+    router_processes = [context.Process(target=_run_router, args=(worker_ports, host, port), daemon=True)
+                        for _ in range(routers)]
+    for router in router_processes:
+        router.start()
+    wait_for_port(port, router_processes[0])
+    return workers + router_processes
+
+
+def stop_cluster(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.sharding", description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8000, help="puerto del router (los workers usan los siguientes)")
+    parser.add_argument("--routers", type=int, default=1, help="procesos router escuchando en el mismo puerto")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--data-dir", default=".", help="directorio de los data-<i>.json")
+    parser.add_argument("--split", metavar="DATA_JSON", help="reparte antes este data.json entre los shards")
+    args = parser.parse_args(argv)
+
+    if args.split:
+        split_data_file(args.split, args.shards, args.data_dir)
+    processes = start_cluster(args.shards, args.port, args.data_dir, args.routers, args.host)
+    print(f"{args.shards} shards detras de {args.routers} router(s) en http://{args.host}:{args.port}")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_cluster(processes)
+
+
+if __name__ == '__main__':
+    main()
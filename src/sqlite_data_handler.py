@@ -0,0 +1,137 @@
+import sqlite3
+import threading
+from src.data_handler import DataHandler
+from src.lazy_data_handler import LazyDataHandler
+from src.models.ride import Ride
+from src.models.RideParticipation import RideParticipation
+from src.storage import sqlite_store
+from src.storage.sqlite_store import SqliteReader, StorageError
+
+
+class SqliteDataHandler(LazyDataHandler):
+    """DataHandler respaldado por una base SQLite (ver src/storage/sqlite_store.py).
+
+    Cada mutacion escribe sus filas en una transaccion propia mientras tiene el
+    lock del ride, asi que al volver ya esta confirmada en la base y no hay un
+    archivo que reescribir. Si la transaccion falla, el ride y sus participantes
+    vuelven al estado de la base y se lanza StorageError. Los objetos se materializan bajo demanda como en
+    LazyDataHandler y los modificados no necesitan quedar retenidos: si salen
+    del cache se vuelven a leer de la base. Orden de locks: ride.lock ->
+    DataHandler._lock -> lock de la conexion.
+    """
+
+    def __init__(self, filename='data.db', cache_size=10000, wal=None, **kwargs):
+        self._db_lock = threading.Lock()
+        self._db = None
+        super().__init__(filename, cache_size=cache_size, wal=wal, **kwargs)
+
+    def _open_reader(self):
+        self._db = sqlite_store.connect(self.filename)
+        return SqliteReader(self._db, self._db_lock)
+
+    def _index_user(self, user):
+        with self._lock:
+            self._aliases.append(user.alias)
+            self._user_cache.add(user.alias, user)
+
+    def _index_ride(self, ride):
+        with self._lock:
+            self._ride_ids.append(ride.id)
+            self._ride_cache.add(ride.id, ride)
+            self._index_departure(ride.id, ride.departure_ts)
+            if ride.status in ride.ACTIVE_STATUSES:
+                self._activate_ride(ride.id)
+
+    def _ride_changed(self, ride, participants=()):
+        # Rows were already written in _log; skip LazyDataHandler's pinning
+        DataHandler._ride_changed(self, ride, participants)
+
+    def _user_changed(self, user):
+        # History counters are derived from the stored participations
+        DataHandler._user_changed(self, user)
+
+    def _log(self, event_type, **payload):
+        statements = self._event_statements(event_type, payload)
+        # Each mutation commits exactly one transaction before its lock is released
+        try:
+            with self._db_lock:
+                self._db.execute("BEGIN")
+                try:
+                    for sql, rows in statements:
+                        self._db.executemany(sql, rows)
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    if self._db.in_transaction:
+                        self._db.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            # New users and rides are logged before they are indexed; a ride mutation was already applied
+            if 'rideId' in payload:
+                self._restore_ride(self.get_ride(payload['rideId']))
+            raise StorageError(f"No se pudo guardar el cambio: {e}") from e
+
+    def _restore_ride(self, ride):
+        """Vuelve el ride y a sus participantes al estado confirmado en la base (el llamador tiene el lock del ride)"""
+        record = self._reader.ride(ride.id)
+        participants = {participation.participant.alias: participation.participant
+                        for participation in ride.participants}
+        ride.restore_state(record['status'], [
+            RideParticipation.restore(self.get_user(participation_data['participant']),
+                                      participation_data['destination'], participation_data['status'],
+                                      participation_data['confirmation'], participation_data['occupiedSpaces'])
+            for participation_data in record['participations']])
+        for user in participants.values():
+            user_record = self._reader.user(user.alias)
+            user.adjust_participation_stats(dict(user.participation_stats), user_record['stats'])
+            user.joined_ride_ids = user_record['joinedRides']
+        with self._lock:
+            if ride.status in Ride.ACTIVE_STATUSES and ride.id not in self._active_rides:
+                self._activate_ride(ride.id)
+        self._ride_changed(ride, list(participants.values()))
+
+    def _event_statements(self, event_type, payload):
+        """Sentencias (sql, filas) que dejan la base igual que el estado en memoria tras el evento"""
+        if event_type == 'user_added':
+            return [(sqlite_store.INSERT_USER, [(payload['alias'], payload['name'], payload['carPlate'])])]
+        if event_type == 'ride_added':
+            return [(sqlite_store.INSERT_RIDE, [(payload['id'], payload['rideDateAndTime'], payload['finalAddress'],
+                                                 payload['allowedSpaces'], payload['driver'], 'ready')])]
+        # The caller holds the ride, so get_ride hands back the object it just mutated
+        ride = self.get_ride(payload['rideId'])
+        if event_type == 'participant_joined':
+            participation = ride._participations_by_alias[payload['participant']]
+            return [(sqlite_store.INSERT_PARTICIPATION, [sqlite_store.participation_row(ride, participation)])]
+        if 'participant' in payload:
+            participations = [ride._participations_by_alias[payload['participant']]]
+            statements = []
+        elif 'operations' in payload:
+            aliases = dict.fromkeys(alias for _, alias in payload['operations'])
+            participations = [ride._participations_by_alias[alias] for alias in aliases]
+            statements = []
+        else:
+            participations = ride.participants  # Iniciar o terminar mueve a todos los participantes
+            statements = [(sqlite_store.UPDATE_RIDE_STATUS, [(ride.status, ride.id)])]
+        statements.append((sqlite_store.UPDATE_PARTICIPATION,
+                           [sqlite_store.participation_update(ride, participation)
+                            for participation in participations]))
+        return statements
+
+    def _persist(self):
+        """Nada que hacer: la transaccion de la mutacion ya se confirmo"""
+
+    def save_data(self):
+        """Los cambios ya estan en la base; solo traslada el log WAL de SQLite al archivo principal"""
+        with self._db_lock:
+            self._db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def _write_data_file(self):
+        self.save_data()
+
+    def on_persisted(self, callback):
+        """Cada mutacion ya confirmo su transaccion"""
+        callback(None)
+
+    def close(self):
+        if self._reader is not None:
+            self.save_data()
+        super().close()
@@ -0,0 +1,150 @@
+"""Archivo frio de rides terminados (ver DataHandler.archive_done_rides).
+
+Los rides archivados se guardan en segmentos append-only (archive-000001.seg,
+archive-000002.seg, ...) dentro de un directorio. Cada escritura agrega bloques
+de hasta BLOCK_RIDES rides:
+  cabecera BLOCK: magic, largo del indice, largo del contenido y crc32 de ambos
+  indice JSON sin comprimir: [[id, [[participante, estado], ...]], ...]
+  contenido: los registros de snapshot.ride_record, uno por linea, con zlib
+Abrir el archivo solo lee cabeceras e indices (sin descomprimir nada) para
+saber en que bloque esta cada ride; el indice de participantes permite ademas
+reconstruir el historial de los usuarios al cargar. Un ride se lee
+descomprimiendo su bloque. Un bloque cortado por un crash al final de un
+segmento se descarta.
+"""
+import json
+import os
+import re
+import struct
+import threading
+import zlib
+
+from src.storage import snapshot
+
+MAGIC = b'RARC'
+BLOCK = struct.Struct('<4sIII')
+BLOCK_RIDES = 256
+SEGMENT_BYTES = 64 * 1024 * 1024
+SEGMENT_NAME = re.compile(r'archive-(\d{6})\.seg$')
+OFFSET_BITS = 40  # Ubicacion de un bloque empaquetada en un int: segmento << OFFSET_BITS | offset
+
+
+class RideArchive:
+    """Segmentos append-only con los rides archivados; append y get son seguros entre hilos"""
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.bytes_written = 0  # Bytes agregados desde que se abrio
+        self._locations = {}  # ride_id -> ubicacion del ultimo bloque que lo contiene
+        self._segment = 1
+        self._file = None
+        self._lock = threading.Lock()
+        for _ in self._scan():
+            pass
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __contains__(self, ride_id):
+        return ride_id in self._locations
+
+    def _segment_filename(self, number):
+        return os.path.join(self.directory, f"archive-{number:06d}.seg")
+
+    def _segment_numbers(self):
+        return sorted(int(match.group(1)) for match in map(SEGMENT_NAME.match, os.listdir(self.directory)) if match)
+
+    def _scan(self):
+        """Recorre los bloques completos de todos los segmentos, indexando cada ride; genera (ubicacion, indice)"""
+        for number in self._segment_numbers():
+            filename = self._segment_filename(number)
+            valid_end = 0
+            with open(filename, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                while valid_end + BLOCK.size <= size:
+                    magic, index_length, payload_length, _ = BLOCK.unpack(f.read(BLOCK.size))
+                    block_end = valid_end + BLOCK.size + index_length + payload_length
+                    if magic != MAGIC or block_end > size:
+                        break
+                    entries = json.loads(f.read(index_length))
+                    location = number << OFFSET_BITS | valid_end
+                    for ride_id, _ in entries:
+                        self._locations[ride_id] = location
+                    yield location, entries
+                    f.seek(block_end)
+                    valid_end = block_end
+            if valid_end != size:
+                # A block torn by a crash mid-append is dropped, like the WAL's last line
+                with open(filename, 'r+b') as f:
+                    f.truncate(valid_end)
+            self._segment = number
+
+    def participations(self):
+        """Genera (alias, ride_id, estado) de las participaciones de los rides archivados, en orden de archivo"""
+        with self._lock:
+            blocks = list(self._scan())
+        for location, entries in blocks:
+            for ride_id, participants in entries:
+                # A ride archived twice (crash before the data file was rewritten) counts once
+                if self._locations.get(ride_id) == location:
+                    for alias, status in participants:
+                        yield alias, ride_id, status
+
+    def append(self, records):
+        """Agrega los registros (snapshot.ride_record) y los deja en disco antes de retornar"""
+        with self._lock:
+            located = []
+            for start in range(0, len(records), BLOCK_RIDES):
+                if self._file is None or self._file.tell() >= self.segment_bytes:
+                    self._open_segment()
+                batch = records[start:start + BLOCK_RIDES]
+                index = json.dumps([[record["id"], [[participation["participant"], participation["status"]]
+                                                    for participation in record["participations"]]]
+                                    for record in batch], separators=(',', ':')).encode()
+                payload = zlib.compress(b''.join(snapshot.encode(record) for record in batch))
+                location = self._segment << OFFSET_BITS | self._file.tell()
+                block = BLOCK.pack(MAGIC, len(index), len(payload), zlib.crc32(index + payload)) + index + payload
+                self._file.write(block)
+                self.bytes_written += len(block)
+                located.extend((record["id"], location) for record in batch)
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            # Readers only see rides whose block is already on disk
+            self._locations.update(located)
+
+    def _open_segment(self):
+        if self._file is not None:
+            self._file.close()
+            self._segment += 1
+        elif os.path.exists(self._segment_filename(self._segment)) and \
+                os.path.getsize(self._segment_filename(self._segment)) >= self.segment_bytes:
+            self._segment += 1
+        self._file = open(self._segment_filename(self._segment), 'ab')
+
+    def get(self, ride_id):
+        """Registro del ride archivado, o None si no esta en el archivo"""
+        location = self._locations.get(ride_id)
+        if location is None:
+            return None
+        offset = location & ((1 << OFFSET_BITS) - 1)
+        with open(self._segment_filename(location >> OFFSET_BITS), 'rb') as f:
+            f.seek(offset)
+            magic, index_length, payload_length, crc = BLOCK.unpack(f.read(BLOCK.size))
+            data = f.read(index_length + payload_length)
+        if magic != MAGIC or zlib.crc32(data) != crc:
+            raise ValueError(f"Bloque del archivo corrupto en {location >> OFFSET_BITS}:{offset}")
+        records = zlib.decompress(data[index_length:])
+        # ride_record starts with the id, so only the matching line is parsed
+        start = records.find(b'{"id":%d,' % ride_id)
+        if start == -1:
+            return None
+        return json.loads(records[start:records.index(b'\n', start)])
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,30 @@
+import json
+import os
+
+
+def write_json_atomic(filename, data):
+    """Escribe data en un archivo temporal y lo renombra sobre filename.
+
+    Un lector (o un reinicio tras un crash) ve el archivo anterior completo o el
+    nuevo completo, nunca uno a medio escribir. Retorna los bytes escritos.
+    """
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+        written = os.fstat(f.fileno()).st_size
+    os.replace(tmp_filename, filename)
+    return written
+
+
+def write_chunks_atomic(filename, chunks):
+    """Como write_json_atomic, para un contenido ya serializado que llega en partes (str)"""
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'w') as f:
+        f.writelines(chunks)
+        f.flush()
+        os.fsync(f.fileno())
+        written = os.fstat(f.fileno()).st_size
+    os.replace(tmp_filename, filename)
+    return written
@@ -0,0 +1,61 @@
+import weakref
+from collections import OrderedDict
+
+
+class ObjectCache:
+    """Mapa de identidad con un LRU acotado para objetos materializados desde disco.
+
+    - Mientras alguien tenga una referencia a un objeto, get() retorna ese mismo
+      objeto (weakrefs), asi nunca hay dos User para el mismo alias.
+    - Ademas se retienen los capacity objetos usados mas recientemente.
+    - Los objetos marcados con pin() (modificados y aun no persistidos) no se
+      liberan hasta unpin_through() con una generacion igual o posterior.
+
+    No es seguro entre hilos por si mismo; el handler lo usa bajo su lock.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._identity = weakref.WeakValueDictionary()
+        self._recent = OrderedDict()
+        self._pinned = {}  # key -> (objeto, generacion en la que se modifico)
+
+    def get(self, key):
+        obj = self._identity.get(key)
+        if obj is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, obj)
+        return obj
+
+    def add(self, key, obj):
+        self._identity[key] = obj
+        self._remember(key, obj)
+
+    def _remember(self, key, obj):
+        self._recent[key] = obj
+        self._recent.move_to_end(key)
+        if len(self._recent) > self.capacity:
+            self._recent.popitem(last=False)
+
+    def pin(self, key, obj):
+        self._pinned[key] = (obj, self.generation)
+
+    def pinned(self):
+        """{clave: objeto} de los objetos modificados y aun no persistidos"""
+        return {key: obj for key, (obj, _) in self._pinned.items()}
+
+    def next_generation(self):
+        """Cierra la generacion actual y la retorna; los pin() siguientes quedan en la nueva"""
+        self.generation += 1
+        return self.generation - 1
+
+    def unpin_through(self, generation):
+        self._pinned = {key: entry for key, entry in self._pinned.items() if entry[1] > generation}
+
+    def __len__(self):
+        return len(self._identity)
@@ -0,0 +1,300 @@
+"""Indices para sugerir rides a un pasajero (ver DataHandler.match_rides).
+
+El puntaje de un ride combina, cada parte entre 0 y 1:
+  - cercania de la hora de salida a la hora preferida, relativa a la ventana
+  - similitud del destino buscado con finalAddress: por cada palabra buscada la
+    mejor similitud de trigramas con una palabra de la direccion, promediada
+  - confiabilidad del conductor segun el historial de los rides que maneja
+"""
+import bisect
+import heapq
+import itertools
+import math
+import threading
+
+from src.storage.search_index import similar_tokens, tokenize, trigrams
+
+TIME_WEIGHT = 0.4
+ADDRESS_WEIGHT = 0.4
+RELIABILITY_WEIGHT = 0.2
+# Participaciones que el conductor acepto, sin importar como terminaron
+ACCEPTED_STATUSES = frozenset(("confirmed", "inprogress", "done", "notmarked", "missing"))
+NO_OUTCOME = (0, 0, 0, 0)
+
+
+def reliability(accepted, rejected, done, notmarked):
+    """Confiabilidad de un conductor: acepta las solicitudes y cierra bien los viajes.
+
+    Producto de dos proporciones suavizadas: solicitudes aceptadas sobre
+    decididas, y pasajeros bajados (done) sobre bajados mas los que quedaron sin
+    marcar al terminar el ride (notmarked). Sin historial da 0.25.
+    """
+    return (accepted + 1) / (accepted + rejected + 2) * (done + 1) / (done + notmarked + 2)
+
+
+NEW_DRIVER_RELIABILITY = reliability(*NO_OUTCOME)
+
+
+def address_tokens(text):
+    """Palabras de una direccion que cuentan para la similitud (sin los numeros de calle)"""
+    return [token for token in dict.fromkeys(tokenize(text)) if not token.isdigit()]
+
+
+def ride_outcome(ride):
+    """(aceptadas, rechazadas, done, notmarked) de las participaciones del ride"""
+    accepted = rejected = done = notmarked = 0
+    for participation in list(ride.participants):
+        status = participation.status
+        if status in ACCEPTED_STATUSES:
+            accepted += 1
+            if status == "done":
+                done += 1
+            elif status == "notmarked":
+                notmarked += 1
+        elif status == "rejected":
+            rejected += 1
+    return accepted, rejected, done, notmarked
+
+
+def is_open(ride):
+    """Un ride recibe pasajeros si esta ready, tiene hora valida y le quedan espacios"""
+    return ride.status == "ready" and ride.departure_ts is not None and ride.available_spaces() > 0
+
+
+class MatchIndex:
+    """Rides abiertos por hora y por palabra de finalAddress, y contadores de historial por conductor.
+
+    Los rides abiertos estan en una lista ordenada por (departure_ts, id) y, por
+    cada palabra de su direccion, en otra igual; el vocabulario esta indexado por
+    trigramas como en DestinationIndex. Una busqueda recorre, del mas cercano a
+    la hora preferida al mas lejano, primero los rides de la ventana cuya
+    direccion se parece al destino y despues los demas, y cada recorrido se
+    detiene cuando ya ningun ride restante puede superar a los elegidos.
+
+    Se carga una vez con load() y despues lo mantiene update() (que se puede
+    llamar desde antes: esos cambios se aplican al terminar la carga). Tiene su
+    propio lock y no toma ningun otro salvo el de un ride durante load().
+    """
+
+    def __init__(self):
+        self._open = []  # (departure_ts, ride_id) de los rides abiertos, ordenada
+        self._open_drivers = {}  # ride_id abierto -> alias del conductor
+        self._postings = {}  # palabra -> [(departure_ts, ride_id)] ordenada
+        self._trigrams = {}  # trigrama -> {palabras}
+        self._ride_outcomes = {}  # ride_id -> ride_outcome, solo los que tienen participaciones decididas
+        self._driver_outcomes = {}  # alias -> [aceptadas, rechazadas, done, notmarked]
+        self._reliability = {}  # alias -> confiabilidad, solo conductores con historial
+        self._best_reliability = []  # heap (-confiabilidad, alias) con entradas viejas que se descartan al mirar
+        self._pending = {}  # ride_id -> ride actualizado durante la carga (None despues de cargar)
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._open_drivers)
+
+    def load(self, rides):
+        """Indexa rides (todos los del handler) de una vez, ordenando cada lista al final"""
+        open_keys = []
+        open_drivers = {}
+        postings = {}
+        ride_outcomes = {}
+        driver_outcomes = {}
+        for ride in rides:
+            with ride.lock:
+                outcome = ride_outcome(ride)
+                opened = is_open(ride)
+            driver = ride.driver.alias
+            if outcome != NO_OUTCOME:
+                ride_outcomes[ride.id] = outcome
+                counts = driver_outcomes.setdefault(driver, [0, 0, 0, 0])
+                for position, value in enumerate(outcome):
+                    counts[position] += value
+            if opened:
+                key = (ride.departure_ts, ride.id)
+                open_keys.append(key)
+                open_drivers[ride.id] = driver
+                for token in address_tokens(ride.final_address):
+                    postings.setdefault(token, []).append(key)
+        open_keys.sort()
+        for posting in postings.values():
+            posting.sort()
+        with self._lock:
+            self._open = open_keys
+            self._open_drivers = open_drivers
+            self._postings = postings
+            for token in postings:
+                for trigram in trigrams(token):
+                    self._trigrams.setdefault(trigram, set()).add(token)
+            self._ride_outcomes = ride_outcomes
+            self._driver_outcomes = driver_outcomes
+            self._reliability = {driver: reliability(*counts) for driver, counts in driver_outcomes.items()}
+            self._best_reliability = [(-value, driver) for driver, value in self._reliability.items()]
+            heapq.heapify(self._best_reliability)
+            pending, self._pending = self._pending, None
+            for ride in pending.values():
+                self._update(ride)
+        self._loaded.set()
+
+    def update(self, ride):
+        """Reindexa el ride con su estado actual"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending[ride.id] = ride
+                return
+            self._update(ride)
+
+    def _update(self, ride):
+        driver = ride.driver.alias
+        outcome = ride_outcome(ride)
+        previous = self._ride_outcomes.get(ride.id, NO_OUTCOME)
+        if outcome != previous:
+            counts = self._driver_outcomes.setdefault(driver, [0, 0, 0, 0])
+            for position, value in enumerate(outcome):
+                counts[position] += value - previous[position]
+            if outcome == NO_OUTCOME:
+                del self._ride_outcomes[ride.id]
+            else:
+                self._ride_outcomes[ride.id] = outcome
+            value = self._reliability[driver] = reliability(*counts)
+            heapq.heappush(self._best_reliability, (-value, driver))
+            if len(self._best_reliability) > 2 * len(self._reliability) + 1000:
+                self._best_reliability = [(-value, alias) for alias, value in self._reliability.items()]
+                heapq.heapify(self._best_reliability)
+
+        opened = is_open(ride)
+        if opened == (ride.id in self._open_drivers):
+            return
+        key = (ride.departure_ts, ride.id)
+        if opened:
+            bisect.insort(self._open, key)
+            self._open_drivers[ride.id] = driver
+            for token in address_tokens(ride.final_address):
+                posting = self._postings.get(token)
+                if posting is None:
+                    posting = self._postings[token] = []
+                    for trigram in trigrams(token):
+                        self._trigrams.setdefault(trigram, set()).add(token)
+                bisect.insort(posting, key)
+        else:
+            self._remove_key(self._open, key)
+            del self._open_drivers[ride.id]
+            for token in address_tokens(ride.final_address):
+                posting = self._postings[token]
+                self._remove_key(posting, key)
+                if not posting:
+                    del self._postings[token]
+                    for trigram in trigrams(token):
+                        tokens = self._trigrams[trigram]
+                        tokens.discard(token)
+                        if not tokens:
+                            del self._trigrams[trigram]
+
+    @staticmethod
+    def _remove_key(keys, key):
+        position = bisect.bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            del keys[position]
+
+    def driver_reliability(self, alias):
+        with self._lock:
+            return self._reliability.get(alias, NEW_DRIVER_RELIABILITY)
+
+    def _max_reliability(self):
+        heap = self._best_reliability
+        while heap and self._reliability.get(heap[0][1]) != -heap[0][0]:
+            heapq.heappop(heap)
+        return max(-heap[0][0], NEW_DRIVER_RELIABILITY) if heap else NEW_DRIVER_RELIABILITY
+
+    def match(self, destination, ts_from, ts_to, at, limit, exclude_ride_ids=(), exclude_driver=None):
+        """Retorna [(ride_id, puntaje, cercania, similitud, confiabilidad)] de los limit mejores rides abiertos.
+
+        Solo considera rides que salen entre ts_from y ts_to; at es la hora
+        preferida. Ordena por puntaje y, a igual puntaje, por id.
+        """
+        self._loaded.wait()
+        tokens = address_tokens(destination)
+        span = max(at - ts_from, ts_to - at, 1)
+        top = []  # min-heap (puntaje, -ride_id, cercania, similitud, confiabilidad)
+
+        def offer(ride_id, time_score, address_score):
+            partial = TIME_WEIGHT * time_score + ADDRESS_WEIGHT * address_score
+            if len(top) == limit and partial + RELIABILITY_WEIGHT * best_reliability < top[0][0]:
+                return
+            driver = self._open_drivers[ride_id]
+            if ride_id in exclude_ride_ids or driver == exclude_driver:
+                return
+            driver_score = self._reliability.get(driver, NEW_DRIVER_RELIABILITY)
+            score = partial + RELIABILITY_WEIGHT * driver_score
+            item = (score, -ride_id, time_score, address_score, driver_score)
+            if len(top) < limit:
+                heapq.heappush(top, item)
+            elif item > top[0]:
+                heapq.heapreplace(top, item)
+
+        with self._lock:
+            best_reliability = self._max_reliability()
+
+            # Rides in the window whose address resembles the destination, nearest departure first. A ride has the
+            # same departure in every posting, so all its entries come out together with those at the same distance
+            cursors = []  # min-heap (distancia a at, serial, posicion, paso, fin, posting, palabra buscada, similitud)
+            serial = itertools.count()
+            best_address = 0.0
+            for position, token in enumerate(tokens):
+                candidates = similar_tokens(self._trigrams, token)
+                best_address += max(candidates.values(), default=0.0) / len(tokens)
+                for candidate, similarity in candidates.items():
+                    posting = self._postings[candidate]
+                    low = bisect.bisect_left(posting, (ts_from,))
+                    high = bisect.bisect_right(posting, (ts_to, math.inf))
+                    middle = min(max(bisect.bisect_left(posting, (at,)), low), high)
+                    for index, step, stop in ((middle - 1, -1, low - 1), (middle, 1, high)):
+                        if index != stop:
+                            cursors.append((abs(posting[index][0] - at), next(serial), index, step, stop, posting,
+                                            position, similarity))
+            heapq.heapify(cursors)
+            matched = {}  # ride_id -> [mejor similitud por palabra buscada]
+            while cursors:
+                distance = cursors[0][0]
+                time_score = 1 - distance / span
+                if len(top) == limit and (TIME_WEIGHT * time_score + ADDRESS_WEIGHT * best_address
+                                          + RELIABILITY_WEIGHT * best_reliability) < top[0][0]:
+                    break
+                group = []
+                while cursors and cursors[0][0] == distance:
+                    _, _, index, step, stop, posting, position, similarity = heapq.heappop(cursors)
+                    departure_ts = posting[index][0]
+                    while index != stop and posting[index][0] == departure_ts:  # Rides leaving at the same time
+                        ride_id = posting[index][1]
+                        entry = matched.get(ride_id)
+                        if entry is None:
+                            entry = matched[ride_id] = [0.0] * len(tokens)
+                            group.append(ride_id)
+                        if similarity > entry[position]:
+                            entry[position] = similarity
+                        index += step
+                    if index != stop:
+                        heapq.heappush(cursors, (abs(posting[index][0] - at), next(serial), index, step, stop,
+                                                 posting, position, similarity))
+                for ride_id in group:
+                    offer(ride_id, time_score, sum(matched[ride_id]) / len(tokens))
+
+            # The rest of the window, nearest departure first, while one could still enter the top
+            keys = self._open
+            low = bisect.bisect_left(keys, (ts_from,))
+            high = bisect.bisect_right(keys, (ts_to, math.inf))
+            right = min(max(bisect.bisect_left(keys, (at,)), low), high)
+            left = right - 1
+            while left >= low or right < high:
+                if right >= high or (left >= low and at - keys[left][0] <= keys[right][0] - at):
+                    departure_ts, ride_id = keys[left]
+                    left -= 1
+                else:
+                    departure_ts, ride_id = keys[right]
+                    right += 1
+                time_score = 1 - abs(departure_ts - at) / span
+                if len(top) == limit and TIME_WEIGHT * time_score + RELIABILITY_WEIGHT * best_reliability < top[0][0]:
+                    break
+                if ride_id not in matched:
+                    offer(ride_id, time_score, 0.0)
+        return [(-negative_id, score, time_score, address_score, driver_score)
+                for score, negative_id, time_score, address_score, driver_score in sorted(top, reverse=True)]
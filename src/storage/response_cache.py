@@ -0,0 +1,119 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """LRU de respuestas JSON ya serializadas, con invalidacion por dependencias.
+
+    Cada entrada guarda el cuerpo, su ETag y las dependencias de las que se
+    derivo:
+      ("ride", id)        el ride en si (estado, participantes, espacios)
+      ("driver", alias)   la lista de rides del conductor
+      ("stats", alias)    los contadores de historial del participante, que se
+                          copian en cada ride donde aparece
+    Invalidar una dependencia borra solo las entradas que la usan. Una entrada
+    serializada mientras otra mutacion invalidaba algo no se guarda (ver put).
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (cuerpo, etag, dependencias)
+        self._dependents = {}  # dependencia -> {keys}
+        self._seq = 0  # Se incrementa en cada invalidacion
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def ride_dependencies(ride):
+        with ride.lock:
+            return [("ride", ride.id)] + [("stats", participation.participant.alias)
+                                          for participation in ride.participants]
+
+    @classmethod
+    def driver_dependencies(cls, user):
+        dependencies = [("driver", user.alias)]
+        for ride in user.rides:
+            dependencies.extend(cls.ride_dependencies(ride))
+        return dependencies
+
+    def get(self, key):
+        """Retorna (cuerpo, etag) o None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def token(self):
+        """Marca a pasar a put() tomada antes de leer los objetos a serializar"""
+        with self._lock:
+            return self._seq
+
+    def put(self, key, body, dependencies, token):
+        """Guarda el cuerpo y retorna (cuerpo, etag).
+
+        Si hubo invalidaciones desde token la entrada podria estar desactualizada,
+        asi que se entrega pero no se guarda.
+        """
+        etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        with self._lock:
+            if self.capacity > 0 and token == self._seq:
+                self._remove(key)
+                dependencies = frozenset(dependencies)
+                self._entries[key] = (body, etag, dependencies)
+                for dependency in dependencies:
+                    self._dependents.setdefault(dependency, set()).add(key)
+                if len(self._entries) > self.capacity:
+                    self._remove(next(iter(self._entries)))
+        return body, etag
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for dependency in entry[2]:
+            keys = self._dependents.get(dependency)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._dependents[dependency]
+
+    def invalidate(self, dependencies):
+        with self._lock:
+            self._seq += 1
+            for dependency in dependencies:
+                for key in list(self._dependents.get(dependency, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def invalidate_ride(self, ride, participants=()):
+        """Un ride cambio; participants son los usuarios cuyos contadores de historial cambiaron"""
+        self.invalidate([("ride", ride.id), ("driver", ride.driver.alias)]
+                        + [("stats", participant.alias) for participant in participants])
+
+    def invalidate_user(self, user):
+        self.invalidate([("driver", user.alias), ("stats", user.alias)])
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "notModified": self.not_modified,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "capacity": self.capacity
+            }
@@ -0,0 +1,132 @@
+"""Formato en disco de data.json.
+
+Version 2 (actual): usuarios, rides y participaciones como registros planos que
+se referencian por alias / id. Cada ride se escribe una sola vez y los
+contadores de historial no se guardan porque se derivan de las participaciones.
+
+snapshot_chunks escribe el mismo documento que json.dump(snapshot(...)) a partir
+de fragmentos ya codificados de cada usuario y ride (ver encode_ride), asi quien
+los guarde solo vuelve a codificar lo que cambio.
+
+Version 1 (sin campo "version"): cada usuario embebe get_user_info() con sus
+rides completos y cada ride vuelve a aparecer bajo "rides" con los
+participantes y sus contadores recalculados.
+"""
+
+import json
+
+SCHEMA_VERSION = 2
+
+
+def user_record(user):
+    return {"alias": user.alias, "name": user.name, "carPlate": user.car_plate}
+
+
+def ride_record(ride):
+    return {
+        "id": ride.id,
+        "rideDateAndTime": ride.ride_date_and_time,
+        "finalAddress": ride.final_address,
+        "allowedSpaces": ride.allowed_spaces,
+        "driver": ride.driver.alias,
+        "status": ride.status
+    }
+
+
+def participation_record(ride, participation):
+    return {
+        "rideId": ride.id,
+        "participant": participation.participant.alias,
+        "destination": participation.destination,
+        "status": participation.status,
+        "confirmation": participation.confirmation,
+        "occupiedSpaces": participation.occupied_spaces
+    }
+
+
+def snapshot(users, rides):
+    ride_records = []
+    participation_records = []
+    for ride in rides:
+        # The ride and its participations are captured from the same state
+        with ride.lock:
+            ride_records.append(ride_record(ride))
+            participation_records.extend(participation_record(ride, participation)
+                                         for participation in ride.participants)
+    return {
+        "version": SCHEMA_VERSION,
+        "users": [user_record(user) for user in users],
+        "rides": ride_records,
+        "participations": participation_records
+    }
+
+
+def encode_user(user):
+    return json.dumps(user_record(user))
+
+
+def encode_ride(ride):
+    """(registro del ride, sus registros de participacion separados por ", ") codificados como en json.dump"""
+    with ride.lock:
+        return (json.dumps(ride_record(ride)),
+                ', '.join(json.dumps(participation_record(ride, participation)) for participation in ride.participants))
+
+
+def snapshot_chunks(encoded_users, encoded_rides):
+    """Genera el JSON de snapshot() en partes.
+
+    encoded_users: iterable de encode_user(user); encoded_rides: iterable de encode_ride(ride).
+    """
+    yield '{"version": %d, "users": [' % SCHEMA_VERSION
+    yield ', '.join(encoded_users)
+    yield '], "rides": ['
+    participations = []
+    for index, (ride, ride_participations) in enumerate(encoded_rides):
+        yield ', ' + ride if index else ride
+        if ride_participations:
+            participations.append(ride_participations)
+    yield '], "participations": ['
+    yield ', '.join(participations)
+    yield ']}'
+
+
+def migrate(data):
+    """Convierte un data.json de cualquier version soportada al formato actual"""
+    version = data.get("version", 1)
+    if version == SCHEMA_VERSION:
+        return data
+    if version != 1:
+        raise ValueError(f"Version de data.json no soportada: {version}")
+
+    rides = []
+    participations = []
+    for index, ride_data in enumerate(data.get("rides", [])):
+        ride_id = int(ride_data.get("id", index + 1))
+        rides.append({
+            "id": ride_id,
+            "rideDateAndTime": ride_data["rideDateAndTime"],
+            "finalAddress": ride_data["finalAddress"],
+            "allowedSpaces": int(ride_data.get("allowedSpaces", 4)),
+            "driver": ride_data["driver"],
+            "status": ride_data.get("status", "ready")
+        })
+        for participant_data in ride_data.get("participants", []):
+            participations.append({
+                "rideId": ride_id,
+                "participant": participant_data["participant"]["alias"],
+                "destination": participant_data["destination"],
+                "status": participant_data.get("status", "waiting"),
+                "confirmation": participant_data.get("confirmation"),
+                "occupiedSpaces": participant_data.get("occupiedSpaces", 1)
+            })
+
+    migrated = {
+        "version": SCHEMA_VERSION,
+        "users": [{"alias": user_data["alias"], "name": user_data["name"],
+                   "carPlate": user_data.get("carPlate")} for user_data in data.get("users", [])],
+        "rides": rides,
+        "participations": participations
+    }
+    if "walSeq" in data:
+        migrated["walSeq"] = data["walSeq"]
+    return migrated
@@ -0,0 +1,188 @@
+import heapq
+import re
+import threading
+import unicodedata
+
+from src.models.ride import Ride
+
+# Words that appear in almost every address and would only add noise to the ranking
+STOPWORDS = frozenset(("de", "del", "la", "las", "el", "los", "y", "av", "avenida", "jr", "jiron", "calle", "ca"))
+ADDRESS_WEIGHT = 2.0  # Coincidir con finalAddress pesa mas que con el destino de un participante
+DESTINATION_WEIGHT = 1.0
+MIN_SIMILARITY = 0.35  # Similitud de trigramas minima para considerar dos palabras equivalentes
+MAX_COMBINATIONS = 10_000  # Tope de combinaciones por busqueda, para consultas con muchas palabras
+
+
+def tokenize(text):
+    """Palabras normalizadas (minusculas, sin tildes) de un texto"""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode().lower()
+    return [token for token in re.split(r"[^a-z0-9]+", text) if token and token not in STOPWORDS]
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similar_tokens(vocabulary, token):
+    """{palabra: similitud} de las palabras de vocabulary (trigrama -> {palabras}) parecidas a token"""
+    query_trigrams = trigrams(token)
+    shared = {}
+    for trigram in query_trigrams:
+        for candidate in vocabulary.get(trigram, ()):
+            shared[candidate] = shared.get(candidate, 0) + 1
+    similar = {}
+    for candidate, count in shared.items():
+        similarity = count / (len(query_trigrams) + len(trigrams(candidate)) - count)
+        if similarity >= MIN_SIMILARITY:
+            similar[candidate] = similarity
+    return similar
+
+
+class DestinationIndex:
+    """Indice invertido de palabras de finalAddress y de los destinos de los participantes.
+
+    Solo contiene rides activos. Cada palabra apunta a {peso: {ride_ids}} y ademas
+    las palabras del vocabulario estan indexadas por trigramas, asi una busqueda
+    encuentra tambien palabras parecidas ("surqillo", "miraf"). El puntaje de un
+    ride es la suma, por palabra buscada, de la mejor similitud * peso.
+
+    Como los pesos posibles son pocos, cada palabra tiene pocos niveles de
+    puntaje y una busqueda se resuelve intersectando conjuntos de ids, sin
+    recorrer en Python todos los rides que coinciden.
+
+    Tiene su propio lock y no toma ningun otro, asi que se puede actualizar con
+    el lock de un ride tomado.
+    """
+
+    def __init__(self):
+        self._postings = {}  # palabra -> {peso: {ride_ids}}
+        self._trigrams = {}  # trigrama -> {palabras del vocabulario}
+        self._ride_terms = {}  # ride_id -> {palabra: peso}, para poder actualizar y quitar
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def ride_terms(ride):
+        """{palabra: peso} del ride: ADDRESS_WEIGHT si esta en finalAddress mas DESTINATION_WEIGHT si es destino"""
+        address_tokens = set(tokenize(ride.final_address))
+        destination_tokens = set()
+        for participation in list(ride.participants):
+            destination_tokens.update(tokenize(participation.destination))
+        return {token: (ADDRESS_WEIGHT if token in address_tokens else 0.0)
+                + (DESTINATION_WEIGHT if token in destination_tokens else 0.0)
+                for token in address_tokens | destination_tokens}
+
+    def update(self, ride):
+        """Reindexa el ride con su estado actual (lo quita si ya no esta activo)"""
+        with self._lock:
+            # Status is read under the index lock, so the last update of a ride always sees its final status
+            terms = self.ride_terms(ride) if ride.status in Ride.ACTIVE_STATUSES else {}
+            old_terms = self._ride_terms.get(ride.id, {})
+            if terms == old_terms:
+                return
+            for token, weight in old_terms.items():
+                if terms.get(token) != weight:
+                    self._remove_posting(token, weight, ride.id)
+            for token, weight in terms.items():
+                if old_terms.get(token) != weight:
+                    self._add_posting(token, weight, ride.id)
+            if terms:
+                self._ride_terms[ride.id] = terms
+            else:
+                self._ride_terms.pop(ride.id, None)
+
+    def _add_posting(self, token, weight, ride_id):
+        postings = self._postings.get(token)
+        if postings is None:
+            postings = self._postings[token] = {}
+            for trigram in trigrams(token):
+                self._trigrams.setdefault(trigram, set()).add(token)
+        postings.setdefault(weight, set()).add(ride_id)
+
+    def _remove_posting(self, token, weight, ride_id):
+        postings = self._postings[token]
+        ride_ids = postings[weight]
+        ride_ids.discard(ride_id)
+        if ride_ids:
+            return
+        del postings[weight]
+        if not postings:
+            del self._postings[token]
+            for trigram in trigrams(token):
+                tokens = self._trigrams[trigram]
+                tokens.discard(token)
+                if not tokens:
+                    del self._trigrams[trigram]
+
+    def _token_levels(self, token):
+        """[(puntaje, {ride_ids})] de las palabras parecidas a token, del mayor puntaje al menor"""
+        return sorted(((similarity * weight, ride_ids)
+                       for candidate, similarity in similar_tokens(self._trigrams, token).items()
+                       for weight, ride_ids in self._postings[candidate].items()),
+                      key=lambda level: level[0], reverse=True)
+
+    def search(self, query, limit=20):
+        """Retorna [(ride_id, puntaje)] de los limit rides con mayor puntaje.
+
+        Recorre las combinaciones de niveles (uno por palabra buscada, o ninguno)
+        de mayor a menor puntaje e intersecta sus conjuntos, hasta juntar limit
+        rides. Un ride se toma en la primera combinacion en que aparece, que es
+        la de su puntaje real.
+        """
+        with self._lock:
+            options = []
+            for token in dict.fromkeys(tokenize(query)):
+                levels = self._token_levels(token)
+                if levels:
+                    options.append(levels + [(0.0, None)])
+            if not options:
+                return []
+
+            def combination(indexes):
+                return -round(sum(options[j][i][0] for j, i in enumerate(indexes)), 6), indexes
+
+            first = (0,) * len(options)
+            heap = [combination(first)]
+            visited = {first}
+            results = []
+            emitted = set()
+            level_score, level_sets = None, []
+
+            def flush():
+                if not level_sets:
+                    return
+                candidates = level_sets[0] if len(level_sets) == 1 else set().union(*level_sets)
+                for ride_id in heapq.nsmallest(limit - len(results), candidates - emitted):
+                    results.append((ride_id, level_score))
+                    emitted.add(ride_id)
+
+            pops = 0
+            while heap and pops < MAX_COMBINATIONS:
+                negative_score, indexes = heapq.heappop(heap)
+                pops += 1
+                score = -negative_score
+                if score <= 0:
+                    break
+                if score != level_score:
+                    # Ties go to the lowest id, so a score level is only cut once it is complete
+                    flush()
+                    if len(results) >= limit:
+                        level_sets = []
+                        break
+                    level_score, level_sets = score, []
+                sets = sorted((options[j][i][1] for j, i in enumerate(indexes) if options[j][i][1] is not None),
+                              key=len)
+                matches = sets[0].intersection(*sets[1:]) if len(sets) > 1 else sets[0]
+                if matches:
+                    level_sets.append(matches)
+                for j in range(len(indexes)):
+                    if indexes[j] + 1 < len(options[j]):
+                        following = indexes[:j] + (indexes[j] + 1,) + indexes[j + 1:]
+                        if following not in visited:
+                            visited.add(following)
+                            heapq.heappush(heap, combination(following))
+            flush()
+            return results
+
+    def __len__(self):
+        return len(self._ride_terms)
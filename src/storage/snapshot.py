@@ -0,0 +1,176 @@
+"""Snapshot indexado para el arranque lazy (ver LazyDataHandler).
+
+Un unico archivo con un registro JSON por linea (primero usuarios, luego rides
+ordenados por id), seguido del indice en JSON y un trailer de tamano fijo con
+la posicion del indice. El archivo se abre con mmap: arrancar solo lee el
+indice y cada registro se parsea recien cuando se pide.
+
+Registros:
+  usuario: {"alias", "name", "carPlate", "rides": [ids], "joinedRides": [ids], "stats": {...}}
+  ride: {"id", "rideDateAndTime", "finalAddress", "allowedSpaces", "driver",
+         "status", "participations": [{"participant", "destination", "status",
+         "confirmation", "occupiedSpaces"}]}
+A diferencia de data.json, los contadores de historial se guardan porque las
+participaciones de un usuario no se cargan todas, y por lo mismo cada usuario
+lleva joinedRides, los rides a los que pidio unirse (User.joined_ride_ids).
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+from array import array
+
+from src.models.ride import Ride
+
+FORMAT_VERSION = 1
+MAGIC = b'RIDESNAP'
+TRAILER = struct.Struct('<8sQ')
+
+
+def user_record(user):
+    return {
+        "alias": user.alias,
+        "name": user.name,
+        "carPlate": user.car_plate,
+        "rides": user.ride_ids(),
+        "joinedRides": list(user.joined_ride_ids),
+        "stats": dict(user.participation_stats)
+    }
+
+
+def ride_record(ride):
+    with ride.lock:
+        return {
+            "id": ride.id,
+            "rideDateAndTime": ride.ride_date_and_time,
+            "finalAddress": ride.final_address,
+            "allowedSpaces": ride.allowed_spaces,
+            "driver": ride.driver.alias,
+            "status": ride.status,
+            "participations": [{
+                "participant": participation.participant.alias,
+                "destination": participation.destination,
+                "status": participation.status,
+                "confirmation": participation.confirmation,
+                "occupiedSpaces": participation.occupied_spaces
+            } for participation in ride.participants]
+        }
+
+
+def encode(record):
+    return json.dumps(record, separators=(',', ':')).encode() + b'\n'
+
+
+def write_snapshot(filename, user_lines, ride_lines, active_ride_ids):
+    """Escribe el snapshot de forma atomica y retorna los bytes escritos.
+
+    user_lines: iterable de (alias, registro codificado) en el orden de creacion.
+    ride_lines: iterable de (id, departure_ts, registro codificado) en orden de id creciente.
+    """
+    index = {"version": FORMAT_VERSION, "users": [], "userOffsets": [], "rideIds": [], "rideOffsets": [],
+             "rideDepartures": [], "activeRideIds": sorted(active_ride_ids)}
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'wb') as f:
+        for alias, line in user_lines:
+            index["users"].append(alias)
+            index["userOffsets"].append(f.tell())
+            f.write(line)
+        for ride_id, departure_ts, line in ride_lines:
+            index["rideIds"].append(ride_id)
+            index["rideDepartures"].append(departure_ts)
+            index["rideOffsets"].append(f.tell())
+            f.write(line)
+        index_offset = f.tell()
+        f.write(json.dumps(index, separators=(',', ':')).encode())
+        f.write(TRAILER.pack(MAGIC, index_offset))
+        f.flush()
+        os.fsync(f.fileno())
+        written = f.tell()
+    os.replace(tmp_filename, filename)
+    return written
+
+
+def write_from_handler(handler, filename):
+    """Convierte el estado de un DataHandler ya cargado (por ejemplo desde data.json) a un snapshot"""
+    rides = sorted(handler.rides, key=lambda ride: ride.id)
+    write_snapshot(
+        filename,
+        ((user.alias, encode(user_record(user))) for user in handler.users),
+        ((ride.id, ride.departure_ts, encode(ride_record(ride))) for ride in rides),
+        [ride.id for ride in rides if ride.status in ride.ACTIVE_STATUSES]
+    )
+
+
+class SnapshotReader:
+    """Acceso por alias / id a los registros de un snapshot mapeado en memoria"""
+
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        end = len(self._mm) - TRAILER.size
+        magic, index_offset = TRAILER.unpack(self._mm[end:])
+        if magic != MAGIC:
+            raise ValueError(f"{filename} no es un snapshot indexado")
+        index = json.loads(self._mm[index_offset:end])
+        if index["version"] != FORMAT_VERSION:
+            raise ValueError(f"Version de snapshot no soportada: {index['version']}")
+        self.aliases = index["users"]
+        self._user_offsets = dict(zip(self.aliases, index["userOffsets"]))
+        self.ride_ids = array('q', index["rideIds"])
+        self._ride_offsets = array('Q', index["rideOffsets"])
+        self.active_ride_ids = index["activeRideIds"]
+        # Hora de salida de cada ride de ride_ids (None si no se entiende)
+        self.ride_departures = index.get("rideDepartures")
+        if self.ride_departures is None:
+            # Snapshots written before the time index: parse every ride once
+            self.ride_departures = [Ride.parse_departure(json.loads(self._line(offset))["rideDateAndTime"])
+                                    for offset in self._ride_offsets]
+        self._legacy_joined_rides = None  # alias -> [ids], solo para snapshots sin joinedRides
+
+    def _line(self, offset):
+        return self._mm[offset:self._mm.find(b'\n', offset) + 1]
+
+    def raw_user(self, alias):
+        offset = self._user_offsets.get(alias)
+        if offset is None:
+            return None
+        line = self._line(offset)
+        if b'"joinedRides"' not in line:
+            # Rewritten with the reverse index so the next snapshot no longer needs the fallback
+            line = encode(self.user(alias))
+        return line
+
+    def user(self, alias):
+        offset = self._user_offsets.get(alias)
+        if offset is None:
+            return None
+        record = json.loads(self._line(offset))
+        if "joinedRides" not in record:
+            record["joinedRides"] = self._legacy_joined_ride_ids(alias)
+        return record
+
+    def _legacy_joined_ride_ids(self, alias):
+        """Rides a los que se unio alias, para snapshots anteriores a joinedRides (recorre los rides una vez)"""
+        if self._legacy_joined_rides is None:
+            joined = {}
+            for ride_id, offset in zip(self.ride_ids, self._ride_offsets):
+                for participation in json.loads(self._line(offset))["participations"]:
+                    joined.setdefault(participation["participant"], []).append(ride_id)
+            self._legacy_joined_rides = joined
+        return list(self._legacy_joined_rides.get(alias, ()))
+
+    def raw_ride(self, ride_id):
+        position = bisect.bisect_left(self.ride_ids, ride_id)
+        if position == len(self.ride_ids) or self.ride_ids[position] != ride_id:
+            return None
+        return self._line(self._ride_offsets[position])
+
+    def ride(self, ride_id):
+        line = self.raw_ride(ride_id)
+        return json.loads(line) if line is not None else None
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
@@ -0,0 +1,172 @@
+"""Almacenamiento en SQLite para SqliteDataHandler.
+
+Tablas indexadas de usuarios, rides y participaciones en una base en modo WAL.
+Las sentencias son constantes con parametros, asi sqlite3 las prepara una vez
+por conexion y las reutiliza de su cache.
+
+SqliteReader entrega los mismos registros que SnapshotReader (ver snapshot.py),
+de modo que LazyDataHandler puede materializar objetos desde cualquiera de los
+dos. Los contadores de historial no se guardan: se calculan agrupando las
+participaciones del usuario, que estan indexadas por participante.
+"""
+import sqlite3
+
+from src.models.ride import Ride
+from src.models.status import participation_status, participation_status_code
+from src.models.user import User
+
+
+class StorageError(Exception):
+    """No se pudo confirmar un cambio en la base; el estado en memoria quedo como el guardado"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    alias TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    car_plate TEXT
+);
+CREATE TABLE IF NOT EXISTS rides (
+    id INTEGER PRIMARY KEY,
+    ride_date_and_time TEXT NOT NULL,
+    final_address TEXT NOT NULL,
+    allowed_spaces INTEGER NOT NULL,
+    driver TEXT NOT NULL REFERENCES users(alias),
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rides_by_driver ON rides(driver, id);
+CREATE INDEX IF NOT EXISTS rides_by_status ON rides(status, id);
+CREATE TABLE IF NOT EXISTS participations (
+    id INTEGER PRIMARY KEY,
+    ride_id INTEGER NOT NULL REFERENCES rides(id),
+    participant TEXT NOT NULL REFERENCES users(alias),
+    destination TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    confirmation INTEGER,
+    occupied_spaces INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS participations_by_ride ON participations(ride_id, participant);
+CREATE INDEX IF NOT EXISTS participations_by_participant ON participations(participant, status);
+"""
+
+INSERT_USER = "INSERT INTO users (alias, name, car_plate) VALUES (?, ?, ?)"
+INSERT_RIDE = ("INSERT INTO rides (id, ride_date_and_time, final_address, allowed_spaces, driver, status) "
+               "VALUES (?, ?, ?, ?, ?, ?)")
+INSERT_PARTICIPATION = ("INSERT INTO participations (ride_id, participant, destination, status, confirmation, "
+                        "occupied_spaces) VALUES (?, ?, ?, ?, ?, ?)")
+UPDATE_RIDE_STATUS = "UPDATE rides SET status = ? WHERE id = ?"
+UPDATE_PARTICIPATION = ("UPDATE participations SET status = ?, confirmation = ?, occupied_spaces = ? "
+                        "WHERE ride_id = ? AND participant = ?")
+SELECT_USER = "SELECT alias, name, car_plate FROM users WHERE alias = ?"
+SELECT_USER_RIDE_IDS = "SELECT id FROM rides WHERE driver = ? ORDER BY id"
+SELECT_USER_JOINED_RIDE_IDS = "SELECT ride_id FROM participations WHERE participant = ? ORDER BY id"
+SELECT_USER_STATUS_COUNTS = "SELECT status, COUNT(*) FROM participations WHERE participant = ? GROUP BY status"
+SELECT_RIDE = ("SELECT id, ride_date_and_time, final_address, allowed_spaces, driver, status "
+               "FROM rides WHERE id = ?")
+SELECT_RIDE_PARTICIPATIONS = ("SELECT participant, destination, status, confirmation, occupied_spaces "
+                              "FROM participations WHERE ride_id = ? ORDER BY id")
+
+
+def connect(filename):
+    """Abre (y crea si hace falta) la base en modo WAL"""
+    # The handler serializes access to the connection with its own lock
+    connection = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # In WAL mode NORMAL only risks the last transactions on power loss, never corruption
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA foreign_keys=ON")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _confirmation(value):
+    return None if value is None else bool(value)
+
+
+def participation_row(ride, participation):
+    return (ride.id, participation.participant.alias, participation.destination,
+            participation_status_code(participation.status), participation.confirmation,
+            participation.occupied_spaces)
+
+
+def participation_update(ride, participation):
+    """Parametros de UPDATE_PARTICIPATION"""
+    return (participation_status_code(participation.status), participation.confirmation,
+            participation.occupied_spaces, ride.id, participation.participant.alias)
+
+
+class SqliteReader:
+    """Lectura de registros desde la base, con la misma interfaz que SnapshotReader"""
+
+    def __init__(self, connection, lock):
+        self._connection = connection
+        self._lock = lock  # Lock que protege la conexion, compartido con las escrituras
+        with self._lock:
+            self.aliases = [row[0] for row in connection.execute("SELECT alias FROM users ORDER BY rowid")]
+            rows = connection.execute("SELECT id, ride_date_and_time FROM rides ORDER BY id").fetchall()
+            self.ride_ids = [ride_id for ride_id, _ in rows]
+            self.ride_departures = [Ride.parse_departure(ride_date_and_time) for _, ride_date_and_time in rows]
+            placeholders = ", ".join("?" * len(Ride.ACTIVE_STATUSES))
+            self.active_ride_ids = [row[0] for row in connection.execute(
+                f"SELECT id FROM rides WHERE status IN ({placeholders}) ORDER BY id", Ride.ACTIVE_STATUSES)]
+
+    def user(self, alias):
+        with self._lock:
+            row = self._connection.execute(SELECT_USER, (alias,)).fetchone()
+            if row is None:
+                return None
+            ride_ids = [ride_row[0] for ride_row in self._connection.execute(SELECT_USER_RIDE_IDS, (alias,))]
+            joined_ride_ids = [ride_row[0] for ride_row in
+                               self._connection.execute(SELECT_USER_JOINED_RIDE_IDS, (alias,))]
+            counts = self._connection.execute(SELECT_USER_STATUS_COUNTS, (alias,)).fetchall()
+        stats = User.empty_participation_stats()
+        for code, count in counts:
+            stats["total"] += count
+            status = participation_status(code)
+            if status in User.HISTORY_STATUSES:
+                stats[status] = count
+        return {"alias": row[0], "name": row[1], "carPlate": row[2], "rides": ride_ids, "joinedRides": joined_ride_ids,
+                "stats": stats}
+
+    def ride(self, ride_id):
+        with self._lock:
+            row = self._connection.execute(SELECT_RIDE, (ride_id,)).fetchone()
+            if row is None:
+                return None
+            participations = self._connection.execute(SELECT_RIDE_PARTICIPATIONS, (ride_id,)).fetchall()
+        return {
+            "id": row[0],
+            "rideDateAndTime": row[1],
+            "finalAddress": row[2],
+            "allowedSpaces": row[3],
+            "driver": row[4],
+            "status": row[5],
+            "participations": [{
+                "participant": participant,
+                "destination": destination,
+                "status": participation_status(status),
+                "confirmation": _confirmation(confirmation),
+                "occupiedSpaces": occupied_spaces
+            } for participant, destination, status, confirmation, occupied_spaces in participations]
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def write_from_handler(handler, filename):
+    """Vuelca el estado de un DataHandler a una base nueva en una sola transaccion"""
+    connection = connect(filename)
+    try:
+        connection.execute("BEGIN")
+        connection.executemany(INSERT_USER, ((user.alias, user.name, user.car_plate)
+                                             for user in handler._all_users()))
+        rides = handler._all_rides()
+        connection.executemany(INSERT_RIDE, ((ride.id, ride.ride_date_and_time, ride.final_address,
+                                              ride.allowed_spaces, ride.driver.alias, ride.status)
+                                             for ride in rides))
+        connection.executemany(INSERT_PARTICIPATION, (participation_row(ride, participation)
+                                                      for ride in rides for participation in ride.participants))
+        connection.execute("COMMIT")
+    finally:
+        connection.close()
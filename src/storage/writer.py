@@ -0,0 +1,121 @@
+import threading
+import time
+
+
+class SnapshotWriter:
+    """Hilo unico que escribe los snapshots de un DataHandler.
+
+    Quien necesita persistir llama a request(). El snapshot lo arma el propio
+    hilo al empezar cada escritura, asi que los pedidos que llegan mientras se
+    escribe se agrupan en la siguiente escritura (group commit) y nunca hay dos
+    escrituras del mismo archivo a la vez.
+
+    Con delay > 0 (write-behind) el hilo espera hasta delay segundos desde el
+    primer pedido pendiente, o hasta acumular max_pending pedidos, antes de
+    escribir. Ese es el maximo de cambios que puede perder una caida del
+    proceso. flush() y close() escriben lo pendiente sin esperar.
+    """
+
+    def __init__(self, write_snapshot, delay=0, max_pending=1):
+        self._write_snapshot = write_snapshot
+        self.delay = delay
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._requested = 0  # Ultimo pedido recibido
+        self._completed = 0  # Ultimo pedido cubierto por una escritura terminada
+        self._pending_since = None  # Momento del primer pedido aun no tomado por una escritura
+        self._urgent = 0  # Pedidos hasta este numero no esperan el delay
+        self._error = None  # Excepcion de la ultima escritura fallida
+        self._error_upto = 0  # Pedidos cubiertos por esa escritura fallida
+        self._callbacks = []  # (pedido, callback) esperando a que ese pedido quede escrito
+        self._thread = None
+        self._stopping = False
+
+    def request(self, wait=True):
+        """Pide una escritura; con wait=True bloquea hasta que quede en disco"""
+        with self._cond:
+            self._requested += 1
+            ticket = self._requested
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            if wait:
+                self._urgent = ticket
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='snapshot-writer', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+            if wait:
+                self._wait_for(ticket)
+
+    def notify_when_written(self, callback):
+        """Llama callback(error) cuando lo pedido hasta ahora quede en disco, sin bloquear.
+
+        error es None o la excepcion de la escritura que fallo. El callback se
+        llama desde el hilo escritor (o desde este hilo si ya estaba escrito).
+        """
+        with self._cond:
+            ticket = self._requested
+            if self._completed < ticket:
+                self._callbacks.append((ticket, callback))
+                return
+            error = self._error if ticket and ticket <= self._error_upto else None
+        callback(error)
+
+    def flush(self):
+        """Escribe ya lo pendiente y espera a que termine"""
+        with self._cond:
+            if self._requested == self._completed:
+                if self._completed and self._completed <= self._error_upto:
+                    raise self._error
+                return
+        self.request(wait=True)
+
+    def _wait_for(self, ticket):
+        while self._completed < ticket:
+            self._cond.wait()
+        if ticket <= self._error_upto:
+            raise self._error
+
+    def _should_wait(self):
+        if self._stopping or self._urgent > self._completed:
+            return False
+        if self._requested - self._completed >= self.max_pending:
+            return False
+        return time.monotonic() < self._pending_since + self.delay
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._requested == self._completed and not self._stopping:
+                    self._cond.wait()
+                if self._requested == self._completed:
+                    return
+                # Debounce: let more changes pile up into this write
+                while self._should_wait():
+                    self._cond.wait(self._pending_since + self.delay - time.monotonic())
+                target = self._requested
+                self._pending_since = None
+            error = None
+            try:
+                self._write_snapshot()
+            except Exception as e:
+                error = e
+                with self._cond:
+                    self._error = e
+                    self._error_upto = target
+            with self._cond:
+                self._completed = target
+                self._cond.notify_all()
+                done = [callback for ticket, callback in self._callbacks if ticket <= target]
+                self._callbacks = [(ticket, callback) for ticket, callback in self._callbacks if ticket > target]
+            for callback in done:
+                callback(error)
+
+    def close(self):
+        """Escribe los pedidos pendientes y detiene el hilo"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
@@ -1,8 +1,16 @@
 import pytest
 import sys
 import os
+import io
+import asyncio
 import json
-from unittest.mock import patch, mock_open
+import time
+import random
+import sqlite3
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch, mock_open
 
 # Add the src directory to the Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
@@ -11,7 +19,17 @@ from models.user import User
 from models.ride import Ride
 from models.RideParticipation import RideParticipation
 from data_handler import DataHandler
-from controller import app
+from lazy_data_handler import LazyDataHandler
+from sqlite_data_handler import SqliteDataHandler
+from storage import schema, snapshot, sqlite_store
+from bulk import export_files, import_files
+from storage.wal import WriteAheadLog
+from storage.archive import RideArchive
+# Same modules the controller imports, so it recognizes the shard handler
+from src.shard_data_handler import ShardDataHandler
+from src.sharding import ShardRouter, shard_for_alias
+from async_server import AsgiApp
+from controller import app, metrics
 
 
 class TestRideSharing:
@@ -347,4 +365,1204 @@ class TestRideSharing:
             self.ride.unload_participant(self.passenger1)
 
         # Aserción
-        assert "Participante no encontrado o no está en el ride" in str(exc_info.value)
\ No newline at end of file
+        assert "Participante no encontrado o no está en el ride" in str(exc_info.value)
+
+    # ==================== DATA HANDLER ====================
+
+    def test_data_handler_indexes_users_and_rides(self, tmp_path):
+        """Caso de éxito: get_user y get_ride usan los índices tras cargar y al agregar"""
+        # Inicialización
+        data = {
+            "users": [
+                {"alias": "jperez", "name": "Juan Perez", "carPlate": "ABC123"},
+                {"alias": "lgomez", "name": "Luis Gomez", "carPlate": None}
+            ],
+            "rides": [
+                {"id": 7, "rideDateAndTime": "2025/07/15 22:00", "finalAddress": "San Borja",
+                 "allowedSpaces": 3, "driver": "jperez", "status": "ready", "participants": []}
+            ]
+        }
+        filename = tmp_path / "data.json"
+        filename.write_text(json.dumps(data))
+
+        # Ejecución
+        handler = DataHandler(filename=str(filename))
+        new_user = handler.add_user("mrodriguez", "Maria Rodriguez")
+        new_ride = handler.add_ride("2025/07/16 08:00", "Surquillo", 2, new_user)
+
+        # Verificación o Aserción
+        assert handler.get_user("lgomez").name == "Luis Gomez"
+        assert handler.get_user("mrodriguez") is new_user
+        assert handler.get_user("nadie") is None
+        assert handler.get_ride("7").driver is handler.get_user("jperez")
+        assert handler.get_ride(new_ride.id) is new_ride
+        assert handler.get_ride(999) is None
+        with pytest.raises(ValueError) as exc_info:
+            handler.add_user("lgomez", "Otro")
+        assert "El usuario ya existe." in str(exc_info.value)
+
+    def test_wal_replays_mutations_after_restart(self, tmp_path):
+        """Caso de éxito: con WAL las mutaciones se agregan al log y se reproducen al cargar"""
+        # Inicialización
+        filename = str(tmp_path / "data.json")
+        handler = DataHandler(filename=filename, wal=WriteAheadLog(str(tmp_path / "data.wal")))
+        driver = handler.add_user("jperez", "Juan Perez", "ABC123")
+        passenger = handler.add_user("lgomez", "Luis Gomez")
+        ride = handler.add_ride("2025/07/15 22:00", "San Borja", 2, driver)
+        handler.join_ride(ride, passenger, "Surquillo")
+        handler.accept_participant(ride, passenger)
+        handler.start_ride(ride)
+        handler.close()
+
+        # Ejecución
+        reloaded = DataHandler(filename=filename, wal=WriteAheadLog(str(tmp_path / "data.wal")))
+
+        # Verificación o Aserción
+        assert not os.path.exists(filename)  # Nada reescribió el snapshot
+        reloaded_ride = reloaded.get_ride(ride.id)
+        assert reloaded_ride.status == "inprogress"
+        assert reloaded_ride.participants[0].participant is reloaded.get_user("lgomez")
+        assert reloaded_ride.participants[0].status == "inprogress"
+        assert reloaded.wal.seq == 6
+
+    def test_wal_ignores_torn_last_event(self, tmp_path):
+        """Caso de éxito: una línea incompleta al final del log (caída a mitad de escritura) se descarta"""
+        # Inicialización
+        wal_filename = str(tmp_path / "data.wal")
+        handler = DataHandler(filename=str(tmp_path / "data.json"), wal=WriteAheadLog(wal_filename))
+        handler.add_user("jperez", "Juan Perez")
+        handler.close()
+        with open(wal_filename, 'ab') as f:
+            f.write(b'{"seq": 2, "type": "user_ad')
+
+        # Ejecución
+        reloaded = DataHandler(filename=str(tmp_path / "data.json"), wal=WriteAheadLog(wal_filename))
+        reloaded.add_user("lgomez", "Luis Gomez")
+        reloaded.close()
+        again = DataHandler(filename=str(tmp_path / "data.json"), wal=WriteAheadLog(wal_filename))
+
+        # Verificación o Aserción
+        assert [user.alias for user in again.users] == ["jperez", "lgomez"]
+
+    def test_wal_compaction_writes_snapshot_and_truncates_log(self, tmp_path):
+        """Caso de éxito: al pasar el umbral el log se compacta en un snapshot sin perder eventos"""
+        # Inicialización
+        filename = str(tmp_path / "data.json")
+        wal_filename = str(tmp_path / "data.wal")
+        handler = DataHandler(filename=filename, wal=WriteAheadLog(wal_filename, compact_bytes=512))
+
+        # Ejecución
+        for i in range(20):
+            handler.add_user(f"user{i}", f"User {i}")
+        handler.close()
+
+        # Verificación o Aserción
+        assert os.path.exists(filename)
+        assert not os.path.exists(wal_filename + ".1")
+        with open(wal_filename) as f:
+            assert len(f.readlines()) < 20
+        reloaded = DataHandler(filename=filename, wal=WriteAheadLog(wal_filename))
+        assert [user.alias for user in reloaded.users] == [f"user{i}" for i in range(20)]
+
+    def test_wal_batch_syncs_tail_without_another_append(self, tmp_path):
+        """Caso de éxito: en modo batch los ultimos eventos de una rafaga se sincronizan al cumplirse el intervalo"""
+        # Inicialización
+        wal = WriteAheadLog(str(tmp_path / "data.wal"), fsync="batch", fsync_batch_size=64, fsync_interval=0.05)
+        wal.open(0)
+        fsync = Mock(wraps=os.fsync)
+
+        # Ejecución
+        with patch('storage.wal.os.fsync', fsync):
+            wal.append("addUser", alias="user0")
+            wal.append("addUser", alias="user1")
+            deadline = time.monotonic() + 2
+            while wal._unsynced and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        # Verificación o Aserción
+        assert wal._unsynced == 0
+        assert fsync.call_count == 1
+        wal.close()
+
+    def test_load_migrates_legacy_layout(self, tmp_path):
+        """Caso de éxito: un data.json v1 (rides embebidos) se migra y se guarda normalizado"""
+        # Inicialización
+        self.ride.add_participant(self.passenger1, "Surquillo")
+        self.ride.accept_participant(self.passenger1)
+        legacy = {
+            "users": [self.driver.get_user_info(), self.passenger1.get_user_info()],
+            "rides": [self.ride.get_ride_info()]
+        }
+        filename = tmp_path / "data.json"
+        filename.write_text(json.dumps(legacy))
+
+        # Ejecución
+        handler = DataHandler(filename=str(filename))
+        handler.save_data()
+        saved = json.loads(filename.read_text())
+
+        # Verificación o Aserción
+        ride = handler.get_ride(self.ride.id)
+        assert ride.driver is handler.get_user("jperez")
+        assert ride.participants[0].participant is handler.get_user("lgomez")
+        assert ride.participants[0].status == "confirmed"
+        assert ride.participants[0].confirmation is True
+        assert saved["version"] == 2
+        assert saved["participations"] == [{
+            "rideId": self.ride.id, "participant": "lgomez", "destination": "Surquillo",
+            "status": "confirmed", "confirmation": True, "occupiedSpaces": 1
+        }]
+        assert "rides" not in saved["users"][0]
+
+    def test_normalized_layout_is_smaller_than_legacy(self, tmp_path):
+        """Caso de éxito: con un dataset generado el formato v2 ocupa menos que el v1 y carga lo mismo"""
+        # Inicialización
+        users = [User(f"user{i}", f"User {i}") for i in range(100)]
+        rides = []
+        for i in range(2000):
+            ride = Ride("2025/07/15 22:00", f"Destino {i}", 3, users[i % 100])
+            users[i % 100].add_ride(ride)
+            ride.add_participant(users[(i + 1) % 100], "Surquillo")
+            ride.accept_participant(users[(i + 1) % 100])
+            rides.append(ride)
+        handler = DataHandler(filename=str(tmp_path / "empty.json"))
+        handler.users, handler.rides = users, rides
+        v1_file, v2_file = tmp_path / "v1.json", tmp_path / "v2.json"
+        v1_file.write_text(json.dumps({"users": [u.get_user_info() for u in users],
+                                       "rides": [r.get_ride_info() for r in rides]}))
+        handler.filename = str(v2_file)
+        handler.save_data()
+
+        # Ejecución
+        loaded = {label: DataHandler(filename=str(filename)) for label, filename in (("v1", v1_file), ("v2", v2_file))}
+
+        # Verificación o Aserción (los tiempos de carga a 100k rides están en benchmarks/bench_schema.py)
+        assert v2_file.stat().st_size * 2 < v1_file.stat().st_size
+        for handler in loaded.values():
+            assert len(handler.rides) == 2000
+            assert sum(len(ride.participants) for ride in handler.rides) == 2000
+            assert handler.verify_participation_stats() == {}
+
+    def test_participation_stats_follow_status_changes(self, tmp_path):
+        """Caso de éxito: los contadores de historial se actualizan en cada transición y coinciden con el recálculo"""
+        # Inicialización
+        handler = DataHandler(filename=str(tmp_path / "data.json"))
+        driver = handler.add_user("jperez", "Juan Perez", "ABC123")
+        rider = handler.add_user("lgomez", "Luis Gomez")
+        other = handler.add_user("mrodriguez", "Maria Rodriguez")
+        ride1 = handler.add_ride("2025/07/15 22:00", "San Borja", 1, driver)
+        ride2 = handler.add_ride("2025/07/16 22:00", "Surquillo", 1, driver)
+
+        # Ejecución
+        handler.join_ride(ride1, rider, "Surquillo")
+        handler.join_ride(ride1, other, "Miraflores")
+        handler.accept_participant(ride1, rider)
+        handler.reject_participant(ride1, other)
+        handler.start_ride(ride1)
+        handler.unload_participant(ride1, rider)
+        handler.end_ride(ride1)
+        handler.join_ride(ride2, rider, "San Borja")
+        handler.accept_participant(ride2, rider)
+        handler.start_ride(ride2)
+        handler.end_ride(ride2)
+
+        # Verificación o Aserción
+        assert rider.participation_stats == {"total": 2, "done": 1, "missing": 0, "notmarked": 1, "rejected": 0}
+        assert other.participation_stats == {"total": 1, "done": 0, "missing": 0, "notmarked": 0, "rejected": 1}
+        info = ride2.get_ride_info()["participants"][0]["participant"]
+        assert info["previousRidesTotal"] == 2
+        assert info["previousRidesNotMarked"] == 1
+        assert handler.verify_participation_stats() == {}
+        reloaded = DataHandler(filename=str(tmp_path / "data.json"))
+        assert reloaded.get_user("lgomez").participation_stats == rider.participation_stats
+        assert reloaded.verify_participation_stats() == {}
+
+    def test_verify_participation_stats_detects_and_repairs_drift(self, tmp_path):
+        """Caso de éxito: el verificador detecta contadores corruptos y los repara con repair=True"""
+        # Inicialización
+        handler = DataHandler(filename=str(tmp_path / "data.json"))
+        driver = handler.add_user("jperez", "Juan Perez", "ABC123")
+        rider = handler.add_user("lgomez", "Luis Gomez")
+        ride = handler.add_ride("2025/07/15 22:00", "San Borja", 2, driver)
+        handler.join_ride(ride, rider, "Surquillo")
+        handler.reject_participant(ride, rider)
+        rider.participation_stats["rejected"] = 5
+
+        # Ejecución
+        mismatches = handler.verify_participation_stats(repair=True)
+
+        # Verificación o Aserción
+        assert mismatches["lgomez"][0]["rejected"] == 5
+        assert mismatches["lgomez"][1]["rejected"] == 1
+        assert rider.participation_stats["rejected"] == 1
+        assert handler.verify_participation_stats() == {}
+
+    def test_event_ride_approval_pass_keeps_capacity(self):
+        """Caso de éxito: en un ride con cientos de solicitudes la capacidad y los pendientes se respetan"""
+        # Inicialización
+        event_ride = Ride("2025/07/15 22:00", "Estadio Nacional", 100, self.driver)
+        riders = [User(f"rider{i}", f"Rider {i}") for i in range(300)]
+        for rider in riders:
+            event_ride.add_participant(rider, "Estadio Nacional")
+
+        # Ejecución
+        for rider in riders[:100]:
+            event_ride.accept_participant(rider)
+        with pytest.raises(ValueError) as full_error:
+            event_ride.accept_participant(riders[100])
+        with pytest.raises(ValueError) as pending_error:
+            event_ride.start_ride()
+        for rider in riders[100:]:
+            event_ride.reject_participant(rider)
+        event_ride.start_ride()
+        event_ride.unload_participant(riders[0])
+        event_ride.end_ride()
+
+        # Verificación o Aserción
+        assert "No hay espacios disponibles para confirmar más participantes" in str(full_error.value)
+        assert "Hay participantes con solicitudes pendientes" in str(pending_error.value)
+        statuses = [p.status for p in event_ride.participants]
+        assert statuses.count("done") == 1
+        assert statuses.count("notmarked") == 99
+        assert statuses.count("rejected") == 200
+        assert [p.participant for p in event_ride.participants] == riders
+
+    def _seeded_handler(self, tmp_path):
+        """DataHandler con 3 conductores y 6 rides (uno terminado) para los tests de endpoints"""
+        handler = DataHandler(filename=str(tmp_path / "data.json"))
+        drivers = [handler.add_user(f"driver{i}", f"Driver {i}", f"PLT{i}") for i in range(3)]
+        rider = handler.add_user("lgomez", "Luis Gomez")
+        for day in range(1, 7):
+            handler.add_ride(f"2025/07/{day:02d} 08:00", f"Destino {day}", 1, drivers[day % 3])
+        handler.join_ride(handler.rides[1], rider, "Surquillo")
+        handler.accept_participant(handler.rides[1], rider)
+        handler.start_ride(handler.rides[0])
+        handler.end_ride(handler.rides[0])
+        return handler
+
+    def test_list_users_paginated_with_projection(self, tmp_path):
+        """Caso de éxito: GET /usuarios pagina con limit/cursor y omite rides con fields"""
+        # Inicialización
+        handler = self._seeded_handler(tmp_path)
+
+        with patch('controller.data_handler', handler):
+            # Ejecución
+            first = self.client.get('/usuarios?limit=3&fields=alias,name')
+            second = self.client.get(f"/usuarios?limit=3&fields=alias&cursor={first.headers['X-Next-Cursor']}")
+            invalid = self.client.get('/usuarios?fields=alias,password')
+
+        # Verificación o Aserción
+        assert first.status_code == 200
+        assert json.loads(first.data) == [{"alias": f"driver{i}", "name": f"Driver {i}"} for i in range(3)]
+        assert json.loads(second.data) == [{"alias": "lgomez"}]
+        assert 'X-Next-Cursor' not in second.headers
+        assert invalid.status_code == 400
+
+    def test_list_active_rides_filters_and_cursor(self, tmp_path):
+        """Caso de éxito: GET /rides/active filtra por conductor, fechas y espacios libres y pagina por id"""
+        # Inicialización
+        handler = self._seeded_handler(tmp_path)
+        ride_ids = [ride.id for ride in handler.rides]
+
+        with patch('controller.data_handler', handler):
+            # Ejecución
+            all_active = self.client.get('/rides/active?fields=id')
+            page = self.client.get('/rides/active?fields=id&limit=2')
+            next_page = self.client.get(f"/rides/active?fields=id&limit=2&cursor={page.headers['X-Next-Cursor']}")
+            by_driver = self.client.get('/rides/active?fields=id&driver=driver1')
+            by_date = self.client.get('/rides/active?fields=id,rideDateAndTime&from=2025/07/03 00:00&to=2025/07/04 23:59')
+            free = self.client.get('/rides/active?fields=id&hasFreeSpaces=true')
+            bad_date = self.client.get('/rides/active?from=ayer')
+
+        # Verificación o Aserción
+        assert [r["id"] for r in json.loads(all_active.data)] == ride_ids[1:]
+        assert [r["id"] for r in json.loads(page.data)] == ride_ids[1:3]
+        assert [r["id"] for r in json.loads(next_page.data)] == ride_ids[3:5]
+        assert [r["id"] for r in json.loads(by_driver.data)] == [ride_ids[3]]
+        assert json.loads(by_date.data) == [{"id": ride_ids[2], "rideDateAndTime": "2025/07/03 08:00"},
+                                            {"id": ride_ids[3], "rideDateAndTime": "2025/07/04 08:00"}]
+        assert [r["id"] for r in json.loads(free.data)] == ride_ids[2:]
+        assert bad_date.status_code == 400
+
+    def test_streamed_lists_match_buffered_responses(self, tmp_path):
+        """Caso de éxito: con stream=true los listados devuelven exactamente el mismo JSON"""
+        # Inicialización
+        handler = self._seeded_handler(tmp_path)
+        urls = ['/usuarios', '/usuarios?limit=2&fields=alias', '/usuarios/driver1/rides',
+                '/rides/active', '/rides/active?limit=2&hasFreeSpaces=true']
+
+        with patch('controller.data_handler', handler):
+            for url in urls:
+                # Ejecución
+                buffered = self.client.get(url)
+                streamed = self.client.get(url + ('&' if '?' in url else '?') + 'stream=true')
+
+                # Verificación o Aserción
+                assert streamed.status_code == 200
+                assert streamed.is_streamed
+                assert streamed.mimetype == 'application/json'
+                assert json.loads(streamed.data) == json.loads(buffered.data)
+                assert streamed.headers.get('X-Next-Cursor') == buffered.headers.get('X-Next-Cursor')
+
+    def test_concurrent_join_and_accept_never_overbook(self, tmp_path):
+        """Caso de éxito: miles de join/accept en paralelo no superan allowed_spaces ni corrompen los datos"""
+        # Inicialización
+        filename = str(tmp_path / "data.json")
+        handler = DataHandler(filename=filename)
+        driver = handler.add_user("jperez", "Juan Perez", "ABC123")
+        riders = [handler.add_user(f"rider{i}", f"Rider {i}") for i in range(200)]
+        rides = [handler.add_ride("2025/07/15 22:00", f"Destino {i}", 3, driver) for i in range(10)]
+        rng = random.Random(7)
+        operations = [(rider, ride) for rider in riders for ride in rng.sample(rides, 5)]
+        rng.shuffle(operations)
+
+        joined = []
+
+        def join_then_accept(operation):
+            rider, ride = operation
+            try:
+                handler.join_ride(ride, rider, "Surquillo")
+                joined.append(operation)
+                handler.accept_participant(ride, rider)
+            except ValueError:
+                pass  # Ride lleno: se rechaza la solicitud o queda en waiting
+
+        def create_ride(i):
+            return handler.add_ride("2025/07/16 22:00", f"Extra {i}", 1, driver).id
+
+        previous_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # Más cambios de hilo = más oportunidades de carrera
+        try:
+            # Ejecución
+            with ThreadPoolExecutor(max_workers=32) as pool:
+                list(pool.map(join_then_accept, operations))
+                new_ids = list(pool.map(create_ride, range(200)))
+        finally:
+            sys.setswitchinterval(previous_interval)
+
+        # Verificación o Aserción
+        for ride in rides:
+            confirmed = [p for p in ride.participants if p.status == "confirmed"]
+            assert len(confirmed) == ride.allowed_spaces
+            assert len(ride.participants) == len({p.participant.alias for p in ride.participants})
+        assert sum(len(ride.participants) for ride in rides) == len(joined)
+        assert len(set(new_ids)) == 200
+        assert handler.verify_participation_stats() == {}
+        reloaded = DataHandler(filename=filename)
+        assert len(reloaded.rides) == 210
+        assert sum(len(ride.participants) for ride in reloaded.rides) == len(joined)
+
+    def test_write_behind_returns_before_writing_and_flush_drains(self, tmp_path):
+        """Caso de éxito: en modo write-behind las mutaciones no escriben el archivo hasta flush()"""
+        # Inicialización
+        filename = tmp_path / "data.json"
+        handler = DataHandler(filename=str(filename), write_behind=True, flush_interval_ms=60000,
+                              flush_max_changes=1000)
+
+        # Ejecución
+        for i in range(3):
+            handler.add_user(f"user{i}", f"User {i}")
+        written_before_flush = filename.exists()
+        handler.flush()
+
+        # Verificación o Aserción
+        assert not written_before_flush
+        assert [u["alias"] for u in json.loads(filename.read_text())["users"]] == ["user0", "user1", "user2"]
+        handler.add_user("user3", "User 3")
+        handler.close()  # El hook de apagado escribe lo pendiente
+        assert len(DataHandler(filename=str(filename)).users) == 4
+
+    def test_write_behind_crash_loses_at_most_the_window(self, tmp_path):
+        """Caso de éxito: tras una caída se recupera el último snapshot completo; se pierden menos de flush_max_changes cambios"""
+        # Inicialización
+        filename = tmp_path / "data.json"
+        handler = DataHandler(filename=str(filename), write_behind=True, flush_interval_ms=60000,
+                              flush_max_changes=5)
+        aliases = [f"user{i}" for i in range(12)]
+
+        # Ejecución
+        for alias in aliases:
+            handler.add_user(alias, alias)
+        time.sleep(0.2)  # El hilo escritor termina la escritura que tenga en curso
+        # Caída: el proceso muere sin flush ni close; un proceso nuevo carga lo que haya en disco
+        (tmp_path / "data.json.tmp").write_text('{"version": 2, "users": [{"ali')  # Escritura a medias
+        recovered = DataHandler(filename=str(filename))
+
+        # Verificación o Aserción
+        recovered_aliases = [user.alias for user in recovered.users]
+        assert recovered_aliases == aliases[:len(recovered_aliases)]
+        assert len(aliases) - len(recovered_aliases) < 5
+        assert len(recovered_aliases) >= 5
+
+    def test_lazy_handler_hydrates_on_demand_from_snapshot(self, tmp_path):
+        """Caso de éxito: el arranque lazy solo lee el índice y materializa usuarios y rides al pedirlos"""
+        # Inicialización
+        handler = self._seeded_handler(tmp_path)
+        snapshot_file = str(tmp_path / "data.snap")
+        snapshot.write_from_handler(handler, snapshot_file)
+        second_ride = handler.rides[1]
+
+        # Ejecución
+        lazy = LazyDataHandler(filename=snapshot_file, cache_size=2)
+        hydrated_at_start = (len(lazy._user_cache), len(lazy._ride_cache))
+        ride = lazy.get_ride(second_ride.id)
+
+        # Verificación o Aserción
+        assert hydrated_at_start == (0, 0)
+        assert ride.get_ride_info() == second_ride.get_ride_info()
+        assert ride.driver is lazy.get_user(second_ride.driver.alias)
+        assert ride.participants[0].participant is lazy.get_user("lgomez")
+        assert lazy.get_user("lgomez").participation_stats == handler.get_user("lgomez").participation_stats
+        assert [r.id for r in lazy.get_active_rides()] == [r.id for r in handler.get_active_rides()]
+        assert [u.alias for u in lazy.list_users(limit=2)[0]] == ["driver0", "driver1"]
+        assert lazy.get_user("nadie") is None
+        assert lazy.get_ride(9999) is None
+        assert lazy.verify_participation_stats() == {}
+
+    def test_rehydrated_rides_do_not_use_up_ids(self, tmp_path):
+        """Caso de éxito: materializar rides (lazy o desde el archivo) conserva su id sin consumir ids nuevos"""
+        # Inicialización
+        handler = self._seeded_handler(tmp_path)
+        ride_ids = [ride.id for ride in handler.rides]
+        snapshot_file = str(tmp_path / "data.snap")
+        snapshot.write_from_handler(handler, snapshot_file)
+        handler.close()
+        lazy = LazyDataHandler(filename=snapshot_file, cache_size=2)
+        archiving = DataHandler(filename=str(tmp_path / "data.json"), archive=RideArchive(str(tmp_path / "archive")))
+        archiving.archive_done_rides(now=Ride.timestamp(datetime(2025, 8, 10)))
+        next_id = type(archiving.rides[0])._id_counter  # The handlers' Ride class (imported from src)
+
+        # Ejecución
+        for _ in range(20):
+            for ride_id in ride_ids:
+                lazy.get_ride(ride_id)
+        archived = archiving.get_ride(ride_ids[0])
+        created = lazy.add_ride("2025/07/20 08:00", "Nuevo", 1, lazy.get_user("driver0"))
+
+        # Verificación o Aserción
+        assert archived.id == ride_ids[0] and archived.status == "done"
+        assert created.id == next_id
+        lazy.close()
+        archiving.close()
+
+    def test_lazy_handler_persists_changes_and_keeps_identity(self, tmp_path):
+        """Caso de éxito: los cambios en modo lazy sobreviven a la expulsión del caché y a un reinicio"""
+        # Inicialización
+        handler = self._seeded_handler(tmp_path)
+        snapshot_file = str(tmp_path / "data.snap")
+        snapshot.write_from_handler(handler, snapshot_file)
+        ride_id = handler.rides[2].id
+        lazy = LazyDataHandler(filename=snapshot_file, cache_size=1)
+
+        # Ejecución
+        newcomer = lazy.add_user("mrodriguez", "Maria Rodriguez")
+        lazy.join_ride(lazy.get_ride(ride_id), newcomer, "Miraflores")
+        lazy.reject_participant(lazy.get_ride(ride_id), newcomer)
+        new_ride = lazy.add_ride("2025/08/01 08:00", "Barranco", 2, lazy.get_user("driver0"))
+        for alias in ["driver0", "driver1", "driver2", "lgomez"]:
+            lazy.get_user(alias)  # Llena el caché para forzar expulsiones
+        same_newcomer = lazy.get_user("mrodriguez")
+        lazy.close()
+        reloaded = LazyDataHandler(filename=snapshot_file)
+
+        # Verificación o Aserción
+        assert same_newcomer is newcomer
+        rejected = reloaded.get_ride(ride_id).participants[0]
+        assert (rejected.participant.alias, rejected.status) == ("mrodriguez", "rejected")
+        assert reloaded.get_user("mrodriguez").participation_stats["rejected"] == 1
+        assert reloaded.get_ride(new_ride.id).final_address == "Barranco"
+        assert new_ride.id in [ride.id for ride in reloaded.get_user("driver0").rides]
+        assert reloaded.verify_participation_stats() == {}
+
+    def test_compact_models_keep_info_output(self):
+        """Caso de éxito: los modelos con __slots__ guardan el estado como código y mantienen el JSON"""
+        # Inicialización
+        self.ride.add_participant(self.passenger1, "Av Aramburú 245, Surquillo")
+        self.ride.accept_participant(self.passenger1)
+        participation = self.ride.participants[0]
+        loaded_status = json.loads('"confirmed"')
+
+        # Ejecución
+        info = self.ride.get_ride_info()
+        restored = RideParticipation.restore(self.passenger2, "Miraflores", loaded_status, True)
+
+        # Verificación o Aserción
+        for obj in (self.driver, self.ride, participation):
+            assert not hasattr(obj, "__dict__")
+        assert isinstance(participation._status_code, int)
+        assert restored.status is participation.status  # Todas comparten el mismo string
+        assert info["status"] == "ready"
+        assert info["participants"][0]["status"] == "confirmed"
+        assert info["participants"][0]["confirmation"] is True
+        with pytest.raises(ValueError):
+            participation.status = "unknown"
+        assert self.passenger1.participation_stats["total"] == 1
+
+    def test_endpoints_behave_the_same_on_sqlite_backend(self, tmp_path):
+        """Caso de éxito: los endpoints responden igual con el backend JSON y con SQLite, y SQLite persiste"""
+        # Inicialización
+        json_handler = self._seeded_handler(tmp_path)
+        db_file = str(tmp_path / "data.db")
+        sqlite_store.write_from_handler(json_handler, db_file)
+        ride_id = json_handler.rides[2].id
+        driver = json_handler.rides[2].driver.alias
+        sqlite_handler = SqliteDataHandler(filename=db_file, cache_size=2)
+        requests = [
+            ('post', '/usuarios', {"alias": "mrodriguez", "name": "Maria Rodriguez"}),
+            ('post', f'/usuarios/{driver}/rides/{ride_id}/requestToJoin/mrodriguez', {"destination": "Miraflores"}),
+            ('post', f'/usuarios/{driver}/rides/{ride_id}/accept/mrodriguez', None),
+            ('post', f'/usuarios/{driver}/rides/{ride_id}/start', None),
+            ('get', f'/usuarios/{driver}/rides/{ride_id}', None),
+            ('get', '/usuarios/lgomez', None),
+            ('get', '/rides/active', None),
+        ]
+
+        # Ejecución
+        responses = {}
+        for label, handler in (("json", json_handler), ("sqlite", sqlite_handler)):
+            with patch('controller.data_handler', handler):
+                responses[label] = [(response.status_code, json.loads(response.data)) for response in
+                                    (getattr(self.client, method)(url, json=body) for method, url, body in requests)]
+        sqlite_handler.close()
+        reopened = SqliteDataHandler(filename=db_file)
+
+        # Verificación o Aserción
+        assert responses["sqlite"] == responses["json"]
+        assert [status for status, _ in responses["sqlite"]] == [201, 200, 200, 200, 200, 200, 200]
+        participation = reopened.get_ride(ride_id).participants[0]
+        assert (participation.participant.alias, participation.status) == ("mrodriguez", "inprogress")
+        assert reopened.get_user("mrodriguez").participation_stats["total"] == 1
+        assert [ride.id for ride in reopened.get_active_rides()] == [ride.id for ride in json_handler.get_active_rides()]
+        assert reopened.verify_participation_stats() == {}
+        reopened.close()
+
+    def test_sqlite_commit_failure_leaves_memory_as_in_database(self, tmp_path):
+        """Caso de error: si la base no confirma un cambio se responde 503 y la memoria queda igual a la base"""
+        # Inicialización
+        db_file = str(tmp_path / "data.db")
+        seeded = self._seeded_handler(tmp_path)
+        sqlite_store.write_from_handler(seeded, db_file)
+        handler = SqliteDataHandler(filename=db_file)
+        waiting, started = handler.get_ride(seeded.rides[2].id), handler.get_ride(seeded.rides[1].id)
+        handler.add_user("mrios", "Maria Rios")
+        handler.join_ride(waiting, handler.get_user("mrios"), "Lince")
+        handler.start_ride(started)
+        stats_before = dict(handler.get_user("lgomez").participation_stats)
+        db = handler._db
+
+        def execute(sql, *args):
+            if sql == "COMMIT":
+                raise sqlite3.OperationalError("database is locked")
+            return db.execute(sql, *args)
+
+        with patch('controller.data_handler', handler):
+            # Ejecución
+            with patch.object(handler, '_db', Mock(wraps=db, execute=execute)):
+                failed_accept = self.client.post(f"/usuarios/{waiting.driver.alias}/rides/{waiting.id}/accept/mrios")
+                failed_end = self.client.post(f"/usuarios/{started.driver.alias}/rides/{started.id}/end")
+            in_memory = [handler.get_ride(ride.id).get_ride_info() for ride in (started, waiting)]
+            active = [ride.id for ride in handler.get_active_rides()]
+            retried = self.client.post(f"/usuarios/{waiting.driver.alias}/rides/{waiting.id}/accept/mrios")
+        handler.close()
+        reopened = SqliteDataHandler(filename=db_file)
+
+        # Verificación o Aserción
+        assert failed_accept.status_code == 503 and failed_end.status_code == 503
+        assert "database is locked" in json.loads(failed_end.data)["error"]
+        assert in_memory[0]["status"] == "inprogress"
+        assert in_memory[0]["participants"][0]["participant"]["previousRidesTotal"] == stats_before["total"]
+        assert in_memory[1]["participants"][0]["status"] == "waiting"
+        assert started.id in active
+        assert handler.get_user("lgomez").participation_stats == stats_before
+        assert retried.status_code == 200
+        assert reopened.get_ride(waiting.id).participants[0].status == "confirmed"
+        assert reopened.get_ride(started.id).get_ride_info() == in_memory[0]
+        reopened.close()
+    def test_response_cache_etag_and_precise_invalidation(self, tmp_path):
+        """Caso de éxito: los GET se sirven del caché con ETag/304 y una mutación invalida solo lo afectado"""
+        # Inicialización
+        handler = self._seeded_handler(tmp_path)
+        ride_with_rider, joined_ride, unrelated_ride = handler.rides[1], handler.rides[2], handler.rides[3]
+        urls = {
+            "ride_with_rider": f'/usuarios/driver2/rides/{ride_with_rider.id}',
+            "rider_driver": '/usuarios/driver2',
+            "joined_driver": '/usuarios/driver0/rides',
+            "unrelated": f'/usuarios/driver1/rides/{unrelated_ride.id}',
+        }
+
+        with patch('controller.data_handler', handler):
+            first = {name: self.client.get(url) for name, url in urls.items()}
+            second = {name: self.client.get(url) for name, url in urls.items()}
+            not_modified = self.client.get(urls["unrelated"], headers={'If-None-Match': first["unrelated"].headers['ETag']})
+
+            # Ejecución
+            handler.join_ride(joined_ride, handler.get_user("lgomez"), "Surquillo")
+            after = {name: self.client.get(url) for name, url in urls.items()}
+            metrics = json.loads(self.client.get('/metrics/cache').data)
+
+        # Verificación o Aserción
+        assert all(response.headers['X-Cache'] == 'MISS' for response in first.values())
+        assert all(response.headers['X-Cache'] == 'HIT' for response in second.values())
+        assert all(second[name].data == first[name].data for name in urls)
+        assert not_modified.status_code == 304 and not_modified.data == b''
+        assert {name: response.headers['X-Cache'] for name, response in after.items()} == {
+            "ride_with_rider": "MISS", "rider_driver": "MISS", "joined_driver": "MISS", "unrelated": "HIT"}
+        participant = json.loads(after["ride_with_rider"].data)["ride"]["participants"][0]["participant"]
+        assert participant["previousRidesTotal"] == 2
+        assert json.loads(after["joined_driver"].data)[0]["participants"][0]["participant"]["alias"] == "lgomez"
+        assert after["unrelated"].headers['ETag'] == first["unrelated"].headers['ETag']
+        assert (metrics["hits"], metrics["misses"], metrics["notModified"]) == (6, 7, 1)
+        assert metrics["hitRate"] == pytest.approx(6 / 13)
+
+    def test_batch_endpoint_is_atomic_and_persisted_once(self, tmp_path):
+        """Caso de éxito: el lote se aplica completo o nada, se registra una vez y se reproduce desde el WAL"""
+        # Inicialización
+        filename = str(tmp_path / "data.json")
+        handler = DataHandler(filename=filename, wal=WriteAheadLog(str(tmp_path / "data.wal")))
+        driver = handler.add_user("jperez", "Juan Perez", "ABC123")
+        riders = [handler.add_user(f"rider{i}", f"Rider {i}") for i in range(3)]
+        ride = handler.add_ride("2025/07/15 22:00", "San Borja", 2, driver)
+        for rider in riders:
+            handler.join_ride(ride, rider, "Surquillo")
+        url = f'/usuarios/jperez/rides/{ride.id}/batch'
+        valid = [{"action": "accept", "participant_alias": "rider0"},
+                 {"action": "reject", "participant_alias": "rider1"},
+                 {"action": "accept", "participant_alias": "rider2"}]
+        seq_before = handler.wal.seq
+
+        with patch('controller.data_handler', handler):
+            # Ejecución
+            failed = self.client.post(url, json={"operations": valid + [{"action": "accept", "participant_alias": "rider1"}]})
+            state_after_failure = [(p.status, p.confirmation) for p in ride.participants]
+            stats_after_failure = riders[1].participation_stats["rejected"]
+            invalid = self.client.post(url, json={"operations": [{"action": "start", "participant_alias": "rider0"}]})
+            unknown = self.client.post(url, json={"operations": valid[:2] + [{"action": "accept",
+                                                                              "participant_alias": "nadie"}]})
+            applied = self.client.post(url, json={"operations": valid})
+        handler.close()
+        reloaded = DataHandler(filename=filename, wal=WriteAheadLog(str(tmp_path / "data.wal")))
+
+        # Verificación o Aserción
+        assert failed.status_code == 422
+        body = json.loads(failed.data)
+        assert body["failedIndex"] == 3
+        assert [result["status"] for result in body["results"]] == ["rolledBack"] * 3 + ["error"]
+        assert state_after_failure == [("waiting", None)] * 3
+        assert stats_after_failure == 0
+        assert invalid.status_code == 400
+        assert unknown.status_code == 422
+        assert [result["status"] for result in json.loads(unknown.data)["results"]] == ["notApplied"] * 2 + ["error"]
+        assert applied.status_code == 200
+        assert [r["participationStatus"] for r in json.loads(applied.data)["results"]] == ["confirmed", "rejected", "confirmed"]
+        assert handler.wal.seq == seq_before + 1  # Un solo evento para todo el lote
+        reloaded_ride = reloaded.get_ride(ride.id)
+        assert [p.status for p in reloaded_ride.participants] == ["confirmed", "rejected", "confirmed"]
+        assert reloaded.get_user("rider1").participation_stats["rejected"] == 1
+        reloaded.close()
+
+    def test_bulk_export_import_round_trip(self, tmp_path):
+        """Caso de éxito: exportar a NDJSON/CSV e importar en un data.json nuevo reproduce el estado"""
+        # Inicialización
+        source = self._seeded_handler(tmp_path)
+        files = {"users": str(tmp_path / "users.csv"), "rides": str(tmp_path / "rides.ndjson"),
+                 "participations": str(tmp_path / "participations.csv")}
+        log = io.StringIO()
+
+        # Ejecución
+        exported = export_files(source, stream=log, **files)
+        with open(files["participations"], "a") as f:
+            f.write(f"{source.rides[2].id},fantasma,Surquillo,waiting,,1\n")  # Participante inexistente
+        target = DataHandler(filename=str(tmp_path / "imported.json"))
+        summary = import_files(target, stream=log, **files)
+        reloaded = DataHandler(filename=str(tmp_path / "imported.json"))
+
+        # Verificación o Aserción
+        assert exported == {"users": 4, "rides": 6, "participations": 1}
+        assert summary == {"users": (4, 0), "rides": (6, 0), "participations": (1, 1)}
+        assert "participations.csv:3" in log.getvalue()
+        assert [ride.get_ride_info() for ride in reloaded.rides] == [ride.get_ride_info() for ride in source.rides]
+        assert reloaded.get_user("lgomez").participation_stats == source.get_user("lgomez").participation_stats
+        assert [ride.id for ride in reloaded.get_active_rides()] == [ride.id for ride in source.get_active_rides()]
+
+    def test_bulk_import_skips_incomplete_rows(self, tmp_path):
+        """Caso de error: filas con columnas faltantes se informan con su linea y el resto se importa"""
+        # Inicialización
+        files = {"users": str(tmp_path / "users.csv"), "rides": str(tmp_path / "rides.ndjson"),
+                 "participations": str(tmp_path / "participations.csv")}
+        with open(files["users"], "w") as f:
+            f.write("alias,name,carPlate\njperez,Juan Perez,ABC123\nsolo_alias\nlgomez,Luis Gomez,\n")
+        with open(files["rides"], "w") as f:
+            f.write('{"id":1,"rideDateAndTime":"2025/07/15 22:00","finalAddress":"San Borja","allowedSpaces":2,'
+                    '"driver":"jperez","status":"ready"}\n{"alias":"sin_nombre"}\n')
+        with open(files["participations"], "w") as f:
+            f.write("rideId,participant,destination,status,confirmation,occupiedSpaces\n"
+                    "1,lgomez,Surquillo,waiting\n1,lgomez,Surquillo,waiting,,1\n")
+        log = io.StringIO()
+        handler = DataHandler(filename=str(tmp_path / "imported.json"))
+
+        # Ejecución
+        summary = import_files(handler, stream=log, **files)
+        reloaded = DataHandler(filename=str(tmp_path / "imported.json"))
+
+        # Verificación o Aserción
+        assert summary == {"users": (2, 1), "rides": (1, 1), "participations": (1, 1)}
+        assert "users.csv:3" in log.getvalue()
+        assert "rides.ndjson:2" in log.getvalue()
+        assert "participations.csv:2" in log.getvalue()
+        assert [user.alias for user in reloaded.users] == ["jperez", "lgomez"]
+        assert [p.participant.alias for p in reloaded.get_ride(1).participants] == ["lgomez"]
+        reloaded.close()
+
+    def test_bulk_import_builds_time_index_once(self, tmp_path):
+        """Caso de éxito: tras importar rides en desorden los indices por hora quedan ordenados y vuelven a mantenerse"""
+        # Inicialización
+        source = self._seeded_handler(tmp_path)
+        driver = source.get_user("driver0")
+        for day in random.Random(0).sample(range(7, 28), 10):
+            source.add_ride(f"2025/07/{day:02d} {day % 24:02d}:30", f"Destino {day}", 2, driver)
+        files = {"users": str(tmp_path / "users.csv"), "rides": str(tmp_path / "rides.ndjson")}
+        export_files(source, stream=io.StringIO(), **files)
+        target = DataHandler(filename=str(tmp_path / "imported.json"))
+
+        # Ejecución
+        import_files(target, stream=io.StringIO(), **files)
+        imported, _ = target.find_rides_by_time()
+        imported_active, _ = target.find_rides_by_time(active_only=True)
+        late = target.add_ride("2025/07/06 09:00", "Despues", 1, target.get_user("driver1"))
+        after_add, _ = target.find_rides_by_time(active_only=True)
+
+        # Verificación o Aserción
+        expected = sorted(source.rides, key=lambda ride: (ride.departure_ts, ride.id))
+        assert [ride.id for ride in imported] == [ride.id for ride in expected]
+        assert [ride.id for ride in imported_active] == [ride.id for ride in expected if ride.status != "done"]
+        assert [ride.id for ride in after_add].index(late.id) == 5
+
+    def test_rides_by_time_range_and_next_with_free_spaces(self, tmp_path):
+        """Caso de éxito: GET /rides filtra por rango de salida en orden y sigue los cambios de estado"""
+        # Inicialización
+        handler = self._seeded_handler(tmp_path)
+        rides = handler.rides
+        early = handler.add_ride("2025/07/03 06:00", "Temprano", 2, handler.get_user("driver0"))
+        handler.add_ride("mañana temprano", "Sin hora", 2, handler.get_user("driver0"))
+
+        with patch('controller.data_handler', handler):
+            # Ejecución
+            in_range = self.client.get('/rides?from=2025/07/02 00:00&to=2025/07/04 23:59&fields=id')
+            first_page = self.client.get('/rides?hasFreeSpaces=true&limit=2&fields=id')
+            second_page = self.client.get(f"/rides?hasFreeSpaces=true&limit=2&fields=id&cursor={first_page.headers['X-Next-Cursor']}")
+            handler.start_ride(rides[3])
+            handler.end_ride(rides[3])
+            active = self.client.get('/rides?active=true&fields=id')
+            invalid = self.client.get('/rides?cursor=abc')
+        snapshot_file = str(tmp_path / "data.snap")
+        snapshot.write_from_handler(handler, snapshot_file)
+        lazy = LazyDataHandler(filename=snapshot_file)
+        db_file = str(tmp_path / "data.db")
+        sqlite_store.write_from_handler(handler, db_file)
+        sqlite_handler = SqliteDataHandler(filename=db_file)
+        # Before 1970 departure_ts is negative, and so is the cursor
+        old = [handler.add_ride(f"1965/01/0{day} 10:00", "Antiguo", 1, handler.get_user("driver1")) for day in (1, 2)]
+        with patch('controller.data_handler', handler):
+            old_first = self.client.get('/rides?from=1960/01/01 00:00&to=1965/12/31 00:00&limit=1&fields=id')
+            old_second = self.client.get('/rides?from=1960/01/01 00:00&to=1965/12/31 00:00&limit=1&fields=id'
+                                         f"&cursor={old_first.headers['X-Next-Cursor']}")
+
+        # Verificación o Aserción
+        ids = lambda response: [ride["id"] for ride in json.loads(response.data)]
+        assert ids(in_range) == [rides[1].id, early.id, rides[2].id, rides[3].id]
+        assert ids(first_page) == [early.id, rides[2].id]
+        assert ids(second_page) == [rides[3].id, rides[4].id]
+        expected_active = [rides[1].id, early.id, rides[2].id, rides[4].id, rides[5].id]
+        assert ids(active) == expected_active
+        assert invalid.status_code == 400
+        assert old_first.headers['X-Next-Cursor'].startswith('-')
+        assert ids(old_first) == [old[0].id] and ids(old_second) == [old[1].id]
+        for other in (lazy, sqlite_handler):
+            found, _ = other.find_rides_by_time(active_only=True)
+            assert [ride.id for ride in found] == expected_active
+            other.close()
+
+    def test_search_rides_ranks_address_over_destination_and_follows_changes(self, tmp_path):
+        """Caso de éxito: GET /rides/search tolera tildes y errores, prioriza finalAddress y sigue los cambios"""
+        # Inicialización
+        handler = self._seeded_handler(tmp_path)
+        driver = handler.get_user("driver0")
+        by_address = handler.add_ride("2025/07/10 08:00", "Av. Surquillo 245", 2, driver)
+        other = handler.add_ride("2025/07/11 08:00", "Miraflores", 2, driver)
+        rider = handler.add_user("mrios", "Maria Rios")
+
+        with patch('controller.data_handler', handler):
+            # Ejecución
+            first = self.client.get('/rides/search?q=surqillo&fields=id')
+            handler.join_ride(other, rider, "Surquíllo")
+            after_join = self.client.get('/rides/search?q=SURQUILLO&fields=id')
+            handler.start_ride(by_address)
+            handler.end_ride(by_address)
+            after_end = self.client.get('/rides/search?q=surquillo&limit=1&fields=id')
+            missing = self.client.get('/rides/search?q=')
+
+        # Verificación o Aserción
+        results = lambda response: [(item["ride"]["id"], item["score"]) for item in json.loads(response.data)]
+        assert [ride_id for ride_id, _ in results(first)] == [by_address.id, handler.rides[1].id]
+        assert results(first)[0][1] > results(first)[1][1]
+        assert [ride_id for ride_id, _ in results(after_join)] == [by_address.id, handler.rides[1].id, other.id]
+        assert [ride_id for ride_id, _ in results(after_end)] == [handler.rides[1].id]
+        assert missing.status_code == 400
+
+    def test_metrics_endpoint_and_request_profiling(self, tmp_path):
+        """Caso de éxito: /metrics expone latencias, spans y bytes escritos; X-Profile deja un perfil consultable"""
+        # Inicialización
+        handler = metrics.instrument_handler(self._seeded_handler(tmp_path))
+        handler.add_user("mrios", "Maria Rios")
+
+        with patch('controller.data_handler', handler), patch.dict(app.config, {'PROFILING_ENABLED': True}):
+            # Ejecución
+            self.client.get('/usuarios/lgomez')
+            self.client.get(f"/usuarios/{handler.rides[1].driver.alias}/rides/{handler.rides[1].id}")
+            profiled = self.client.get('/rides/active', headers={'X-Profile': '1'})
+            not_profiled = self.client.get('/rides/active')
+            profile = self.client.get(f"/metrics/profiles/{profiled.headers['X-Profile-Id']}")
+            missing_profile = self.client.get('/metrics/profiles/999999')
+            response = self.client.get('/metrics')
+
+        # Verificación o Aserción
+        text = response.data.decode()
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        assert '# TYPE rides_request_duration_seconds histogram' in text
+        assert 'rides_request_duration_seconds_count{endpoint="/usuarios/<alias>",method="GET"}' in text
+        assert 'rides_responses_total{endpoint="/rides/active",method="GET",status="200"}' in text
+        assert 'rides_span_duration_seconds_count{span="get_user"}' in text
+        assert 'rides_span_duration_seconds_bucket{span="save_data",le="+Inf"}' in text
+        assert 'rides_span_duration_seconds_count{span="get_ride_info"}' in text
+        assert 'rides_span_duration_seconds_count{span="get_participant_info"}' in text
+        written = next(line for line in text.splitlines() if line.startswith('rides_persisted_bytes_total{target="snapshot"}'))
+        assert int(written.split()[-1]) > 0
+        assert 'X-Profile-Id' not in not_profiled.headers
+        assert profile.status_code == 200
+        assert float(profile.headers['X-Profile-Duration-Ms']) > 0
+        assert missing_profile.status_code == 404
+
+    def test_asgi_mode_serves_same_json_and_persists_before_responding(self, tmp_path):
+        """Caso de éxito: el modo async responde igual que Flask y cada POST responde con el cambio ya en disco"""
+        # Inicialización
+        filename = str(tmp_path / "data.json")
+        handler = DataHandler(filename=filename, write_behind=True, flush_interval_ms=0)
+        driver = handler.add_user("driver0", "Driver 0", "PLT0")
+        riders = [handler.add_user(f"rider{i}", f"Rider {i}") for i in range(3)]
+        ride = handler.add_ride("2025/07/01 08:00", "Av. Arequipa 123, Lince", 3, driver)
+        application = AsgiApp(app, lambda: handler)
+
+        async def call(method, path, body=None):
+            messages = []
+
+            async def receive():
+                return {"type": "http.request", "body": json.dumps(body).encode() if body else b"", "more_body": False}
+
+            async def send(message):
+                messages.append(message)
+
+            await application({"type": "http", "method": method, "path": path, "query_string": b"",
+                               "headers": [(b"content-type", b"application/json")]}, receive, send)
+            return messages[0]["status"], b"".join(message.get("body", b"") for message in messages[1:])
+
+        async def join(rider):
+            status, _ = await call('POST', f'/usuarios/driver0/rides/{ride.id}/requestToJoin/{rider.alias}',
+                                   {"destination": "Miraflores"})
+            with open(filename) as f:
+                persisted = {record["participant"] for record in json.load(f)["participations"]}
+            return status, rider.alias in persisted
+
+        async def scenario():
+            joins = await asyncio.gather(*(join(rider) for rider in riders))
+            return joins, await call('GET', f'/usuarios/driver0/rides/{ride.id}')
+
+        with patch('controller.data_handler', handler):
+            # Ejecución
+            joins, (status, body) = asyncio.run(scenario())
+            expected = self.client.get(f'/usuarios/driver0/rides/{ride.id}')
+
+        # Verificación o Aserción
+        assert joins == [(200, True)] * 3
+        assert status == 200
+        assert json.loads(body) == json.loads(expected.data)
+        assert len(application.ride_locks) == 0
+        handler.close()
+
+    def test_asgi_mode_syncs_wal_off_the_event_loop(self, tmp_path):
+        """Caso de éxito: con log el fsync que espera cada POST se hace fuera del hilo del event loop"""
+        # Inicialización
+        wal = WriteAheadLog(str(tmp_path / "data.wal"), fsync="batch", fsync_interval=60)
+        handler = DataHandler(filename=str(tmp_path / "data.json"), wal=wal)
+        application = AsgiApp(app, lambda: handler)
+        real_fsync = os.fsync
+        fsync_threads = []
+
+        def fsync(fd):
+            fsync_threads.append(threading.current_thread())
+            real_fsync(fd)
+
+        async def create_user():
+            messages = []
+
+            async def receive():
+                body = json.dumps({"alias": "rider0", "name": "Rider 0"}).encode()
+                return {"type": "http.request", "body": body, "more_body": False}
+
+            async def send(message):
+                messages.append(message)
+
+            await application({"type": "http", "method": "POST", "path": "/usuarios", "query_string": b"",
+                               "headers": [(b"content-type", b"application/json")]}, receive, send)
+            return messages[0]["status"], wal._unsynced
+
+        with patch('controller.data_handler', handler), patch('storage.wal.os.fsync', fsync):
+            # Ejecución
+            status, unsynced = asyncio.run(create_user())
+
+        # Verificación o Aserción
+        assert status == 201
+        assert unsynced == 0
+        assert fsync_threads and threading.main_thread() not in fsync_threads
+        handler.close()
+
+    def test_user_participations_index_survives_reload(self, tmp_path):
+        """Caso de éxito: GET /usuarios/<alias>/participations lista los rides a los que se unió y filtra por estado"""
+        # Inicialización
+        handler = self._seeded_handler(tmp_path)
+        rider = handler.get_user("lgomez")
+        rides = handler.rides
+        handler.join_ride(rides[2], rider, "Barranco")
+        handler.join_ride(rides[3], rider, "Lince")
+        handler.reject_participant(rides[3], rider)
+        snapshot_file = str(tmp_path / "data.snap")
+        snapshot.write_from_handler(handler, snapshot_file)
+
+        with patch('controller.data_handler', handler):
+            # Ejecución
+            todas = self.client.get('/usuarios/lgomez/participations')
+            pendientes = self.client.get('/usuarios/lgomez/participations?status=waiting,confirmed&fields=id')
+            pagina = self.client.get('/usuarios/lgomez/participations?limit=1&fields=id')
+            siguiente = self.client.get(
+                f"/usuarios/lgomez/participations?limit=1&fields=id&cursor={pagina.headers['X-Next-Cursor']}")
+            invalido = self.client.get('/usuarios/lgomez/participations?status=volando')
+            conductor = self.client.get('/usuarios/driver0/participations')
+        handler.close()
+        reloaded = DataHandler(filename=str(tmp_path / "data.json"))
+        lazy = LazyDataHandler(filename=snapshot_file)
+
+        # Verificación o Aserción
+        assert todas.status_code == 200
+        assert [(item["ride"]["id"], item["destination"], item["status"]) for item in json.loads(todas.data)] == [
+            (rides[1].id, "Surquillo", "confirmed"), (rides[2].id, "Barranco", "waiting"),
+            (rides[3].id, "Lince", "rejected")]
+        assert "participants" not in json.loads(todas.data)[0]["ride"]
+        assert [item["ride"] for item in json.loads(pendientes.data)] == [{"id": rides[1].id}, {"id": rides[2].id}]
+        assert [item["ride"]["id"] for item in json.loads(siguiente.data)] == [rides[2].id]
+        assert invalido.status_code == 400
+        assert json.loads(conductor.data) == []
+        assert reloaded.get_user("lgomez").joined_ride_ids == [rides[1].id, rides[2].id, rides[3].id]
+        assert lazy.get_user("lgomez").joined_ride_ids == [rides[1].id, rides[2].id, rides[3].id]
+        reloaded.close()
+        lazy.close()
+
+    def test_archive_moves_old_done_rides_to_disk_and_reads_them_back(self, tmp_path):
+        """Caso de éxito: los rides terminados antiguos salen de memoria, conservan el historial y se leen del archivo"""
+        # Inicialización
+        handler = self._seeded_handler(tmp_path)
+        rider = handler.add_user("mrodriguez", "Maria Rodriguez")
+        last = handler.rides[5]
+        handler.join_ride(last, rider, "Barranco")
+        handler.accept_participant(last, rider)
+        handler.start_ride(last)
+        handler.end_ride(last)
+        expected_info = last.get_ride_info()
+        expected_stats = dict(rider.participation_stats)
+        handler.close()
+        archive_dir = str(tmp_path / "archive")
+        handler = DataHandler(filename=str(tmp_path / "data.json"), archive=RideArchive(archive_dir))
+
+        # Ejecución
+        archived = handler.archive_done_rides(now=Ride.timestamp(datetime(2025, 8, 10)))
+        hot_ids = [ride.id for ride in handler.rides]
+        driver_ids = [ride.id for ride in handler.get_user("driver0").rides]
+        read_back = handler.get_ride(last.id)
+        handler.close()
+        reloaded = DataHandler(filename=str(tmp_path / "data.json"), archive=RideArchive(archive_dir))
+        with patch('controller.data_handler', reloaded):
+            participations = self.client.get('/usuarios/mrodriguez/participations?fields=id,status')
+
+        # Verificación o Aserción
+        assert archived == 2
+        assert last.id not in hot_ids and len(hot_ids) == 4
+        assert last.id not in driver_ids
+        assert read_back.get_ride_info() == expected_info
+        assert read_back is handler.get_ride(last.id)
+        assert [ride.id for ride in reloaded.rides] == hot_ids
+        assert reloaded.get_user("mrodriguez").participation_stats == expected_stats
+        assert reloaded.get_ride(last.id).get_ride_info() == expected_info
+        assert json.loads(participations.data) == [{"ride": {"id": last.id, "status": "done"}, "destination": "Barranco",
+                                                    "occupiedSpaces": 1, "confirmation": True, "status": "notmarked"}]
+        assert reloaded.verify_participation_stats() == {}
+        assert reloaded.persistence_stats()["archivedRides"] == 2
+        reloaded.close()
+
+    def test_serialization_fragments_are_reused_until_the_entity_changes(self, tmp_path):
+        """Caso de éxito: save_data y las respuestas reutilizan el JSON de lo que no cambió y nunca quedan viejos"""
+        # Inicialización
+        handler = self._seeded_handler(tmp_path)
+        rides = handler.rides
+        rider = handler.get_user("lgomez")
+        handler.save_data()
+        before = {ride.id: handler._encoded_ride(ride) for ride in rides}
+        info_before = rides[3].get_ride_info_json()
+
+        # Ejecución
+        handler.join_ride(rides[2], rider, "Barranco")
+        handler.reject_participant(rides[2], rider)
+        after = {ride.id: handler._encoded_ride(ride) for ride in rides}
+        with patch('controller.data_handler', handler):
+            response = self.client.get(f'/usuarios/driver1/rides/{rides[1].id}')
+            usuario = self.client.get('/usuarios/driver1')
+
+        # Verificación o Aserción
+        assert after[rides[3].id] is before[rides[3].id]
+        assert after[rides[2].id] is not before[rides[2].id]
+        assert rides[3].get_ride_info_json() is info_before
+        # lgomez's counters changed in another ride, and they show up in rides[1]
+        assert json.loads(response.data) == {"ride": rides[1].get_ride_info()}
+        assert json.loads(response.data)["ride"]["participants"][0]["participant"]["previousRidesRejected"] == 1
+        assert response.data == (json.dumps({"ride": rides[1].get_ride_info()}, separators=(',', ':'),
+                                            sort_keys=True) + "\n").encode()
+        assert json.loads(usuario.data) == handler.get_user("driver1").get_user_info()
+        with open(tmp_path / "data.json") as f:
+            assert f.read() == json.dumps(schema.snapshot(handler.users, handler.rides))
+        handler.close()
+
+    def test_shard_router_routes_by_owner_and_merges_cross_shard_reads(self, tmp_path):
+        """Caso de éxito: el router crea cada ride en el shard de su conductor, une listados y reparte contadores"""
+        # Inicialización
+        shards = [ShardDataHandler(shard, 2, directory=str(tmp_path)) for shard in range(2)]
+
+        class FlaskShardClient:
+            def __init__(self, handler):
+                self.handler = handler
+                self.client = app.test_client()
+
+            async def request(self, method, target, headers=(), body=b""):
+                with patch('controller.data_handler', self.handler):
+                    response = self.client.open(target, method=method, headers=list(headers), data=body)
+                return response.status_code, [(name.lower(), value) for name, value in response.headers], response.data
+
+        router = ShardRouter([FlaskShardClient(handler) for handler in shards])
+
+        async def call(method, target, body=None):
+            path, _, query = target.partition('?')
+            messages = []
+
+            async def receive():
+                return {"type": "http.request", "body": json.dumps(body).encode() if body else b"", "more_body": False}
+
+            async def send(message):
+                messages.append(message)
+
+            await router({"type": "http", "method": method, "path": path, "query_string": query.encode(),
+                          "headers": [(b"content-type", b"application/json")]}, receive, send)
+            headers = {name.decode(): value.decode() for name, value in messages[0]["headers"]}
+            body = b"".join(message.get("body", b"") for message in messages[1:])
+            return messages[0]["status"], headers, json.loads(body)
+
+        async def scenario():
+            for alias, plate in (("ana", "PLT0"), ("carla", "PLT1"), ("lgomez", None), ("bruno", None)):
+                await call('POST', '/usuarios', {"alias": alias, "name": alias.title(), "carPlate": plate})
+            _, _, ride_ana = await call('POST', '/usuarios/ana/rides', {
+                "rideDateAndTime": "2025/07/02 08:00", "finalAddress": "Av. Arequipa 123, Lince", "allowedSpaces": 2})
+            _, _, ride_carla = await call('POST', '/usuarios/carla/rides', {
+                "rideDateAndTime": "2025/07/01 08:00", "finalAddress": "Av. Larco 45, Miraflores", "allowedSpaces": 2})
+            await call('POST', f"/usuarios/ana/rides/{ride_ana['id']}/requestToJoin/lgomez", {"destination": "Lince"})
+            await call('POST', f"/usuarios/ana/rides/{ride_ana['id']}/accept/lgomez")
+            await call('POST', f"/usuarios/carla/rides/{ride_carla['id']}/requestToJoin/lgomez",
+                       {"destination": "Surco"})
+            return ride_ana, ride_carla, {
+                "activos": await call('GET', '/rides/active?fields=finalAddress'),
+                "pagina": await call('GET', '/rides/active?limit=1'),
+                "por_hora": await call('GET', '/rides?fields=finalAddress'),
+                "participaciones": await call('GET', '/usuarios/lgomez/participations?fields=id'),
+                "usuario": await call('GET', '/usuarios/ana'),
+            }
+
+        # Ejecución
+        ride_ana, ride_carla, responses = asyncio.run(scenario())
+        stats = [dict(handler.get_user("lgomez").participation_stats) for handler in shards]
+        shards[1].close()
+        restarted = ShardDataHandler(1, 2, directory=str(tmp_path))
+        restarted_router = ShardRouter([FlaskShardClient(shards[0]), FlaskShardClient(restarted)])
+        asyncio.run(restarted_router.sync_stats())
+
+        # Verificación o Aserción
+        assert [len(handler.users) for handler in shards] == [4, 4]
+        assert shard_for_alias("ana", 2) == 0 and ride_ana["id"] == 2
+        assert shard_for_alias("carla", 2) == 1 and ride_carla["id"] == 1
+        assert [ride.id for ride in shards[0].rides] == [2]
+        assert responses["activos"][0] == 200
+        assert responses["activos"][2] == [{"finalAddress": "Av. Larco 45, Miraflores"},
+                                           {"finalAddress": "Av. Arequipa 123, Lince"}]
+        assert [ride["id"] for ride in responses["pagina"][2]] == [1]
+        assert responses["pagina"][1]["x-next-cursor"] == "1"
+        assert [ride["finalAddress"] for ride in responses["por_hora"][2]] == [
+            "Av. Larco 45, Miraflores", "Av. Arequipa 123, Lince"]
+        assert [item["ride"] for item in responses["participaciones"][2]] == [{"id": 1}, {"id": 2}]
+        assert [ride["id"] for ride in responses["usuario"][2]["rides"]] == [2]
+        assert "x-shard-stats" not in responses["activos"][1]
+        assert stats[0] == stats[1] and stats[0]["total"] == 2
+        assert dict(restarted.get_user("lgomez").participation_stats) == stats[0]
+        shards[0].close()
+        restarted.close()
+
+    def test_match_rides_ranks_open_rides_and_follows_changes(self, tmp_path):
+        """Caso de éxito: /rides/match ordena los rides abiertos de la ventana y sigue los cambios del ride"""
+        # Inicialización
+        handler = DataHandler(filename=str(tmp_path / "data.json"))
+        ana, beto, carla = (handler.add_user(alias, alias.title(), f"PLT-{alias}")
+                            for alias in ("ana", "beto", "carla"))
+        rider = handler.add_user("lgomez", "Luis Gomez")
+        other = handler.add_user("mrios", "Maria Rios")
+        larco = handler.add_ride("2025/07/01 08:00", "Av. Larco 45, Miraflores", 2, ana)
+        lince = handler.add_ride("2025/07/01 08:30", "Av. Arequipa 123, Lince", 1, beto)
+        schell = handler.add_ride("2025/07/01 07:00", "Calle Schell 300, Miraflores", 1, carla)
+        full = handler.add_ride("2025/07/01 09:00", "Av. Larco 800, Miraflores", 1, beto)
+        handler.add_ride("2025/07/02 08:00", "Av. Larco 45, Miraflores", 2, ana)
+        handler.join_ride(full, other, "Miraflores")
+        handler.accept_participant(full, other)
+        window = (datetime(2025, 7, 1, 7), datetime(2025, 7, 1, 9))
+
+        # Ejecución
+        first = handler.match_rides("Larco, Miraflores", *window)
+        handler.join_ride(larco, rider, "Miraflores")
+        for_rider = handler.match_rides("Larco, Miraflores", *window, rider=rider)
+        handler.accept_participant(larco, rider)
+        after_accept = handler.match_rides("Larco, Miraflores", *window)
+        handler.start_ride(larco)
+        after_start = handler.match_rides("Larco, Miraflores", *window)
+        with patch('controller.data_handler', handler):
+            response = self.client.get('/rides/match?destination=Larco&from=2025/07/01 07:00&to=2025/07/01 09:00'
+                                       '&at=2025/07/01 07:00&fields=id,finalAddress&limit=1')
+            missing = self.client.get('/rides/match?from=2025/07/01 07:00&to=2025/07/01 09:00')
+            too_wide = self.client.get('/rides/match?destination=Larco&from=2025/07/01 07:00&to=2025/07/03 07:00')
+            unknown = self.client.get('/rides/match?destination=Larco&from=2025/07/01 07:00&to=2025/07/01 09:00'
+                                      '&rider=nadie')
+
+        # Verificación o Aserción
+        assert [ride.id for ride, _ in first] == [larco.id, lince.id, schell.id]
+        assert first[0][1] == pytest.approx({"score": 0.85, "timeScore": 1.0, "addressScore": 1.0,
+                                        "driverReliability": 0.25})
+        assert [ride.id for ride, _ in for_rider] == [lince.id, schell.id]
+        assert after_accept[0][1]["driverReliability"] > first[0][1]["driverReliability"]
+        assert [ride.id for ride, _ in after_start] == [lince.id, schell.id]
+        assert response.status_code == 200
+        assert json.loads(response.data) == [{
+            "addressScore": 0.0, "driverReliability": 0.25, "ride": {"finalAddress": "Calle Schell 300, Miraflores",
+                                                                     "id": schell.id},
+            "score": 0.45, "timeScore": 1.0}]
+        assert missing.status_code == 400 and too_wide.status_code == 400
+        assert unknown.status_code == 404